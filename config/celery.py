@@ -2,7 +2,7 @@ import os
 from celery import Celery
 from celery.schedules import crontab
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'docker_monitor.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 app = Celery('docker_monitor')
 app.config_from_object('django.conf:settings', namespace='CELERY')
@@ -16,17 +16,45 @@ app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # Las acciones (p. ej. rebuild) pueden tardar minutos: cola y worker propios
+    # para no retrasar el monitoreo (celery -A config worker -Q actions)
+    task_routes={
+        'stations.tasks.execute_container_action': {'queue': 'actions'},
+        'stations.tasks.execute_bulk_action': {'queue': 'actions'},
+    },
 )
 
 # Programación de tareas
 app.conf.beat_schedule = {
-    'monitor-stations': {
-        'task': 'stations.tasks.monitor_stations',
-        'schedule': 60.0,  # cada 60 segundos
+    # Cada estación tiene su propio próximo vencimiento; el tick solo despacha las
+    # vencidas, en subtareas por shard enviadas a las colas ``monitor.<shard>``
+    # (MONITOR_SHARDS). Para escalar basta con arrancar más workers y repartir
+    # esas colas entre ellos
+    'dispatch-station-checks': {
+        'task': 'stations.tasks.dispatch_station_checks',
+        'schedule': 10.0,  # cada 10 segundos
+        'options': {'expires': 9},  # descartar ticks acumulados
     },
     'update-container-stats': {
         'task': 'stations.tasks.update_container_stats',
         'schedule': 30.0,  # cada 30 segundos
+        'options': {'expires': 25},
+    },
+    'rollup-container-metrics': {
+        'task': 'stations.tasks.rollup_container_metrics',
+        'schedule': 60.0,
+    },
+    'prune-container-metrics': {
+        'task': 'stations.tasks.prune_container_metrics',
+        'schedule': crontab(minute=5),  # cada hora
+    },
+    'fail-stale-container-actions': {
+        'task': 'stations.tasks.fail_stale_container_actions',
+        'schedule': 300.0,  # cada 5 minutos
+    },
+    'maintain-activity-logs': {
+        'task': 'stations.tasks.maintain_activity_logs',
+        'schedule': crontab(hour=3, minute=30),  # diario
     },
 }
 
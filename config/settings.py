@@ -110,6 +110,108 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    }
+}
+
+# Pool de conexiones SSH hacia las estaciones
+SSH_CONNECT_TIMEOUT = 10  # segundos
+SSH_KEEPALIVE_INTERVAL = 30  # segundos
+SSH_POOL_MAX_CONNECTIONS = 64  # por proceso
+SSH_POOL_IDLE_TIMEOUT = 300  # segundos sin uso antes de cerrar
+SSH_ASYNC_MAX_WORKERS = 32  # hilos para SSH desde código asíncrono (Channels)
+SSH_ASYNC_TIMEOUT = 15  # plazo por llamada asíncrona, en segundos
+SSH_COMMAND_TIMEOUT = 60  # plazo total por comando remoto, en segundos
+SSH_MAX_OUTPUT = 16 * 1024 * 1024  # bytes máximos de salida estándar por comando
+SSH_STREAM_MIN_SESSION = 10  # una sesión en streaming más corta y sin datos cuenta como fallo
+
+# Circuit breaker por estación (estado compartido en la caché)
+BREAKER_FAILURE_THRESHOLD = 3  # conexiones fallidas seguidas antes de abrir el circuito
+BREAKER_RESET_TIMEOUT = 30  # segundos abierto antes de probar de nuevo (se dobla en cada reapertura)
+BREAKER_MAX_RESET_TIMEOUT = 600  # espera máxima entre pruebas
+BREAKER_STATE_TTL = 86400  # segundos que se conserva el estado sin actividad
+
+# Barridos de monitoreo (Celery)
+MONITOR_MAX_WORKERS = 16  # estaciones consultadas en paralelo
+MONITOR_STATION_TIMEOUT = 30  # plazo por estación, en segundos
+MONITOR_SWEEP_TIMEOUT = 55  # plazo total de un barrido de monitoreo
+STATS_SWEEP_TIMEOUT = 25  # plazo total de update_container_stats (beat cada 30s)
+STATS_SWEEP_INTERVAL = 30  # antigüedad máxima de la instantánea antes de volver a consultar
+
+# Planificación adaptativa del monitoreo (dispatch_station_checks, beat cada 10s)
+MONITOR_INTERVAL = 60  # intervalo base por estación
+MONITOR_ACTIVE_INTERVAL = 15  # con espectadores o cambios recientes
+MONITOR_RECENT_CHANGE_WINDOW = 300  # segundos que un cambio mantiene el intervalo corto
+MONITOR_MAX_BACKOFF = 1800  # espera máxima para estaciones inalcanzables
+MONITOR_JITTER = 0.2  # desviación aleatoria relativa de cada intervalo
+MONITOR_MAX_PER_TICK = 200  # estaciones como máximo por tick
+
+# Reparto del monitoreo entre workers: cada estación pertenece a un shard por
+# hashing consistente y cada shard tiene su cola (celery -A config worker -Q monitor.0,monitor.1)
+MONITOR_SHARDS = 4
+MONITOR_SHARD_QUEUE = 'monitor.{shard}'
+MONITOR_SHARD_METRICS_TTL = 3600  # segundos que se conserva el último resumen de cada shard
+
+# Difusión de estadísticas por WebSocket
+STATS_BROADCAST_INTERVAL = 5  # segundos entre consultas del productor de cada estación
+# Cambio mínimo para emitir un campo en los deltas del WebSocket
+STATS_DELTA_THRESHOLDS = {
+    'cpu_percent': 0.5,  # puntos porcentuales
+    'memory_usage': 1024 * 1024,  # bytes
+    'network_rx': 64 * 1024,
+    'network_tx': 64 * 1024,
+}
+FLEET_BATCH_INTERVAL = 1  # segundos entre frames agrupados del socket de flota
+FLEET_MAX_SUBSCRIPTIONS = 2000  # pares (estación, evento) por socket de flota
+
+# Acciones de contenedor (ejecutadas en la cola 'actions' de Celery)
+CONTAINER_ACTION_TIMEOUT = 1800  # segundos antes de dar una acción por fallida
+CONTAINER_ACTION_OUTPUT_INTERVAL = 0.5  # segundos entre mensajes de salida en vivo
+CONTAINER_ACTION_OUTPUT_TAIL = 50  # líneas de salida guardadas con el resultado
+BULK_ACTION_MAX_PARALLELISM = 16  # estaciones ejecutando a la vez en una acción en lote
+BULK_ACTION_MAX_TARGETS = 1000  # contenedores por petición de acción en lote
+
+# Logs de contenedores
+LOGS_MAX_LINES = 5000  # máximo de líneas por petición (REST y backlog del WebSocket)
+LOG_FETCH_TIMEOUT = 30  # plazo de una lectura puntual de logs
+LOG_TAIL_BUFFER = 1000  # líneas recientes que guarda el tail compartido de cada contenedor
+LOG_TAIL_IDLE_TIMEOUT = 30  # segundos sin espectadores antes de parar el tail
+LOG_TAIL_LOAD_TIMEOUT = 5  # espera máxima del histórico inicial al conectar
+LOG_VIEWER_BUFFER = 1000  # líneas pendientes por espectador antes de descartar las antiguas
+
+# Streaming de docker stats e instantáneas compartidas en caché
+STATS_STREAM_IDLE_TIMEOUT = 60  # segundos sin lectores antes de parar un stream
+STATS_SNAPSHOT_TTL = 300  # vida de la instantánea en caché, en segundos
+STATS_SNAPSHOT_MAX_AGE = 15  # antigüedad máxima aceptada por los lectores
+
+# Watcher de docker events (manage.py watch_events)
+DOCKER_EVENTS_FULL_SYNC_INTERVAL = 900  # reconciliación completa de respaldo, en segundos
+DOCKER_EVENTS_RESYNC_DELAY = 2  # agrupar ráfagas de altas/renombrados antes de reconciliar
+
+# Caché de estadísticas del endpoint REST (stale-while-revalidate)
+STATS_CACHE_TTL = 10  # segundos en los que la instantánea se sirve como fresca
+STATS_CACHE_STALE_TTL = 120  # hasta aquí se sirve caducada mientras se refresca
+STATS_REFRESH_TIMEOUT = 30  # plazo de un refresco (y del lock single-flight)
+
+# Serie temporal de métricas de contenedores
+METRICS_RAW_RETENTION = 24 * 3600  # muestras en bruto, en segundos
+METRICS_MINUTE_RETENTION = 7 * 24 * 3600  # agregados de 1 minuto
+METRICS_HOUR_RETENTION = 365 * 24 * 3600  # agregados de 1 hora
+METRICS_ROLLUP_LOOKBACK = 5  # minutos recalculados en cada agregación
+METRICS_MAX_POINTS = 1000  # puntos por respuesta cuando no se indica step
+METRICS_PRUNE_BATCH_SIZE = 5000
+
+# Mantenimiento del registro de actividad
+ACTIVITY_LOG_RETENTION_DAYS = {'info': 14, 'success': 14, 'warning': 30, 'error': 90}
+ACTIVITY_LOG_ARCHIVE_DIR = None  # p. ej. BASE_DIR / 'archive' para guardar .jsonl.gz antes de borrar
+ACTIVITY_LOG_BATCH_SIZE = 1000  # filas por transacción al borrar
+ACTIVITY_LOG_BATCH_PAUSE = 0.05  # segundos entre lotes
+ACTIVITY_LOG_COMPACT_AFTER = 24  # horas antes de compactar entradas repetidas
+ACTIVITY_LOG_COMPACT_MIN_REPEATS = 5  # repeticiones por día para compactar
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -3,12 +3,13 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
-from stations.views import StationViewSet, ContainerViewSet, ActivityLogViewSet
+from stations.views import StationViewSet, ContainerViewSet, ContainerActionViewSet, ActivityLogViewSet
 
 router = DefaultRouter()
 router.register(r'stations', StationViewSet, basename='station')
 router.register(r'containers', ContainerViewSet, basename='container')
 router.register(r'logs', ActivityLogViewSet, basename='activitylog')
+router.register(r'actions', ContainerActionViewSet, basename='containeraction')
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
@@ -0,0 +1,305 @@
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .events import collect_events, container_payload, publish_event, send_action_event
+from .models import ActivityLog, Container, ContainerAction
+from .services import DockerService
+
+logger = logging.getLogger(__name__)
+
+# Margen sobre CONTAINER_ACTION_TIMEOUT antes de dar por perdida una acción en curso
+STALE_ACTION_MARGIN = 60
+
+# Estado del contenedor tras una acción completada
+ACTION_STATUS = {
+    'start': 'running',
+    'stop': 'stopped',
+    'pause': 'paused',
+}
+
+
+def action_payload(container_action) -> Dict:
+    """Estado de una acción tal como se envía a los espectadores"""
+    return {
+        'id': container_action.pk,
+        'container': container_action.container_id,
+        'action': container_action.action,
+        'status': container_action.status,
+        'message': container_action.result_message,
+        'completed_at': container_action.completed_at.isoformat() if container_action.completed_at else None,
+    }
+
+
+class _OutputBuffer:
+    """Agrupa la salida de la acción en mensajes de varias líneas"""
+
+    def __init__(self, action_id):
+        self.action_id = action_id
+        self.lines: List[str] = []
+        self.tail: List[str] = []
+        self.flushed_at = time.monotonic()
+        self.interval = getattr(settings, 'CONTAINER_ACTION_OUTPUT_INTERVAL', 0.5)
+        self.tail_size = getattr(settings, 'CONTAINER_ACTION_OUTPUT_TAIL', 50)
+
+    def __call__(self, line: str):
+        self.lines.append(line)
+        self.tail = (self.tail + [line])[-self.tail_size:]
+        if time.monotonic() - self.flushed_at >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            send_action_event(self.action_id, 'action.output', {'lines': self.lines})
+            self.lines = []
+        self.flushed_at = time.monotonic()
+
+
+def _set_status(container_action, status: str, message: str = ''):
+    container_action.status = status
+    container_action.result_message = message
+    if status in ('success', 'failed'):
+        container_action.completed_at = timezone.now()
+    container_action.save(update_fields=['status', 'result_message', 'completed_at'])
+    send_action_event(container_action.pk, 'action.status', action_payload(container_action))
+
+
+def run_container_action(container_action) -> Dict:
+    """Ejecutar una acción pendiente persistiendo sus transiciones de estado.
+
+    La salida se difunde en vivo al grupo de la acción y las últimas
+    ``CONTAINER_ACTION_OUTPUT_TAIL`` líneas se guardan con el resultado.
+    """
+    # Reclamar la acción de forma atómica: con ``acks_late`` una entrega
+    # duplicada de la tarea no puede ejecutarla dos veces
+    claimed = ContainerAction.objects.filter(pk=container_action.pk, status='pending').update(
+        status='executing', started_at=timezone.now()
+    )
+    if not claimed:
+        # Redelivery tras morir el worker a mitad: no se repite, pero si ya
+        # superó el plazo se cierra como fallida
+        fail_stale_actions([container_action.pk])
+        container_action.refresh_from_db()
+        return action_payload(container_action)
+
+    container = container_action.container
+    if container is None:
+        # El contenedor se eliminó (otra acción o un barrido) antes de ejecutar
+        _set_status(container_action, 'failed', 'Container no longer exists')
+        return action_payload(container_action)
+
+    station = container.station
+    action_type = container_action.action
+    user = container_action.executed_by
+    container_action.status = 'executing'
+    send_action_event(container_action.pk, 'action.status', action_payload(container_action))
+
+    output = _OutputBuffer(container_action.pk)
+    try:
+        result = DockerService(station).stream_container_action(
+            container.name, action_type, output,
+            timeout=getattr(settings, 'CONTAINER_ACTION_TIMEOUT', 1800)
+        )
+    except Exception as e:
+        logger.error(f"Error executing {action_type} on {container.name}: {str(e)}")
+        result = {'success': False, 'message': str(e)}
+    output.flush()
+
+    tail = '\n'.join(output.tail)
+    message = f"{result['message']}\n\n{tail}" if tail else result['message']
+
+    if not result['success']:
+        _set_status(container_action, 'failed', message)
+        ActivityLog.objects.create(
+            station=station,
+            container=container,
+            level='error',
+            message=f'Error ejecutando {action_type} en {container.name}: {result["message"]}',
+            created_by=user
+        )
+        return action_payload(container_action)
+
+    _set_status(container_action, 'success', message)
+    if action_type == 'remove':
+        removed = container_payload(container, 'removed')
+        container.delete()
+        publish_event(station.pk, 'containers', [removed])
+        return {**action_payload(container_action), 'container': None}
+
+    if action_type in ACTION_STATUS:
+        container.status = ACTION_STATUS[action_type]
+        container.save()
+
+    ActivityLog.objects.create(
+        station=station,
+        container=container,
+        level='success',
+        message=f'Acción {action_type} ejecutada en {container.name}',
+        created_by=user
+    )
+    return action_payload(container_action)
+
+
+def fail_stale_actions(ids: Optional[List] = None, now=None) -> int:
+    """Dar por fallidas las acciones que siguen en ``executing`` tras ``CONTAINER_ACTION_TIMEOUT``.
+
+    Solo pasa si el worker murió durante la acción: nadie más la reclamará
+    y sin esto ningún cliente recibiría el estado final.
+    """
+    now = now or timezone.now()
+    timeout = getattr(settings, 'CONTAINER_ACTION_TIMEOUT', 1800) + STALE_ACTION_MARGIN
+    cutoff = now - timedelta(seconds=timeout)
+    # Las acciones anteriores a ``started_at`` se miden desde ``executed_at``
+    stale = ContainerAction.objects.filter(status='executing').filter(
+        Q(started_at__lt=cutoff) | Q(started_at__isnull=True, executed_at__lt=cutoff)
+    )
+    if ids is not None:
+        stale = stale.filter(pk__in=ids)
+    stale = list(stale)
+    if stale:
+        logger.warning(f"Failing {len(stale)} container actions interrupted while executing")
+        _set_statuses(stale, 'failed', {
+            container_action.pk: 'Action interrupted: the worker stopped while executing it'
+            for container_action in stale
+        })
+    return len(stale)
+
+
+def _set_statuses(container_actions: List, status: str, messages: Optional[Dict] = None):
+    """Variante en bloque de ``_set_status`` (un solo ``bulk_update``)"""
+    now = timezone.now()
+    for container_action in container_actions:
+        container_action.status = status
+        container_action.result_message = (messages or {}).get(container_action.pk, '')
+        if status in ('success', 'failed'):
+            container_action.completed_at = now
+    ContainerAction.objects.bulk_update(container_actions, ['status', 'result_message', 'completed_at'])
+    for container_action in container_actions:
+        send_action_event(container_action.pk, 'action.status', action_payload(container_action))
+
+
+def _run_station_actions(station, container_actions: List) -> Dict:
+    """Ejecutar las acciones de una estación con un solo comando y registrar cada resultado"""
+    action_type = container_actions[0].action
+    for container_action in container_actions:
+        send_action_event(container_action.pk, 'action.status', action_payload(container_action))
+
+    names = [container_action.container.name for container_action in container_actions]
+    try:
+        results = DockerService(station).execute_bulk_container_action(names, action_type)
+    except Exception as e:
+        logger.error(f"Error executing bulk {action_type} on station {station.pk}: {str(e)}")
+        results = {name: {'success': False, 'message': str(e)} for name in names}
+
+    outcome = {True: [], False: []}
+    messages = {}
+    for container_action in container_actions:
+        result = results[container_action.container.name]
+        outcome[result['success']].append(container_action)
+        messages[container_action.pk] = result['message']
+    for success, group in outcome.items():
+        if group:
+            _set_statuses(group, 'success' if success else 'failed', messages)
+    succeeded = [container_action.container for container_action in outcome[True]]
+
+    with collect_events():
+        if action_type == 'remove':
+            publish_event(station.pk, 'containers', [container_payload(container, 'removed') for container in succeeded])
+            Container.objects.filter(pk__in=[container.pk for container in succeeded]).delete()
+        elif action_type in ACTION_STATUS and succeeded:
+            now = timezone.now()
+            for container in succeeded:
+                container.status = ACTION_STATUS[action_type]
+                container.last_updated = now
+            Container.objects.bulk_update(succeeded, ['status', 'last_updated'])
+            publish_event(station.pk, 'containers', [container_payload(container, 'updated') for container in succeeded])
+
+        failed = len(container_actions) - len(succeeded)
+        ActivityLog.objects.create(
+            station=station,
+            level='error' if failed else 'success',
+            message=(
+                f'Acción {action_type} en lote: {len(succeeded)}/{len(container_actions)} '
+                f'contenedores correctos en {station.name}'
+            ),
+            created_by=container_actions[0].executed_by
+        )
+    return {'station': station.pk, 'succeeded': len(succeeded), 'failed': failed}
+
+
+def _claim_actions(container_actions: List) -> List:
+    """Reclamar de forma atómica las acciones pendientes y devolverlas recargadas.
+
+    Igual que en ``run_container_action``: con ``acks_late`` una entrega
+    duplicada de la tarea no puede ejecutar dos veces la misma acción.
+    """
+    ids = [container_action.pk for container_action in container_actions]
+    fail_stale_actions(ids)
+    with transaction.atomic():
+        claimed = list(
+            ContainerAction.objects.select_for_update()
+            .filter(pk__in=ids, status='pending')
+            .values_list('pk', flat=True)
+        )
+        ContainerAction.objects.filter(pk__in=claimed).update(status='executing', started_at=timezone.now())
+    return list(
+        ContainerAction.objects.select_related('container__station', 'executed_by')
+        .filter(pk__in=claimed)
+        .order_by('pk')
+    )
+
+
+def run_bulk_action(container_actions: List, parallelism: Optional[int] = None,
+                    batch_size: Optional[int] = None) -> Dict:
+    """Ejecutar acciones pendientes agrupadas por estación.
+
+    Cada estación recibe un único comando con todos sus contenedores. Las
+    estaciones se despliegan en tandas de ``batch_size`` (todas a la vez si
+    no se indica), ejecutando como mucho ``parallelism`` en paralelo; una
+    tanda empieza cuando termina la anterior.
+    """
+    by_station = defaultdict(list)
+    orphaned = []
+    for container_action in _claim_actions(container_actions):
+        if container_action.container is None:
+            orphaned.append(container_action)
+        else:
+            by_station[container_action.container.station].append(container_action)
+    if orphaned:
+        # Contenedores eliminados antes de ejecutar: no deben quedar pendientes
+        _set_statuses(orphaned, 'failed', {
+            container_action.pk: 'Container no longer exists' for container_action in orphaned
+        })
+    stations = sorted(by_station, key=lambda station: station.pk)
+
+    max_parallelism = getattr(settings, 'BULK_ACTION_MAX_PARALLELISM', 16)
+    parallelism = max(1, min(parallelism or max_parallelism, max_parallelism))
+    batch_size = batch_size or len(stations) or 1
+
+    def run(station):
+        try:
+            return _run_station_actions(station, by_station[station])
+        except Exception as e:
+            logger.error(f"Bulk action failed on station {station.pk}: {str(e)}")
+            return {'station': station.pk, 'succeeded': 0, 'failed': len(by_station[station]), 'error': str(e)}
+        finally:
+            # Cada hilo abre su propia conexión a la base de datos
+            connections.close_all()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='bulk-action') as executor:
+        for start in range(0, len(stations), batch_size):
+            results.extend(executor.map(run, stations[start:start + batch_size]))
+
+    return {
+        'stations': len(results),
+        'succeeded': sum(result['succeeded'] for result in results),
+        'failed': sum(result['failed'] for result in results) + len(orphaned),
+        'results': results,
+    }
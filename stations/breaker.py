@@ -0,0 +1,152 @@
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Optional
+from django.conf import settings
+from django.core.cache import cache
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class StationUnreachable(Exception):
+    """El circuito de la estación está abierto: se falla sin intentar conectar"""
+
+    def __init__(self, station_id, state: Dict):
+        self.station_id = station_id
+        self.state = state
+        super().__init__(
+            f"Station {station_id} unreachable since {state.get('unreachable_since')}: {state.get('last_error')}"
+        )
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, dt_timezone.utc).isoformat()
+
+
+def _fingerprint(station) -> str:
+    from .ssh import credentials_fingerprint
+    return credentials_fingerprint(station)
+
+
+class CircuitBreaker:
+    """Circuit breaker por estación con el estado en la caché compartida.
+
+    Tras ``BREAKER_FAILURE_THRESHOLD`` conexiones fallidas seguidas el
+    circuito se abre y, hasta pasado ``BREAKER_RESET_TIMEOUT``, cualquier
+    proceso falla de inmediato en vez de esperar el timeout de SSH. Después
+    queda medio abierto: un único intento (reservado con ``cache.add``)
+    prueba la conexión y lo cierra si tiene éxito o lo vuelve a abrir con
+    una espera doble, hasta ``BREAKER_MAX_RESET_TIMEOUT``. Cambiar las
+    credenciales de la estación cierra el circuito y ``half_open`` adelanta
+    la prueba (``test_connection``).
+    """
+
+    @staticmethod
+    def _key(station_id) -> str:
+        return f'breaker:{station_id}'
+
+    @staticmethod
+    def _probe_key(station_id) -> str:
+        return f'breaker-probe:{station_id}'
+
+    @property
+    def threshold(self) -> int:
+        return getattr(settings, 'BREAKER_FAILURE_THRESHOLD', 3)
+
+    @property
+    def ttl(self) -> float:
+        return getattr(settings, 'BREAKER_STATE_TTL', 86400)
+
+    def _reset_timeout(self, opened: int) -> float:
+        reset_timeout = getattr(settings, 'BREAKER_RESET_TIMEOUT', 30)
+        max_reset_timeout = getattr(settings, 'BREAKER_MAX_RESET_TIMEOUT', 600)
+        return min(reset_timeout * 2 ** max(opened - 1, 0), max_reset_timeout)
+
+    def before_connect(self, station):
+        """Comprobar el circuito antes de abrir una conexión; lanza ``StationUnreachable`` si está abierto"""
+        station_id = station.pk
+        record = cache.get(self._key(station_id))
+        if record is None or record.get('opened_at') is None:
+            return
+        if record.get('fingerprint') != _fingerprint(station):
+            # Los fallos eran con otras credenciales
+            self.reset(station_id)
+            return
+        if time.time() < record['retry_at']:
+            raise StationUnreachable(station_id, self._describe(record))
+        # Medio abierto: solo un proceso prueba la conexión, el resto sigue fallando rápido
+        probe_timeout = getattr(settings, 'SSH_CONNECT_TIMEOUT', 10) * 3
+        if not cache.add(self._probe_key(station_id), uuid.uuid4().hex, probe_timeout):
+            raise StationUnreachable(station_id, self._describe(record))
+
+    def half_open(self, station_id):
+        """Permitir ya un intento de prueba aunque no haya pasado la espera (prueba manual)"""
+        record = cache.get(self._key(station_id))
+        if record is not None and record.get('opened_at') is not None:
+            record['retry_at'] = min(record['retry_at'], time.time())
+            cache.set(self._key(station_id), record, self.ttl)
+
+    def sync_credentials(self, station):
+        """Cerrar el circuito si las credenciales cambiaron desde los fallos registrados"""
+        record = cache.get(self._key(station.pk))
+        if record is not None and record.get('fingerprint') != _fingerprint(station):
+            self.reset(station.pk)
+
+    def reset(self, station_id):
+        cache.delete_many([self._key(station_id), self._probe_key(station_id)])
+
+    def record_success(self, station_id):
+        """Cerrar el circuito tras una conexión correcta"""
+        if cache.get(self._key(station_id)) is not None:
+            self.reset(station_id)
+
+    def record_failure(self, station, error):
+        """Contar un fallo de conexión y abrir el circuito al llegar al umbral"""
+        station_id = station.pk
+        now = time.time()
+        record = cache.get(self._key(station_id)) or {
+            'failures': 0, 'since': now, 'opened_at': None, 'opened': 0
+        }
+        record['fingerprint'] = _fingerprint(station)
+        record['failures'] += 1
+        record['last_error'] = str(error) or error.__class__.__name__
+        if record['failures'] >= self.threshold:
+            record['opened'] += 1
+            record['opened_at'] = now
+            record['retry_at'] = now + self._reset_timeout(record['opened'])
+        cache.set(self._key(station_id), record, self.ttl)
+        cache.delete(self._probe_key(station_id))
+
+    def _describe(self, record: Optional[Dict]) -> Dict:
+        if record is None:
+            return {'state': CLOSED, 'failures': 0}
+        if record.get('opened_at') is None:
+            state = CLOSED
+        elif time.time() < record['retry_at']:
+            state = OPEN
+        else:
+            state = HALF_OPEN
+        return {
+            'state': state,
+            'failures': record['failures'],
+            'unreachable_since': _iso(record['since']),
+            'retry_at': _iso(record.get('retry_at')) if state != CLOSED else None,
+            'last_error': record.get('last_error'),
+        }
+
+    def state(self, station_id) -> Dict:
+        """Estado del circuito para la API (``closed``, ``open`` o ``half_open``)"""
+        return self._describe(cache.get(self._key(station_id)))
+
+    def states(self, station_ids) -> Dict:
+        """Estado de varias estaciones con una sola lectura de la caché"""
+        keys = {self._key(station_id): station_id for station_id in station_ids}
+        found = cache.get_many(list(keys))
+        return {station_id: self._describe(found.get(key)) for key, station_id in keys.items()}
+
+
+circuit_breaker = CircuitBreaker()
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from .cache import aget_stats_snapshot, astore_feed_state, astore_stats_snapshot
+from .events import station_group
+from .models import Station
+from .services import DockerService
+from .streams import stats_streams
+
+logger = logging.getLogger(__name__)
+
+
+async def fetch_station_stats(station_id):
+    """Obtener estadísticas de la estación sin ocupar el executor de la base de datos.
+
+    Mantiene vivo el stream de ``docker stats`` de la estación y lee su última
+    instantánea; solo si aún no hay ninguna reciente hace una consulta puntual.
+    """
+    station = await Station.objects.aget(id=station_id)
+    stats_streams.ensure(station)
+    
+    max_age = getattr(settings, 'STATS_SNAPSHOT_MAX_AGE', 15)
+    snapshot = await aget_stats_snapshot(station_id, max_age=max_age)
+    if snapshot is not None:
+        return snapshot['stats']
+    
+    stats = await DockerService(station).aget_containers_stats()
+    await astore_stats_snapshot(station_id, stats)
+    return stats
+
+
+def diff_stats(previous: Dict, current: Dict, thresholds: Dict) -> Tuple[Dict, List, Dict]:
+    """Calcular los cambios entre dos instantáneas de estadísticas.
+
+    Devuelve ``(changed, removed, base)``: los campos que cambiaron por
+    contenedor, los contenedores desaparecidos y la nueva base. Un campo con
+    umbral solo se emite cuando se aleja de la última base enviada al menos
+    ese valor, así el ruido de los flotantes no genera mensajes pero la
+    deriva acumulada acaba enviándose.
+    """
+    changed = {}
+    base = {}
+    for name, fields in current.items():
+        before = previous.get(name)
+        if before is None:
+            changed[name] = dict(fields)
+            base[name] = dict(fields)
+            continue
+        kept = dict(before)
+        delta = {}
+        for field, value in fields.items():
+            old = before.get(field)
+            threshold = thresholds.get(field)
+            if old == value:
+                continue
+            if (
+                threshold and isinstance(old, (int, float)) and isinstance(value, (int, float))
+                and abs(value - old) < threshold
+            ):
+                continue
+            delta[field] = value
+            kept[field] = value
+        if delta:
+            changed[name] = delta
+        base[name] = kept
+    removed = [name for name in previous if name not in current]
+    return changed, removed, base
+
+
+class StationStatsBroadcaster:
+    """Productor único de estadísticas por estación para todos los sockets.
+
+    El primer socket de una estación en este proceso arranca un bucle
+    productor y el último lo detiene. Entre procesos, solo el que posee el
+    lease ``stats-producer:<id>`` en la caché consulta la estación; el
+    resultado se difunde con ``group_send`` a todos los suscriptores, de modo
+    que la carga remota no depende del número de espectadores.
+
+    El productor envía una instantánea completa al asumir el lease y después
+    solo deltas numerados (``epoch``, ``seq``); la base de los deltas se
+    guarda en la caché para que los consumidores puedan resincronizarse.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(int)
+        self._producers = {}
+        self._token = uuid.uuid4().hex
+
+    @staticmethod
+    def _lease_key(station_id) -> str:
+        return f'stats-producer:{station_id}'
+
+    @property
+    def interval(self) -> float:
+        return getattr(settings, 'STATS_BROADCAST_INTERVAL', 5)
+
+    async def subscribe(self, station_id):
+        """Registrar un socket y arrancar el productor local si hace falta"""
+        self._subscribers[station_id] += 1
+        producer = self._producers.get(station_id)
+        if producer is None or producer.done():
+            self._producers[station_id] = asyncio.create_task(self._produce(station_id))
+
+    async def unsubscribe(self, station_id):
+        """Dar de baja un socket y parar el productor con el último"""
+        self._subscribers[station_id] -= 1
+        if self._subscribers[station_id] > 0:
+            return
+        del self._subscribers[station_id]
+        producer = self._producers.pop(station_id, None)
+        if producer is not None:
+            producer.cancel()
+        if await cache.aget(self._lease_key(station_id)) == self._token:
+            await cache.adelete(self._lease_key(station_id))
+
+    async def _is_leader(self, station_id) -> bool:
+        """Obtener o renovar el lease de productor de la estación"""
+        key = self._lease_key(station_id)
+        lease = self.interval * 3
+        if await cache.aadd(key, self._token, lease):
+            return True
+        if await cache.aget(key) == self._token:
+            await cache.atouch(key, lease)
+            return True
+        return False
+
+    async def _publish(self, station_id, feed, stats):
+        """Difundir la instantánea completa o el delta respecto a la base del feed"""
+        thresholds = getattr(settings, 'STATS_DELTA_THRESHOLDS', {})
+        if feed['stats'] is None:
+            event = {'type': 'stats.update', 'full': True, 'data': stats}
+            base = stats
+        else:
+            changed, removed, base = diff_stats(feed['stats'], stats, thresholds)
+            if not changed and not removed:
+                return
+            event = {'type': 'stats.update', 'full': False, 'changed': changed, 'removed': removed}
+
+        feed['seq'] += 1
+        feed['stats'] = base
+        event.update(station=station_id, epoch=feed['epoch'], seq=feed['seq'])
+        # La base se publica antes que el evento: quien la lea nunca va por detrás
+        await astore_feed_state(station_id, feed['epoch'], feed['seq'], base)
+        await get_channel_layer().group_send(station_group(station_id), event)
+
+    async def _produce(self, station_id):
+        feed = None
+        while True:
+            try:
+                if await self._is_leader(station_id):
+                    if feed is None:
+                        # Nuevo lease: nueva época, se empieza con una instantánea completa
+                        feed = {'epoch': uuid.uuid4().hex, 'seq': 0, 'stats': None}
+                    stats = await fetch_station_stats(station_id)
+                    await self._publish(station_id, feed, stats)
+                else:
+                    feed = None
+                await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error getting stats for station {station_id}: {str(e)}")
+                await asyncio.sleep(self.interval * 2)
+
+
+broadcaster = StationStatsBroadcaster()
@@ -0,0 +1,82 @@
+import time
+from typing import Dict, Optional
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _snapshot_key(station_id) -> str:
+    return f'stats-snapshot:{station_id}'
+
+
+def _with_age(snapshot: Optional[Dict], max_age: Optional[float]) -> Optional[Dict]:
+    if snapshot is None:
+        return None
+    snapshot['age'] = max(time.time() - snapshot['timestamp'], 0.0)
+    if max_age is not None and snapshot['age'] > max_age:
+        return None
+    return snapshot
+
+
+def store_stats_snapshot(station_id, stats: Dict, timestamp: Optional[float] = None):
+    """Publicar la última instantánea de estadísticas de una estación"""
+    snapshot = {'stats': stats, 'timestamp': timestamp or time.time()}
+    cache.set(_snapshot_key(station_id), snapshot, getattr(settings, 'STATS_SNAPSHOT_TTL', 300))
+
+
+def get_stats_snapshot(station_id, max_age: Optional[float] = None) -> Optional[Dict]:
+    """Última instantánea (``stats``, ``timestamp``, ``age``) o ``None`` si no hay o es más antigua que ``max_age``"""
+    return _with_age(cache.get(_snapshot_key(station_id)), max_age)
+
+
+async def astore_stats_snapshot(station_id, stats: Dict, timestamp: Optional[float] = None):
+    """Variante asíncrona de ``store_stats_snapshot``"""
+    snapshot = {'stats': stats, 'timestamp': timestamp or time.time()}
+    await cache.aset(_snapshot_key(station_id), snapshot, getattr(settings, 'STATS_SNAPSHOT_TTL', 300))
+
+
+async def aget_stats_snapshot(station_id, max_age: Optional[float] = None) -> Optional[Dict]:
+    """Variante asíncrona de ``get_stats_snapshot``"""
+    return _with_age(await cache.aget(_snapshot_key(station_id)), max_age)
+
+
+def _feed_key(station_id) -> str:
+    return f'stats-feed:{station_id}'
+
+
+async def astore_feed_state(station_id, epoch: str, seq: int, stats: Dict):
+    """Publicar el estado del feed incremental (base sobre la que se calculan los deltas)"""
+    state = {'epoch': epoch, 'seq': seq, 'stats': stats}
+    await cache.aset(_feed_key(station_id), state, getattr(settings, 'STATS_SNAPSHOT_TTL', 300))
+
+
+async def aget_feed_state(station_id) -> Optional[Dict]:
+    """Estado del feed incremental (``epoch``, ``seq``, ``stats``) o ``None``"""
+    return await cache.aget(_feed_key(station_id))
+
+
+def _watched_key(station_id) -> str:
+    return f'docker-events:{station_id}'
+
+
+def mark_events_watched(station_ids, ttl: float):
+    """Anunciar que estas estaciones tienen un watcher de ``docker events`` activo"""
+    cache.set_many({_watched_key(station_id): True for station_id in station_ids}, ttl)
+
+
+def is_events_watched(station_id) -> bool:
+    """Si el inventario de la estación se mantiene por eventos en vez de por sondeo"""
+    return bool(cache.get(_watched_key(station_id)))
+
+
+def _changed_key(station_id) -> str:
+    return f'station-changed:{station_id}'
+
+
+def mark_station_changed(station_id, ttl: float):
+    """Anotar un cambio reciente en el inventario de la estación durante ``ttl`` segundos"""
+    cache.set(_changed_key(station_id), True, ttl)
+
+
+def has_recent_changes(station_id) -> bool:
+    """Si la estación ha cambiado hace poco (se consulta con más frecuencia)"""
+    return bool(cache.get(_changed_key(station_id)))
@@ -1,18 +1,112 @@
+import asyncio
 import json
+import msgpack
+from typing import Dict, Optional
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.contrib.auth.models import User
-from .models import Station
-from .services import DockerService
-import asyncio
+from django.conf import settings
+from .broadcast import broadcaster
+from .events import EVENT_TYPES, action_group, event_group, station_group
+from .logtail import LogViewer, fetch_container_logs, log_tails, normalize_log_cursor
+from .models import Container, ContainerAction, Station
+from .ssh import run_ssh
+from .actions import action_payload
+from .cache import aget_feed_state, aget_stats_snapshot
 import logging
 
 logger = logging.getLogger(__name__)
 
-class StationStatsConsumer(AsyncWebsocketConsumer):
+
+class StatsFeedReader:
+    """Posición (``epoch``, ``seq``) de un socket en el feed de estadísticas de una estación"""
+
+    def __init__(self, station_id):
+        self.station_id = station_id
+        self.epoch = None
+        self.seq = 0
+
+    async def snapshot(self) -> Optional[Dict]:
+        """Mensaje con la base actual del feed (o la última instantánea si aún no hay feed)"""
+        state = await aget_feed_state(self.station_id)
+        if state is not None:
+            self.epoch, self.seq, data = state['epoch'], state['seq'], state['stats']
+        else:
+            snapshot = await aget_stats_snapshot(self.station_id)
+            if snapshot is None:
+                # Sin datos todavía: la primera instantánea llegará por el grupo
+                return None
+            self.epoch, self.seq, data = None, 0, snapshot['stats']
+        return {'type': 'stats_snapshot', 'seq': self.seq, 'data': data}
+
+    async def handle(self, event) -> Optional[Dict]:
+        """Mensaje para el cliente a partir de un evento ``stats.update`` del grupo"""
+        if event['full']:
+            self.epoch, self.seq = event['epoch'], event['seq']
+            return {'type': 'stats_snapshot', 'seq': self.seq, 'data': event['data']}
+
+        if event['epoch'] == self.epoch and event['seq'] <= self.seq:
+            # Ya incluido en la instantánea enviada
+            return None
+        if event['epoch'] != self.epoch or event['seq'] != self.seq + 1:
+            return await self.snapshot()
+
+        self.seq = event['seq']
+        return {
+            'type': 'stats_delta',
+            'seq': self.seq,
+            'changed': event['changed'],
+            'removed': event['removed'],
+        }
+
+
+class EncodedJsonConsumer(AsyncWebsocketConsumer):
+    """Consumidor que envía JSON o msgpack según ``?encoding=``"""
+
+    async def negotiate_encoding(self) -> bool:
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.encoding = query.get('encoding', ['json'])[0]
+        if self.encoding not in ('json', 'msgpack'):
+            await self.close(code=4400)
+            return False
+        return True
+
+    def decode_message(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data) if text_data is not None else msgpack.unpackb(bytes_data)
+        except (ValueError, msgpack.UnpackException):
+            return None
+        return message if isinstance(message, dict) else None
+
+    async def send_message(self, payload):
+        if self.encoding == 'msgpack':
+            await self.send(bytes_data=msgpack.packb(payload))
+        else:
+            await self.send(text_data=json.dumps(payload))
+
+
+class StationStatsConsumer(EncodedJsonConsumer):
+    """Estadísticas de una estación: instantánea completa al suscribirse y después deltas.
+
+    Cada delta lleva ``seq``; si el consumidor detecta un hueco o un cambio
+    de época reenvía la instantánea (``stats_snapshot``). El cliente puede
+    pedirla con ``{"type": "resync"}`` y elegir ``?encoding=msgpack`` para
+    recibir frames binarios en lugar de JSON.
+    """
+
     async def connect(self):
         self.station_id = self.scope['url_route']['kwargs']['station_id']
-        self.station_group_name = f'station_{self.station_id}'
+        self.station_group_name = station_group(self.station_id)
+        if not await self.negotiate_encoding():
+            return
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        # Solo las estaciones del usuario: no se arranca un stream para otras
+        if not await Station.objects.filter(id=self.station_id, created_by_id=user.pk).aexists():
+            await self.close(code=4404)
+            return
+        self.feed = StatsFeedReader(self.station_id)
         
         # Join station group
         await self.channel_layer.group_add(
@@ -21,9 +115,11 @@ class StationStatsConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        await self.send_snapshot()
         
-        # Start sending stats
-        self.send_stats_task = asyncio.create_task(self.send_stats_periodically())
+        # Las estadísticas llegan por el grupo desde el productor compartido
+        await broadcaster.subscribe(self.station_id)
+        self.subscribed = True
     
     async def disconnect(self, close_code):
         # Leave station group
@@ -32,33 +128,264 @@ class StationStatsConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        # Cancel stats task
-        if hasattr(self, 'send_stats_task'):
-            self.send_stats_task.cancel()
+        if getattr(self, 'subscribed', False):
+            await broadcaster.unsubscribe(self.station_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        message = self.decode_message(text_data, bytes_data)
+        if message is not None and message.get('type') == 'resync':
+            await self.send_snapshot()
+
+    async def send_snapshot(self):
+        message = await self.feed.snapshot()
+        if message is not None:
+            await self.send_message(message)
     
-    async def send_stats_periodically(self):
-        """Enviar estadísticas cada 5 segundos"""
-        while True:
+    async def stats_update(self, event):
+        """Reenviar al cliente la instantánea o el delta difundido al grupo"""
+        message = await self.feed.handle(event)
+        if message is not None:
+            await self.send_message(message)
+
+
+class FleetConsumer(EncodedJsonConsumer):
+    """Un único socket para varias estaciones y tipos de evento.
+
+    El cliente envía ``{"type": "subscribe" | "unsubscribe", "stations":
+    [...], "events": [...]}`` con eventos de ``EVENT_TYPES`` (por defecto
+    todos). Cada suscripción se une al grupo de la estación y tipo; los
+    mensajes recibidos se acumulan y se envían juntos en un frame ``batch``
+    cada ``FLEET_BATCH_INTERVAL`` segundos.
+    """
+
+    async def connect(self):
+        if not await self.negotiate_encoding():
+            return
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.subscriptions = set()
+        self.feeds = {}
+        self.pending = []
+        self.flush_task = None
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'flush_task', None) is not None:
+            self.flush_task.cancel()
+        for station_id, event_type in list(getattr(self, 'subscriptions', ())):
+            await self._unsubscribe(station_id, event_type)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        message = self.decode_message(text_data, bytes_data)
+        if message is None:
+            return
+        action = message.get('type')
+        if action not in ('subscribe', 'unsubscribe', 'resync'):
+            await self.send_message({'type': 'error', 'error': f'Unknown message type: {action}'})
+            return
+
+        try:
+            stations = [int(station_id) for station_id in message.get('stations', [])]
+        except (TypeError, ValueError):
+            await self.send_message({'type': 'error', 'error': 'stations must be a list of ids'})
+            return
+        events = message.get('events') or list(EVENT_TYPES)
+        unknown = [event_type for event_type in events if event_type not in EVENT_TYPES]
+        if unknown:
+            await self.send_message({'type': 'error', 'error': f'Unknown event types: {unknown}'})
+            return
+
+        if action == 'resync':
+            for station_id in stations:
+                if station_id in self.feeds:
+                    self._queue(station_id, await self.feeds[station_id].snapshot())
+            return
+
+        requested = {(station_id, event_type) for station_id in stations for event_type in events}
+        if action == 'subscribe':
+            # Solo las estaciones del usuario, igual que en la API REST
+            owned = {
+                station_id async for station_id in Station.objects.filter(
+                    created_by_id=self.user.pk, id__in=stations
+                ).values_list('id', flat=True)
+            }
+            forbidden = sorted(set(stations) - owned)
+            if forbidden:
+                await self.send_message({'type': 'error', 'error': f'Unknown stations: {forbidden}'})
+            requested = {(station_id, event_type) for station_id, event_type in requested if station_id in owned}
+            limit = getattr(settings, 'FLEET_MAX_SUBSCRIPTIONS', 2000)
+            new = requested - self.subscriptions
+            if len(self.subscriptions) + len(new) > limit:
+                await self.send_message({'type': 'error', 'error': f'Subscription limit ({limit}) exceeded'})
+                return
+            for station_id, event_type in sorted(new):
+                await self._subscribe(station_id, event_type)
+        else:
+            for station_id, event_type in sorted(requested & self.subscriptions):
+                await self._unsubscribe(station_id, event_type)
+
+        await self.send_message({
+            'type': 'subscriptions',
+            'subscriptions': [
+                {'station': station_id, 'event': event_type}
+                for station_id, event_type in sorted(self.subscriptions)
+            ],
+        })
+
+    async def _subscribe(self, station_id, event_type):
+        self.subscriptions.add((station_id, event_type))
+        await self.channel_layer.group_add(event_group(station_id, event_type), self.channel_name)
+        if event_type == 'stats':
+            self.feeds[station_id] = StatsFeedReader(station_id)
+            self._queue(station_id, await self.feeds[station_id].snapshot())
+            await broadcaster.subscribe(station_id)
+
+    async def _unsubscribe(self, station_id, event_type):
+        self.subscriptions.discard((station_id, event_type))
+        await self.channel_layer.group_discard(event_group(station_id, event_type), self.channel_name)
+        if event_type == 'stats':
+            self.feeds.pop(station_id, None)
+            await broadcaster.unsubscribe(station_id)
+
+    def _queue(self, station_id, message: Optional[Dict]):
+        if message is None:
+            return
+        message['station'] = station_id
+        self.pending.append(message)
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(getattr(settings, 'FLEET_BATCH_INTERVAL', 1))
+        self.flush_task = None
+        events, self.pending = self.pending, []
+        if events:
+            await self.send_message({'type': 'batch', 'events': events})
+
+    async def stats_update(self, event):
+        feed = self.feeds.get(event['station'])
+        if feed is not None:
+            self._queue(event['station'], await feed.handle(event))
+
+    async def container_update(self, event):
+        self._queue(event['station'], {'type': 'container_update', 'data': event['data']})
+
+    async def activity_log(self, event):
+        self._queue(event['station'], {'type': 'activity_log', 'data': event['data']})
+
+
+class ContainerActionConsumer(EncodedJsonConsumer):
+    """Progreso de una acción de contenedor: estado actual al conectar y después
+    ``action_status`` en cada transición y ``action_output`` con la salida en vivo.
+    """
+
+    async def connect(self):
+        self.action_id = self.scope['url_route']['kwargs']['action_id']
+        self.action_group_name = action_group(self.action_id)
+        if not await self.negotiate_encoding():
+            return
+
+        user = self.scope.get('user')
+        container_action = await ContainerAction.objects.filter(
+            id=self.action_id, executed_by_id=getattr(user, 'pk', None)
+        ).afirst()
+        if container_action is None:
+            await self.close(code=4404)
+            return
+
+        await self.channel_layer.group_add(self.action_group_name, self.channel_name)
+        await self.accept()
+        # El estado se lee tras unirse al grupo para no perder transiciones
+        await container_action.arefresh_from_db()
+        await self.send_message({'type': 'action_status', 'data': action_payload(container_action)})
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.action_group_name, self.channel_name)
+
+    async def action_status(self, event):
+        await self.send_message({'type': 'action_status', 'data': event['data']})
+
+    async def action_output(self, event):
+        await self.send_message({'type': 'action_output', 'lines': event['data']['lines']})
+
+
+class ContainerLogsConsumer(EncodedJsonConsumer):
+    """Logs de un contenedor en vivo (``?tail=`` líneas iniciales o ``?since=`` cursor).
+
+    Todos los espectadores del contenedor en el proceso comparten un único
+    ``docker logs --follow``; cada uno tiene su propio búfer acotado y los
+    mensajes ``log_lines`` llevan el ``cursor`` para reanudar al reconectar.
+    """
+
+    async def connect(self):
+        self.container_id = self.scope['url_route']['kwargs']['container_id']
+        self.log_tail = None
+        self.pump = None
+        if not await self.negotiate_encoding():
+            return
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        max_lines = getattr(settings, 'LOGS_MAX_LINES', 5000)
+        try:
+            tail = int(query.get('tail', ['100'])[0])
+            since = normalize_log_cursor(query.get('since', [''])[0])
+        except ValueError:
+            await self.close(code=4400)
+            return
+        if not 0 <= tail <= max_lines:
+            await self.close(code=4400)
+            return
+
+        user = self.scope.get('user')
+        container = await Container.objects.select_related('station').filter(
+            id=self.container_id, station__created_by_id=getattr(user, 'pk', None)
+        ).afirst()
+        if container is None:
+            await self.close(code=4404)
+            return
+
+        await self.accept()
+        self.log_tail = log_tails.ensure(container)
+        # Esperar a que el tail tenga cargado su histórico antes de engancharse
+        await asyncio.to_thread(self.log_tail.loaded.wait, getattr(settings, 'LOG_TAIL_LOAD_TIMEOUT', 5))
+
+        self.viewer = LogViewer(asyncio.get_running_loop(), since=since)
+        backlog, complete = self.log_tail.attach(self.viewer, tail)
+        if not complete:
+            # El cursor es anterior al búfer compartido: leer el hueco aparte
+            until = backlog[0][0] if backlog else None
             try:
-                stats = await self.get_station_stats()
-                await self.send(text_data=json.dumps({
-                    'type': 'stats_update',
-                    'data': stats
-                }))
-                await asyncio.sleep(5)
-            except asyncio.CancelledError:
-                break
+                gap = await run_ssh(fetch_container_logs, container, max_lines, since=since, until=until)
             except Exception as e:
-                logger.error(f"Error sending stats: {str(e)}")
-                await asyncio.sleep(10)
-    
-    @database_sync_to_async
-    def get_station_stats(self):
-        """Obtener estadísticas de la estación"""
-        try:
-            station = Station.objects.get(id=self.station_id)
-            docker_service = DockerService(station)
-            return docker_service.get_containers_stats()
-        except Exception as e:
-            logger.error(f"Error getting stats for station {self.station_id}: {str(e)}")
-            return {}
\ No newline at end of file
+                logger.warning(f"Error reading log backlog for container {container.pk}: {str(e)}")
+                gap = []
+            await self.send_lines(gap, truncated=len(gap) >= max_lines)
+        await self.send_lines(backlog)
+        self.pump = asyncio.create_task(self.pump_lines())
+
+    async def disconnect(self, close_code):
+        if self.pump is not None:
+            self.pump.cancel()
+        if self.log_tail is not None and hasattr(self, 'viewer'):
+            self.log_tail.detach(self.viewer)
+
+    async def pump_lines(self):
+        while True:
+            entries, dropped = await self.viewer.drain()
+            await self.send_lines(entries, dropped=dropped)
+
+    async def send_lines(self, entries, dropped: int = 0, truncated: bool = False):
+        if not entries and not dropped and not truncated:
+            return
+        message = {
+            'type': 'log_lines',
+            'lines': [list(entry) for entry in entries],
+            'cursor': entries[-1][0] if entries else None,
+        }
+        if dropped:
+            message['dropped'] = dropped
+        if truncated:
+            message['truncated'] = True
+        await self.send_message(message)
@@ -0,0 +1,125 @@
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento a los que se puede suscribir un socket
+EVENT_TYPES = ('stats', 'containers', 'activity')
+
+# Tipo de mensaje del channel layer para cada tipo de evento publicado aquí
+MESSAGE_TYPES = {
+    'containers': 'container.update',
+    'activity': 'activity.log',
+}
+
+_local = threading.local()
+
+
+def station_group(station_id) -> str:
+    """Grupo del channel layer con los suscriptores de una estación"""
+    return f'station_{station_id}'
+
+
+def event_group(station_id, event_type: str) -> str:
+    """Grupo del channel layer de un tipo de evento de una estación"""
+    if event_type == 'stats':
+        return station_group(station_id)
+    return f'station_{station_id}_{event_type}'
+
+
+def action_group(action_id) -> str:
+    """Grupo del channel layer con los espectadores de una acción de contenedor"""
+    return f'container_action_{action_id}'
+
+
+def activity_payload(log) -> Dict:
+    """Representación compacta de una entrada del registro de actividad"""
+    return {
+        'id': log.pk,
+        'level': log.level,
+        'message': log.message,
+        'container': log.container_id,
+        'created_at': log.created_at.isoformat() if log.created_at else None,
+    }
+
+
+def container_payload(container, action: str) -> Dict:
+    """Representación compacta de un cambio de contenedor"""
+    return {
+        'action': action,
+        'id': container.pk,
+        'name': container.name,
+        'status': container.status,
+    }
+
+
+def _send(events: Dict):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for (station_id, event_type), items in events.items():
+        try:
+            async_to_sync(channel_layer.group_send)(event_group(station_id, event_type), {
+                'type': MESSAGE_TYPES[event_type],
+                'station': station_id,
+                'data': items,
+            })
+        except Exception as e:
+            logger.warning(f"Error publishing {event_type} events for station {station_id}: {str(e)}")
+
+
+def send_action_event(action_id, message_type: str, data: Dict):
+    """Enviar de inmediato un evento de progreso de una acción a sus espectadores"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(action_group(action_id), {
+            'type': message_type,
+            'action': action_id,
+            'data': data,
+        })
+    except Exception as e:
+        logger.warning(f"Error publishing progress for container action {action_id}: {str(e)}")
+
+
+def _collect(station_id, event_type: str, items: List[Dict]):
+    events = getattr(_local, 'events', None)
+    if events is None:
+        _send({(station_id, event_type): items})
+    else:
+        events.setdefault((station_id, event_type), []).extend(items)
+
+
+def publish_event(station_id, event_type: str, items: List[Dict]):
+    """Publicar eventos de una estación a los sockets suscritos.
+
+    Se envían al confirmar la transacción en curso (de inmediato fuera de
+    una) y, dentro de ``collect_events``, se agrupan en un solo mensaje por
+    estación y tipo.
+    """
+    if station_id is None or not items:
+        return
+    transaction.on_commit(functools.partial(_collect, station_id, event_type, list(items)))
+
+
+@contextmanager
+def collect_events():
+    """Agrupar los eventos publicados en el bloque y enviarlos al salir"""
+    if getattr(_local, 'events', None) is not None:
+        # Ya hay un bloque exterior que enviará los eventos
+        yield
+        return
+    _local.events = {}
+    try:
+        yield
+    finally:
+        events, _local.events = _local.events, None
+        if events:
+            _send(events)
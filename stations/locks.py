@@ -0,0 +1,42 @@
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+from django.core.cache import cache
+
+
+def _lock_key(name: str) -> str:
+    return f'lock:{name}'
+
+
+def acquire_lock(name: str, timeout: float) -> Optional[str]:
+    """Intentar adquirir un lock; devuelve el token del propietario o ``None``"""
+    token = uuid.uuid4().hex
+    if cache.add(_lock_key(name), token, timeout):
+        return token
+    return None
+
+
+def release_lock(name: str, token: str):
+    """Liberar un lock solo si sigue perteneciendo a ``token``"""
+    if cache.get(_lock_key(name)) == token:
+        cache.delete(_lock_key(name))
+
+
+def is_locked(name: str) -> bool:
+    return cache.get(_lock_key(name)) is not None
+
+
+@contextmanager
+def cache_lock(name: str, timeout: float):
+    """Lock distribuido sobre la caché de Django.
+
+    Devuelve ``True`` si se obtuvo el lock. Expira tras ``timeout`` segundos
+    para que un proceso caído no lo retenga indefinidamente, y solo lo libera
+    quien lo adquirió.
+    """
+    token = acquire_lock(name, timeout)
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            release_lock(name, token)
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+from typing import List, Optional, Tuple
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from .services import DockerService
+from .ssh import RemoteCommand, connection_pool, iter_channel_lines
+from .workers import StationWorker, StationWorkerManager
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_log_cursor(value) -> Optional[str]:
+    """Convertir un cursor (RFC 3339 o timestamp Unix) al formato de ``docker logs --timestamps``.
+
+    Docker usa siempre UTC con nueve decimales, así que los cursores se
+    pueden comparar como cadenas. Lanza ``ValueError`` si no es válido.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        moment = datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+        nanos = f'{moment.microsecond:06d}000'
+    except (ValueError, OverflowError, OSError):
+        moment = parse_datetime(str(value))
+        if moment is None or moment.tzinfo is None:
+            raise ValueError(f"Invalid log cursor: {value}")
+        moment = moment.astimezone(dt_timezone.utc)
+        # Conservar los nanosegundos de los cursores que devolvemos a los clientes
+        fraction = re.search(r'\.(\d+)', str(value))
+        nanos = (fraction.group(1) if fraction else '').ljust(9, '0')[:9]
+    return moment.strftime('%Y-%m-%dT%H:%M:%S') + f'.{nanos}Z'
+
+
+def split_log_line(line: str) -> Optional[Tuple[str, str]]:
+    """Separar ``(cursor, mensaje)`` de una línea de ``docker logs --timestamps``"""
+    timestamp, _, message = line.partition(' ')
+    if len(timestamp) < 20 or not timestamp.endswith('Z') or timestamp[4] != '-':
+        return None
+    return timestamp, message
+
+
+def fetch_container_logs(container, tail: int, since: Optional[str] = None,
+                         until: Optional[str] = None, oldest: bool = False) -> List[Tuple[str, str]]:
+    """Leer como mucho ``tail`` líneas de un rango sin cargar toda la salida en memoria.
+
+    Por defecto son las últimas del rango; con ``oldest`` las primeras, de
+    modo que quien pagina hacia delante desde ``since`` no se salta ninguna.
+    """
+    entries = [] if oldest else deque(maxlen=tail)
+    client = connection_pool.acquire(container.station)
+    remote = None
+    try:
+        # La salida se limita con la deque (o cortando la lectura), no con max_output
+        remote = RemoteCommand(
+            client, DockerService.container_logs_command(
+                container.name, tail=None if oldest else tail, since=since, until=until
+            ),
+            timeout=getattr(settings, 'LOG_FETCH_TIMEOUT', 30), max_output=0
+        )
+        for line in remote.iter_lines():
+            entry = split_log_line(line)
+            if entry is not None and (since is None or entry[0] > since):
+                entries.append(entry)
+                if oldest and len(entries) >= tail:
+                    break
+    finally:
+        if remote is not None:
+            remote.close()
+        connection_pool.release(client)
+    return list(entries)
+
+
+class LogViewer:
+    """Búfer circular acotado de un espectador de logs.
+
+    El hilo del tail añade líneas y despierta al bucle de eventos del
+    consumidor; si el espectador se retrasa se descartan las más antiguas y
+    se cuentan en ``dropped``.
+    """
+
+    def __init__(self, loop, since: Optional[str] = None, maxlen: Optional[int] = None):
+        self.loop = loop
+        self.since = since
+        self.lines = deque(maxlen=maxlen or getattr(settings, 'LOG_VIEWER_BUFFER', 1000))
+        self.dropped = 0
+        self.ready = asyncio.Event()
+        self._lock = threading.Lock()
+
+    def push(self, entries: List[Tuple[str, str]]):
+        with self._lock:
+            for entry in entries:
+                if self.since is not None and entry[0] <= self.since:
+                    continue
+                if len(self.lines) == self.lines.maxlen:
+                    self.dropped += 1
+                self.lines.append(entry)
+            # Solo se despierta al consumidor si no tiene ya líneas pendientes
+            wake = bool(self.lines) and not self.ready.is_set()
+        if wake:
+            self.loop.call_soon_threadsafe(self.ready.set)
+
+    async def drain(self) -> Tuple[List[Tuple[str, str]], int]:
+        """Esperar líneas nuevas y devolverlas junto con las descartadas desde la última vez"""
+        await self.ready.wait()
+        with self._lock:
+            self.ready.clear()
+            entries, dropped = list(self.lines), self.dropped
+            self.lines.clear()
+            self.dropped = 0
+        if entries:
+            self.since = entries[-1][0]
+        return entries, dropped
+
+
+class ContainerLogTail(StationWorker):
+    """Un único ``docker logs --follow`` por contenedor compartido por sus espectadores.
+
+    Carga primero las últimas ``LOG_TAIL_BUFFER`` líneas y después sigue el
+    log desde la última marca de tiempo vista, también al reconectar, por lo
+    que no repite ni pierde líneas. Se detiene cuando lleva
+    ``LOG_TAIL_IDLE_TIMEOUT`` segundos sin espectadores.
+    """
+
+    def __init__(self, container):
+        super().__init__(container.station, name=f'docker-logs-{container.pk}')
+        self.container = container
+        self.buffer = deque(maxlen=getattr(settings, 'LOG_TAIL_BUFFER', 1000))
+        self.cursor = None
+        self.loaded = threading.Event()
+        self.viewers = set()
+        self.idle_since = time.monotonic()
+        self._lock = threading.Lock()
+
+    def touch(self):
+        with self._lock:
+            self.idle_since = time.monotonic()
+
+    def should_stop(self) -> bool:
+        with self._lock:
+            if self.viewers:
+                return False
+            idle_timeout = getattr(settings, 'LOG_TAIL_IDLE_TIMEOUT', 30)
+            return time.monotonic() - self.idle_since > idle_timeout
+
+    def attach(self, viewer: LogViewer, tail: int) -> Tuple[List[Tuple[str, str]], bool]:
+        """Registrar un espectador y devolver su histórico inicial.
+
+        Con cursor (``viewer.since``) son las líneas posteriores a él y el
+        segundo valor indica si el búfer compartido las cubre todas; sin
+        cursor, las últimas ``tail`` líneas.
+        """
+        with self._lock:
+            self.viewers.add(viewer)
+            if viewer.since is None:
+                backlog = list(self.buffer)[-tail:] if tail else []
+                complete = True
+            else:
+                backlog = [entry for entry in self.buffer if entry[0] > viewer.since]
+                complete = bool(self.buffer) and self.buffer[0][0] <= viewer.since
+            if backlog:
+                viewer.since = backlog[-1][0]
+            return backlog, complete
+
+    def detach(self, viewer: LogViewer):
+        with self._lock:
+            self.viewers.discard(viewer)
+            if not self.viewers:
+                self.idle_since = time.monotonic()
+
+    def session(self) -> int:
+        if not self.loaded.is_set():
+            self._read(DockerService.container_logs_command(self.container.name, tail=self.buffer.maxlen))
+            self.loaded.set()
+        # Con el contenedor parado ``--follow`` termina al instante sin líneas nuevas
+        return self._read(DockerService.container_logs_command(
+            self.container.name, since=self.cursor, tail=None if self.cursor else 0, follow=True
+        ))
+
+    def _read(self, command: str) -> int:
+        """Leer la salida de ``command`` y devolver el número de líneas nuevas"""
+        lines = 0
+        client = connection_pool.acquire(self.station)
+        try:
+            channel = client.get_transport().open_session()
+            channel.settimeout(1.0)
+            channel.exec_command(command)
+            for line in iter_channel_lines(channel, self._stop_event):
+                entry = split_log_line(line)
+                if entry is not None and (self.cursor is None or entry[0] > self.cursor):
+                    self.cursor = entry[0]
+                    self._dispatch([entry])
+                    lines += 1
+                if self.should_stop():
+                    break
+        finally:
+            connection_pool.release(client)
+        return lines
+
+    def _dispatch(self, entries):
+        if not entries:
+            return
+        with self._lock:
+            self.buffer.extend(entries)
+            viewers = list(self.viewers)
+        for viewer in viewers:
+            viewer.push(entries)
+
+
+class LogTailManager(StationWorkerManager):
+    """Tails de logs activos en este proceso, uno por contenedor"""
+
+    worker_class = ContainerLogTail
+
+    @staticmethod
+    def station_of(container):
+        return container.station
+
+
+log_tails = LogTailManager()
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from stations.models import Station
+from stations.streams import stats_streams
+
+
+class Command(BaseCommand):
+    help = 'Mantener un stream de docker stats por estación conectada y publicar sus instantáneas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--refresh', type=float, default=15,
+            help='Segundos entre revisiones de la lista de estaciones'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Streaming docker stats (Ctrl+C para salir)')
+        try:
+            while True:
+                stations = list(Station.objects.filter(is_connected=True))
+                for station in stations:
+                    stats_streams.ensure(station)
+
+                connected = {station.pk for station in stations}
+                for station_id in stats_streams.active():
+                    if station_id not in connected:
+                        stats_streams.stop(station_id)
+
+                time.sleep(options['refresh'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stats_streams.stop_all()
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from stations.cache import mark_events_watched
+from stations.models import Station
+from stations.watchers import event_watchers
+
+
+class Command(BaseCommand):
+    help = 'Mantener un watcher de docker events por estación conectada y aplicar sus cambios'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--refresh', type=float, default=15,
+            help='Segundos entre revisiones de la lista de estaciones'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Watching docker events (Ctrl+C para salir)')
+        refresh = options['refresh']
+        try:
+            while True:
+                stations = list(Station.objects.filter(is_connected=True))
+                for station in stations:
+                    event_watchers.ensure(station)
+
+                connected = {station.pk for station in stations}
+                for station_id in event_watchers.active():
+                    if station_id not in connected:
+                        event_watchers.stop(station_id)
+
+                # monitor_station deja de listar el inventario de estas estaciones
+                mark_events_watched(event_watchers.synced(), ttl=refresh * 3)
+
+                time.sleep(refresh)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            event_watchers.stop_all()
@@ -0,0 +1,221 @@
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db.models import Count, F, FloatField, Max, Min, Sum
+from django.db.models.functions import TruncHour, TruncMinute
+from django.utils import timezone
+from .models import ContainerMetric, ContainerMetricRollup
+
+MINUTE = 60
+HOUR = 3600
+
+ROLLUP_FIELDS = [
+    'samples', 'cpu_min', 'cpu_avg', 'cpu_max',
+    'memory_min', 'memory_avg', 'memory_max', 'network_rx', 'network_tx',
+]
+
+RAW_FIELDS = ['ts', 'cpu_usage', 'memory_usage', 'network_rx', 'network_tx']
+
+RESOLUTION_NAMES = {0: 'raw', MINUTE: '1m', HOUR: '1h'}
+
+
+def _retention(resolution: int) -> timedelta:
+    """Retención configurada para una resolución (0 = muestras en bruto)"""
+    seconds = {
+        0: getattr(settings, 'METRICS_RAW_RETENTION', 86400),
+        MINUTE: getattr(settings, 'METRICS_MINUTE_RETENTION', 7 * 86400),
+        HOUR: getattr(settings, 'METRICS_HOUR_RETENTION', 365 * 86400),
+    }[resolution]
+    return timedelta(seconds=seconds)
+
+
+def record_samples(containers, ts=None) -> int:
+    """Añadir una muestra por contenedor con un único ``bulk_create``"""
+    ts = ts or timezone.now()
+    samples = [
+        ContainerMetric(
+            container_id=container.pk,
+            ts=ts,
+            cpu_usage=container.cpu_usage or 0,
+            memory_usage=int(container.memory_usage or 0),
+            network_rx=container.network_rx or 0,
+            network_tx=container.network_tx or 0,
+        )
+        for container in containers
+    ]
+    ContainerMetric.objects.bulk_create(samples)
+    return len(samples)
+
+
+def _upsert_rollups(rows: List[Dict], resolution: int) -> int:
+    rollups = [
+        ContainerMetricRollup(
+            container_id=row['container_id'],
+            resolution=resolution,
+            ts=row['bucket'],
+            **{field: row[field] for field in ROLLUP_FIELDS},
+        )
+        for row in rows
+    ]
+    if rollups:
+        ContainerMetricRollup.objects.bulk_create(
+            rollups,
+            update_conflicts=True,
+            unique_fields=['container', 'resolution', 'ts'],
+            update_fields=ROLLUP_FIELDS,
+        )
+    return len(rollups)
+
+
+def rollup_metrics(now=None) -> Dict:
+    """Agregar muestras en intervalos de 1 minuto y estos en intervalos de 1 hora.
+
+    Solo se agregan intervalos cerrados y se recalculan los últimos
+    ``METRICS_ROLLUP_LOOKBACK`` minutos, por lo que la operación es
+    idempotente y tolera ejecuciones perdidas.
+    """
+    now = now or timezone.now()
+    lookback = getattr(settings, 'METRICS_ROLLUP_LOOKBACK', 5)
+
+    minute_end = now.replace(second=0, microsecond=0)
+    minute_start = minute_end - timedelta(minutes=lookback)
+    minute_rows = (
+        ContainerMetric.objects
+        .filter(ts__gte=minute_start, ts__lt=minute_end)
+        .annotate(bucket=TruncMinute('ts'))
+        .values('container_id', 'bucket')
+        .annotate(
+            samples=Count('id'),
+            cpu_min=Min('cpu_usage'),
+            cpu_avg_sum=Sum('cpu_usage'),
+            cpu_max=Max('cpu_usage'),
+            memory_min=Min('memory_usage'),
+            memory_avg_sum=Sum('memory_usage'),
+            memory_max=Max('memory_usage'),
+            network_rx_=Max('network_rx'),
+            network_tx_=Max('network_tx'),
+        )
+    )
+    rows = []
+    for row in minute_rows:
+        row['cpu_avg'] = row.pop('cpu_avg_sum') / row['samples']
+        row['memory_avg'] = row.pop('memory_avg_sum') / row['samples']
+        row['network_rx'] = row.pop('network_rx_')
+        row['network_tx'] = row.pop('network_tx_')
+        rows.append(row)
+    minutes = _upsert_rollups(rows, MINUTE)
+
+    # Las horas se calculan a partir de los minutos (media ponderada por muestras)
+    hour_end = now.replace(minute=0, second=0, microsecond=0)
+    hour_start = hour_end - timedelta(hours=2)
+    hour_rows = (
+        ContainerMetricRollup.objects
+        .filter(resolution=MINUTE, ts__gte=hour_start, ts__lt=hour_end)
+        .annotate(bucket=TruncHour('ts'))
+        .values('container_id', 'bucket')
+        .annotate(
+            total=Sum('samples'),
+            cpu_min_=Min('cpu_min'),
+            cpu_weighted=Sum(F('cpu_avg') * F('samples'), output_field=FloatField()),
+            cpu_max_=Max('cpu_max'),
+            memory_min_=Min('memory_min'),
+            memory_weighted=Sum(F('memory_avg') * F('samples'), output_field=FloatField()),
+            memory_max_=Max('memory_max'),
+            network_rx_=Max('network_rx'),
+            network_tx_=Max('network_tx'),
+        )
+    )
+    rows = [
+        {
+            'container_id': row['container_id'],
+            'bucket': row['bucket'],
+            'samples': row['total'],
+            'cpu_min': row['cpu_min_'],
+            'cpu_avg': row['cpu_weighted'] / row['total'],
+            'cpu_max': row['cpu_max_'],
+            'memory_min': row['memory_min_'],
+            'memory_avg': row['memory_weighted'] / row['total'],
+            'memory_max': row['memory_max_'],
+            'network_rx': row['network_rx_'],
+            'network_tx': row['network_tx_'],
+        }
+        for row in hour_rows
+    ]
+    hours = _upsert_rollups(rows, HOUR)
+
+    return {'minute_rollups': minutes, 'hour_rollups': hours}
+
+
+def _delete_in_batches(queryset, batch_size: int) -> int:
+    """Borrar por lotes de claves primarias para no bloquear la tabla"""
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        count, _ = queryset.model.objects.filter(id__in=ids).delete()
+        deleted += count
+
+
+def prune_metrics(now=None) -> Dict:
+    """Eliminar muestras y agregados fuera de su periodo de retención"""
+    now = now or timezone.now()
+    batch_size = getattr(settings, 'METRICS_PRUNE_BATCH_SIZE', 5000)
+    return {
+        'raw': _delete_in_batches(
+            ContainerMetric.objects.filter(ts__lt=now - _retention(0)), batch_size
+        ),
+        'minute': _delete_in_batches(
+            ContainerMetricRollup.objects.filter(resolution=MINUTE, ts__lt=now - _retention(MINUTE)),
+            batch_size
+        ),
+        'hour': _delete_in_batches(
+            ContainerMetricRollup.objects.filter(resolution=HOUR, ts__lt=now - _retention(HOUR)),
+            batch_size
+        ),
+    }
+
+
+def choose_resolution(start, end, step: Optional[int] = None, now=None) -> int:
+    """Elegir la resolución más barata que cubre el rango con el paso pedido.
+
+    Sin ``step`` se usa el que produce como mucho ``METRICS_MAX_POINTS``
+    puntos. Se toma la resolución más gruesa que no supere el paso y cuya
+    retención alcance el inicio del rango.
+    """
+    now = now or timezone.now()
+    if step is None:
+        max_points = getattr(settings, 'METRICS_MAX_POINTS', 1000)
+        step = (end - start).total_seconds() / max_points
+
+    for resolution in (HOUR, MINUTE):
+        if resolution <= step and start >= now - _retention(resolution):
+            return resolution
+    if start >= now - _retention(0):
+        return 0
+    # El inicio ya no está en bruto: usar la resolución más fina que lo cubra
+    for resolution in (MINUTE, HOUR):
+        if start >= now - _retention(resolution):
+            return resolution
+    return HOUR
+
+
+def query_metrics(container, start, end, step: Optional[int] = None) -> Dict:
+    """Serie temporal de un contenedor en la resolución más barata para el rango"""
+    resolution = choose_resolution(start, end, step)
+    if resolution == 0:
+        points = ContainerMetric.objects.filter(
+            container=container, ts__gte=start, ts__lt=end
+        ).order_by('ts').values(*RAW_FIELDS)
+    else:
+        points = ContainerMetricRollup.objects.filter(
+            container=container, resolution=resolution, ts__gte=start, ts__lt=end
+        ).order_by('ts').values('ts', *ROLLUP_FIELDS)
+
+    return {
+        'container': container.pk,
+        'resolution': RESOLUTION_NAMES[resolution],
+        'from': start,
+        'to': end,
+        'points': list(points),
+    }
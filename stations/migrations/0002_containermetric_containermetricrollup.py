@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContainerMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ts', models.DateTimeField()),
+                ('cpu_usage', models.FloatField()),
+                ('memory_usage', models.BigIntegerField()),
+                ('network_rx', models.BigIntegerField()),
+                ('network_tx', models.BigIntegerField()),
+                ('container', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='stations.container')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['container', 'ts'], name='stations_co_contain_0d5141_idx'), models.Index(fields=['ts'], name='stations_co_ts_8bde6e_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ContainerMetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(60, '1 minute'), (3600, '1 hour')])),
+                ('ts', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField()),
+                ('cpu_min', models.FloatField()),
+                ('cpu_avg', models.FloatField()),
+                ('cpu_max', models.FloatField()),
+                ('memory_min', models.FloatField()),
+                ('memory_avg', models.FloatField()),
+                ('memory_max', models.FloatField()),
+                ('network_rx', models.BigIntegerField()),
+                ('network_tx', models.BigIntegerField()),
+                ('container', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_rollups', to='stations.container')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'ts'], name='stations_co_resolut_721618_idx')],
+                'constraints': [models.UniqueConstraint(fields=('container', 'resolution', 'ts'), name='unique_container_rollup')],
+            },
+        ),
+    ]
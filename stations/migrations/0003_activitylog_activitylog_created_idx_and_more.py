@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0002_containermetric_containermetricrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['-created_at', '-id'], name='activitylog_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['station', '-created_at', '-id'], name='activitylog_station_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['level', '-created_at', '-id'], name='activitylog_level_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0003_activitylog_activitylog_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitylog',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
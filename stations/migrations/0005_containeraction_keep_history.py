@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0004_activitylog_occurrences'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='containeraction',
+            name='container',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='stations.container'),
+        ),
+    ]
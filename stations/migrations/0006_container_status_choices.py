@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0005_containeraction_keep_history'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='container',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('stopped', 'Stopped'), ('paused', 'Paused'), ('exited', 'Exited'), ('restarting', 'Restarting'), ('dead', 'Dead'), ('created', 'Created'), ('removing', 'Removing'), ('unknown', 'Unknown')], max_length=20),
+        ),
+    ]
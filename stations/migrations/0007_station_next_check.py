@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0006_container_status_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='consecutive_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='next_check',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0007_station_next_check'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='containeraction',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -10,6 +10,9 @@ class Station(models.Model):
     compose_path = models.CharField(max_length=200, default='/app/docker-compose.yml')
     is_connected = models.BooleanField(default=False)
     last_check = models.DateTimeField(null=True, blank=True)
+    # Planificación adaptativa del monitoreo (ver stations/scheduling.py)
+    next_check = models.DateTimeField(null=True, blank=True, db_index=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -28,6 +31,9 @@ class Container(models.Model):
         ('exited', 'Exited'),
         ('restarting', 'Restarting'),
         ('dead', 'Dead'),
+        ('created', 'Created'),
+        ('removing', 'Removing'),
+        ('unknown', 'Unknown'),
     ]
     
     station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='containers')
@@ -53,6 +59,56 @@ class Container(models.Model):
     def __str__(self):
         return f"{self.name}@{self.station.name}"
 
+class ContainerMetric(models.Model):
+    """Muestra de estadísticas de un contenedor (serie temporal en bruto)"""
+    container = models.ForeignKey(Container, on_delete=models.CASCADE, related_name='metrics')
+    ts = models.DateTimeField()
+    cpu_usage = models.FloatField()
+    memory_usage = models.BigIntegerField()
+    network_rx = models.BigIntegerField()
+    network_tx = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['container', 'ts']),
+            models.Index(fields=['ts']),
+        ]
+
+    def __str__(self):
+        return f"{self.container_id}@{self.ts.isoformat()}"
+
+class ContainerMetricRollup(models.Model):
+    """Agregado min/avg/max de las muestras de un contenedor en un intervalo"""
+    RESOLUTION_CHOICES = [
+        (60, '1 minute'),
+        (3600, '1 hour'),
+    ]
+
+    container = models.ForeignKey(Container, on_delete=models.CASCADE, related_name='metric_rollups')
+    resolution = models.PositiveIntegerField(choices=RESOLUTION_CHOICES)
+    ts = models.DateTimeField()  # inicio del intervalo
+    samples = models.PositiveIntegerField()
+    cpu_min = models.FloatField()
+    cpu_avg = models.FloatField()
+    cpu_max = models.FloatField()
+    memory_min = models.FloatField()
+    memory_avg = models.FloatField()
+    memory_max = models.FloatField()
+    # Contadores acumulados: se guarda el último valor del intervalo
+    network_rx = models.BigIntegerField()
+    network_tx = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['container', 'resolution', 'ts'], name='unique_container_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'ts']),
+        ]
+
+    def __str__(self):
+        return f"{self.container_id}@{self.ts.isoformat()} ({self.resolution}s)"
+
 class ContainerAction(models.Model):
     ACTION_CHOICES = [
         ('start', 'Start'),
@@ -71,12 +127,14 @@ class ContainerAction(models.Model):
         ('failed', 'Failed'),
     ]
     
-    container = models.ForeignKey(Container, on_delete=models.CASCADE)
+    # SET_NULL: el historial de acciones sobrevive a la eliminación del contenedor
+    container = models.ForeignKey(Container, on_delete=models.SET_NULL, null=True, blank=True)
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     result_message = models.TextField(blank=True)
     executed_by = models.ForeignKey(User, on_delete=models.CASCADE)
     executed_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
@@ -96,9 +154,15 @@ class ActivityLog(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    occurrences = models.PositiveIntegerField(default=1)  # >1 en entradas compactadas
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='activitylog_created_idx'),
+            models.Index(fields=['station', '-created_at', '-id'], name='activitylog_station_idx'),
+            models.Index(fields=['level', '-created_at', '-id'], name='activitylog_level_idx'),
+        ]
 
     def __str__(self):
         return f"[{self.level.upper()}] {self.message[:50]}..."
\ No newline at end of file
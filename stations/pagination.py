@@ -0,0 +1,85 @@
+import base64
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CreatedAtCursorPagination(BasePagination):
+    """Paginación por cursor (keyset) sobre ``(created_at, id)`` descendente.
+
+    Cada página continúa estrictamente después de la última fila de la
+    anterior, así que el coste no crece con la profundidad y las filas nuevas
+    no desplazan las páginas ya recorridas.
+    """
+    page_size = 100
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Cursor no válido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-created_at', '-id')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.next_position = (results[-1].created_at, results[-1].pk) if self.has_next else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError
+            return created_at, int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        created_at, pk = position
+        encoded = base64.urlsafe_b64encode(f'{created_at.isoformat()}|{pk}'.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
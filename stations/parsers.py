@@ -0,0 +1,179 @@
+import json
+import logging
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Número y unidad de los tamaños de docker ("1.5GiB", "12.3kB", "0B")
+SIZE_RE = re.compile(r'^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*([A-Za-z]*)\s*$')
+
+# Docker usa unidades decimales (kB, MB) en red/disco y binarias (KiB, MiB) en memoria
+UNIT_MULTIPLIERS = {
+    '': 1,
+    'b': 1,
+    'kb': 1000,
+    'mb': 1000 ** 2,
+    'gb': 1000 ** 3,
+    'tb': 1000 ** 4,
+    'pb': 1000 ** 5,
+    'kib': 1024,
+    'mib': 1024 ** 2,
+    'gib': 1024 ** 3,
+    'tib': 1024 ** 4,
+    'pib': 1024 ** 5,
+}
+
+# Secuencias ANSI de la salida interactiva de ``docker stats``
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]')
+
+# Cursor al inicio o pantalla borrada: empieza un refresco. Docker 25+ añade
+# además ``\x1b[K`` (borrar línea) a cada línea, que no separa frames
+FRAME_START = re.compile(r'\x1b\[(?:H|2J)')
+
+# Valores de ``State`` de ``docker ps`` y sus equivalentes en Container.STATUS_CHOICES
+STATES = {
+    'running': 'running',
+    'paused': 'paused',
+    'restarting': 'restarting',
+    'exited': 'exited',
+    'dead': 'dead',
+    'created': 'created',
+    'removing': 'removing',
+}
+
+# Prefijos del texto ``Status`` para versiones de docker sin ``State``
+STATUS_PREFIXES = (
+    ('Up', 'running'),
+    ('Restarting', 'restarting'),
+    ('Exited', 'exited'),
+    ('Dead', 'dead'),
+    ('Created', 'created'),
+    ('Removal In Progress', 'removing'),
+)
+
+
+def parse_size(value: str) -> int:
+    """Convertir un tamaño de docker a bytes (0 si no se reconoce)"""
+    match = SIZE_RE.match(value or '')
+    if match is None:
+        return 0
+    multiplier = UNIT_MULTIPLIERS.get(match.group(2).lower())
+    if multiplier is None:
+        return 0
+    return int(float(match.group(1)) * multiplier)
+
+
+def parse_percent(value: str) -> float:
+    """Convertir un porcentaje de docker (``"12.5%"``) a número"""
+    try:
+        return float((value or '').strip().rstrip('%'))
+    except ValueError:
+        return 0.0
+
+
+def parse_size_pair(value: str) -> Tuple[int, int]:
+    """Convertir un par ``"usado / total"`` o ``"rx / tx"`` a bytes"""
+    first, separator, second = (value or '').partition('/')
+    if not separator:
+        return 0, 0
+    return parse_size(first), parse_size(second)
+
+
+def normalize_status(state: str, status: str = '') -> str:
+    """Estado del contenedor a partir de ``State`` o, si falta, del texto ``Status``"""
+    normalized = STATES.get((state or '').strip().lower())
+    if normalized is not None:
+        return normalized
+    status = (status or '').strip()
+    if status.startswith('Up') and '(Paused)' in status:
+        return 'paused'
+    for prefix, normalized in STATUS_PREFIXES:
+        if status.startswith(prefix):
+            return normalized
+    return 'unknown'
+
+
+def iter_json_records(lines: Iterable[str]) -> Iterator[Dict]:
+    """Iterar los objetos de una salida ``--format '{{json .}}'`` (uno por línea)"""
+    for line in lines:
+        line = line.strip()
+        if not line.startswith('{'):
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            logger.debug(f"Skipping malformed docker JSON line: {line[:200]}")
+            continue
+        if isinstance(record, dict):
+            yield record
+
+
+def parse_container_record(record: Dict) -> Optional[Dict]:
+    """Contenedor de ``docker ps --format '{{json .}}'`` en el formato de ``reconcile_containers``"""
+    name = (record.get('Names') or '').split(',')[0].strip()
+    if not name:
+        return None
+    return {
+        'name': name,
+        'id': record.get('ID', ''),
+        'image': record.get('Image', ''),
+        'status': normalize_status(record.get('State', ''), record.get('Status', '')),
+        'ports': record.get('Ports', ''),
+        'created': record.get('CreatedAt', ''),
+    }
+
+
+def parse_stats_record(record: Dict) -> Optional[Tuple[str, Dict]]:
+    """Estadísticas de ``docker stats --format '{{json .}}'`` como ``(nombre, stats)``"""
+    name = record.get('Name')
+    if not name:
+        return None
+    memory_usage, memory_limit = parse_size_pair(record.get('MemUsage', ''))
+    network_rx, network_tx = parse_size_pair(record.get('NetIO', ''))
+    return name, {
+        'cpu_percent': parse_percent(record.get('CPUPerc', '')),
+        'memory_usage': memory_usage,
+        'memory_limit': memory_limit,
+        'network_rx': network_rx,
+        'network_tx': network_tx,
+    }
+
+
+def parse_containers(lines: Iterable[str]) -> List[Dict]:
+    """Parsear la salida completa de ``docker ps`` en JSON"""
+    containers = []
+    for record in iter_json_records(lines):
+        container = parse_container_record(record)
+        if container is not None:
+            containers.append(container)
+    return containers
+
+
+def parse_stats(lines: Iterable[str]) -> Dict:
+    """Parsear la salida completa de ``docker stats`` en JSON"""
+    stats = {}
+    for record in iter_json_records(lines):
+        parsed = parse_stats_record(record)
+        if parsed is not None:
+            stats[parsed[0]] = parsed[1]
+    return stats
+
+
+def iter_stats_frames(lines: Iterable[str]) -> Iterator[Dict]:
+    """Iterar los refrescos completos de ``docker stats`` en streaming.
+
+    Cada refresco empieza con ``FRAME_START``; el resto de secuencias ANSI se
+    descartan sin cerrar el frame. El último se emite al acabar las líneas.
+    """
+    buffered = []
+    for line in lines:
+        if FRAME_START.search(line):
+            frame = parse_stats(buffered)
+            buffered = []
+            if frame:
+                yield frame
+        buffered.append(ANSI_ESCAPE.sub('', line))
+    frame = parse_stats(buffered)
+    if frame:
+        yield frame
@@ -0,0 +1,124 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import ActivityLog
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = [
+    'id', 'station_id', 'container_id', 'level', 'message',
+    'created_at', 'created_by_id', 'occurrences',
+]
+
+DEFAULT_RETENTION_DAYS = {'info': 14, 'success': 14, 'warning': 30, 'error': 90}
+
+
+def _pause():
+    pause = getattr(settings, 'ACTIVITY_LOG_BATCH_PAUSE', 0)
+    if pause:
+        time.sleep(pause)
+
+
+def _archive_rows(rows, path: Path):
+    """Añadir filas como JSON Lines a un fichero comprimido"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, 'at', encoding='utf-8') as archive:
+        for row in rows:
+            archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+
+
+def prune_activity_logs(now=None) -> Dict:
+    """Eliminar los registros más antiguos que la retención de su nivel.
+
+    Borra por lotes de ``ACTIVITY_LOG_BATCH_SIZE`` filas, cada uno en su propia
+    transacción, para no mantener bloqueos largos. Si ``ACTIVITY_LOG_ARCHIVE_DIR``
+    está configurado, las filas se escriben antes en un ``.jsonl.gz`` por ejecución.
+    """
+    now = now or timezone.now()
+    retention = getattr(settings, 'ACTIVITY_LOG_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    batch_size = getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', 1000)
+    archive_dir = getattr(settings, 'ACTIVITY_LOG_ARCHIVE_DIR', None)
+    archive_path = Path(archive_dir) / f'activitylog-{now:%Y%m%dT%H%M%S}.jsonl.gz' if archive_dir else None
+
+    deleted = {}
+    for level, days in retention.items():
+        expired = ActivityLog.objects.filter(level=level, created_at__lt=now - timedelta(days=days))
+        deleted[level] = 0
+        while True:
+            rows = list(expired.order_by().values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                break
+            if archive_path is not None:
+                _archive_rows(rows, archive_path)
+            with transaction.atomic():
+                ActivityLog.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            deleted[level] += len(rows)
+            _pause()
+
+    if archive_path is not None and any(deleted.values()):
+        logger.info(f"Archived activity logs to {archive_path}")
+    return deleted
+
+
+def compact_activity_logs(now=None) -> Dict:
+    """Agrupar entradas repetidas del mismo día en un único resumen con contador.
+
+    Solo actúa sobre entradas con más de ``ACTIVITY_LOG_COMPACT_AFTER`` horas,
+    de modo que el detalle reciente se conserva. Los grupos (estación,
+    contenedor, nivel, mensaje, día) con al menos
+    ``ACTIVITY_LOG_COMPACT_MIN_REPEATS`` filas se reducen a la más reciente,
+    cuyo campo ``occurrences`` acumula el total.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=getattr(settings, 'ACTIVITY_LOG_COMPACT_AFTER', 24))
+    min_repeats = getattr(settings, 'ACTIVITY_LOG_COMPACT_MIN_REPEATS', 5)
+    batch_size = getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', 1000)
+
+    groups = (
+        ActivityLog.objects
+        .filter(created_at__lt=cutoff)
+        .annotate(day=TruncDate('created_at'))
+        .values('station_id', 'container_id', 'level', 'message', 'day')
+        .annotate(rows=Count('id'), keep_id=Max('id'))
+        .filter(rows__gte=min_repeats)
+        .order_by()
+    )
+
+    compacted = 0
+    removed = 0
+    for group in list(groups):
+        duplicates = ActivityLog.objects.filter(
+            station_id=group['station_id'],
+            container_id=group['container_id'],
+            level=group['level'],
+            message=group['message'],
+            created_at__date=group['day'],
+            created_at__lt=cutoff,
+        ).exclude(id=group['keep_id'])
+
+        while True:
+            batch = list(duplicates.order_by().values_list('id', 'occurrences')[:batch_size])
+            if not batch:
+                break
+            # El contador y el borrado van en la misma transacción: interrumpir el
+            # proceso a mitad no pierde ni duplica ocurrencias
+            with transaction.atomic():
+                ActivityLog.objects.filter(id=group['keep_id']).update(
+                    occurrences=F('occurrences') + sum(occurrences for _, occurrences in batch)
+                )
+                ActivityLog.objects.filter(id__in=[pk for pk, _ in batch]).delete()
+            removed += len(batch)
+            _pause()
+        compacted += 1
+
+    return {'groups': compacted, 'removed': removed}
@@ -1,6 +1,9 @@
 from django.urls import path
-from .consumers import StationStatsConsumer
+from .consumers import ContainerActionConsumer, ContainerLogsConsumer, FleetConsumer, StationStatsConsumer
 
 websocket_urlpatterns = [
     path('ws/stations/<int:station_id>/stats/', StationStatsConsumer.as_asgi()),
-]
\ No newline at end of file
+    path('ws/fleet/', FleetConsumer.as_asgi()),
+    path('ws/actions/<int:action_id>/', ContainerActionConsumer.as_asgi()),
+    path('ws/containers/<int:container_id>/logs/', ContainerLogsConsumer.as_asgi()),
+]
@@ -0,0 +1,93 @@
+import random
+from datetime import timedelta
+from typing import List, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .broadcast import StationStatsBroadcaster
+from .cache import has_recent_changes
+from .models import Station
+
+# Fracción del número áureo: ids consecutivos quedan repartidos por todo el intervalo
+GOLDEN_RATIO_FRACTION = 0.6180339887498949
+
+
+def has_active_viewers(station_id) -> bool:
+    """Si algún proceso está difundiendo estadísticas de la estación por WebSocket"""
+    return cache.get(StationStatsBroadcaster._lease_key(station_id)) is not None
+
+
+def poll_interval(station_id) -> float:
+    """Intervalo base de la estación: más corto si alguien la mira o acaba de cambiar"""
+    if has_active_viewers(station_id) or has_recent_changes(station_id):
+        return getattr(settings, 'MONITOR_ACTIVE_INTERVAL', 15)
+    return getattr(settings, 'MONITOR_INTERVAL', 60)
+
+
+def backoff_interval(failures: int) -> float:
+    """Espera exponencial tras ``failures`` fallos seguidos, acotada por ``MONITOR_MAX_BACKOFF``"""
+    interval = getattr(settings, 'MONITOR_INTERVAL', 60)
+    max_backoff = getattr(settings, 'MONITOR_MAX_BACKOFF', 1800)
+    return min(interval * 2 ** max(failures - 1, 0), max_backoff)
+
+
+def jitter(seconds: float) -> float:
+    """Desplazar ``seconds`` un ±``MONITOR_JITTER`` aleatorio para que las estaciones no se sincronicen"""
+    spread = getattr(settings, 'MONITOR_JITTER', 0.2)
+    return seconds * random.uniform(1 - spread, 1 + spread)
+
+
+def initial_offset(station_id) -> float:
+    """Fase inicial de una estación dentro del intervalo base"""
+    interval = getattr(settings, 'MONITOR_INTERVAL', 60)
+    return (station_id * GOLDEN_RATIO_FRACTION) % 1 * interval
+
+
+def schedule_next_check(station, succeeded: bool, now=None):
+    """Fijar ``next_check`` y ``consecutive_failures`` tras una consulta (sin guardar)"""
+    now = now or timezone.now()
+    if succeeded:
+        station.consecutive_failures = 0
+        delay = poll_interval(station.pk)
+    else:
+        station.consecutive_failures += 1
+        delay = backoff_interval(station.consecutive_failures)
+    station.next_check = now + timedelta(seconds=jitter(delay))
+    return station.next_check
+
+
+def claim_due_stations(now=None, limit: Optional[int] = None) -> List[int]:
+    """Reservar las estaciones cuya consulta ha vencido y devolver sus ids.
+
+    Las reservadas se reprograman de forma provisional como si la consulta
+    fuera a fallar, de modo que un tick solapado no las repite y las que
+    agotan su plazo sin llegar a guardar resultado retroceden igual que las
+    inalcanzables. Las estaciones nuevas no se consultan de inmediato: reciben
+    una fase dentro del intervalo para repartir la carga. Como mucho se
+    reservan ``MONITOR_MAX_PER_TICK`` por tick, empezando por las más atrasadas.
+    """
+    now = now or timezone.now()
+    limit = limit or getattr(settings, 'MONITOR_MAX_PER_TICK', 200)
+
+    with transaction.atomic():
+        unscheduled = list(Station.objects.filter(next_check__isnull=True).only('id', 'next_check'))
+        for station in unscheduled:
+            station.next_check = now + timedelta(seconds=initial_offset(station.pk))
+        if unscheduled:
+            Station.objects.bulk_update(unscheduled, ['next_check'])
+
+        # skip_locked: un tick solapado no puede reservar las mismas filas
+        due = list(
+            Station.objects
+            .select_for_update(skip_locked=True)
+            .filter(next_check__lte=now)
+            .order_by('next_check')
+            .only('id', 'next_check', 'consecutive_failures')[:limit]
+        )
+        for station in due:
+            station.next_check = now + timedelta(seconds=jitter(backoff_interval(station.consecutive_failures + 1)))
+        if due:
+            Station.objects.bulk_update(due, ['next_check'])
+
+    return [station.pk for station in due]
@@ -1,4 +1,6 @@
+from django.db import models
 from rest_framework import serializers
+from .breaker import circuit_breaker
 from .models import Station, Container, ContainerAction, ActivityLog
 
 class ContainerSerializer(serializers.ModelSerializer):
@@ -17,25 +19,54 @@ class ContainerSerializer(serializers.ModelSerializer):
             return round((obj.memory_usage / obj.memory_limit) * 100, 2)
         return 0
 
+class StationListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        stations = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if 'breaker' in self.child.fields:
+            # Estado de todos los circuitos con una sola lectura de la caché
+            self.context['breakers'] = circuit_breaker.states([station.pk for station in stations])
+        return super().to_representation(stations)
+
 class StationSerializer(serializers.ModelSerializer):
     containers = ContainerSerializer(many=True, read_only=True)
     container_count = serializers.SerializerMethodField()
     running_containers = serializers.SerializerMethodField()
+    breaker = serializers.SerializerMethodField()
     
     class Meta:
         model = Station
         fields = ['id', 'name', 'ip_address', 'ssh_user', 'compose_path', 
                   'is_connected', 'last_check', 'containers', 'container_count',
-                  'running_containers', 'created_at', 'updated_at']
+                  'running_containers', 'breaker', 'created_at', 'updated_at']
         extra_kwargs = {
             'ssh_password': {'write_only': True}
         }
+        list_serializer_class = StationListSerializer
+    
+    def __init__(self, *args, **kwargs):
+        # Permite limitar los campos serializados (?fields=id,name,...)
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
     
     def get_container_count(self, obj):
+        # Anotado por StationViewSet.get_queryset para evitar un COUNT por estación
+        if hasattr(obj, 'container_total'):
+            return obj.container_total
         return obj.containers.count()
     
     def get_running_containers(self, obj):
+        if hasattr(obj, 'running_total'):
+            return obj.running_total
         return obj.containers.filter(status='running').count()
+    
+    def get_breaker(self, obj):
+        breakers = self.context.get('breakers')
+        if breakers is not None and obj.pk in breakers:
+            return breakers[obj.pk]
+        return circuit_breaker.state(obj.pk)
 
 class ContainerActionSerializer(serializers.ModelSerializer):
     container_name = serializers.CharField(source='container.name', read_only=True)
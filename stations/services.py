@@ -1,63 +1,112 @@
 import paramiko
 import re
+import shlex
 import json
 import yaml
 from typing import Dict, List, Optional
 import logging
+import time
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .breaker import StationUnreachable
+from .cache import get_stats_snapshot, store_stats_snapshot
+from .events import activity_payload, container_payload, publish_event
+from .locks import acquire_lock, is_locked, release_lock
+from .metrics import record_samples
+from .parsers import parse_containers, parse_stats
+from .models import Container, ActivityLog, Station
+from .ssh import CommandOutputExceeded, CommandTimeout, RemoteCommand, connection_pool, run_ssh
 
 logger = logging.getLogger(__name__)
 
 class DockerService:
     """Servicio para interactuar con Docker en estaciones remotas"""
     
+    # Un objeto JSON por línea: ni los nombres ni los puertos pueden romper el parseo
+    CONTAINERS_COMMAND = "docker ps -a --no-trunc --format '{{json .}}'"
+    STATS_COMMAND = "docker stats --no-stream --format '{{json .}}'"
+    STATS_STREAM_COMMAND = "docker stats --format '{{json .}}'"
+    
     def __init__(self, station):
         self.station = station
         self.ssh_client = None
     
     def _connect_ssh(self):
-        """Establecer conexión SSH"""
+        """Obtener conexión SSH del pool"""
         try:
-            self.ssh_client = paramiko.SSHClient()
-            self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.ssh_client.connect(
-                self.station.ip_address,
-                username=self.station.ssh_user,
-                password=self.station.ssh_password,
-                timeout=10
-            )
+            self.ssh_client = connection_pool.acquire(self.station)
             return True
+        except StationUnreachable as e:
+            logger.debug(str(e))
+            return False
         except Exception as e:
             logger.error(f"SSH connection failed to {self.station.ip_address}: {str(e)}")
             return False
     
     def _disconnect_ssh(self):
-        """Cerrar conexión SSH"""
+        """Devolver la conexión SSH al pool"""
         if self.ssh_client:
-            self.ssh_client.close()
+            connection_pool.release(self.ssh_client)
             self.ssh_client = None
     
-    def _execute_command(self, command: str) -> Dict:
-        """Ejecutar comando SSH"""
-        if not self.ssh_client:
-            if not self._connect_ssh():
-                return {'success': False, 'output': '', 'error': 'SSH connection failed'}
-        
-        try:
-            stdin, stdout, stderr = self.ssh_client.exec_command(command)
-            exit_status = stdout.channel.recv_exit_status()
-            
-            output = stdout.read().decode().strip()
-            error = stderr.read().decode().strip()
+    def _execute_command(self, command: str, timeout: Optional[float] = None,
+                         max_output: Optional[int] = None) -> Dict:
+        """Ejecutar comando SSH leyendo la salida en streaming con plazo y tamaño acotados"""
+        # Un transporte compartido puede haber caído: se reintenta una vez reconectando
+        for attempt in range(2):
+            if not self.ssh_client:
+                if not self._connect_ssh():
+                    return {'success': False, 'output': '', 'error': 'SSH connection failed'}
             
-            return {
-                'success': exit_status == 0,
-                'output': output,
-                'error': error,
-                'exit_status': exit_status
-            }
-        except Exception as e:
-            logger.error(f"Command execution failed: {str(e)}")
-            return {'success': False, 'output': '', 'error': str(e)}
+            try:
+                remote = RemoteCommand(self.ssh_client, command, timeout=timeout, max_output=max_output)
+                output = '\n'.join(remote.iter_lines()).strip()
+                
+                return {
+                    'success': remote.exit_status == 0,
+                    'output': output,
+                    'error': remote.stderr.strip(),
+                    'exit_status': remote.exit_status
+                }
+            except (CommandTimeout, CommandOutputExceeded) as e:
+                logger.warning(f"Command on {self.station.ip_address} aborted: {str(e)}")
+                return {'success': False, 'output': '', 'error': str(e)}
+            except (paramiko.SSHException, EOFError, OSError) as e:
+                logger.warning(f"SSH transport to {self.station.ip_address} broken: {str(e)}")
+                connection_pool.discard(self.ssh_client)
+                self.ssh_client = None
+                if attempt:
+                    return {'success': False, 'output': '', 'error': str(e)}
+            except Exception as e:
+                logger.error(f"Command execution failed: {str(e)}")
+                return {'success': False, 'output': '', 'error': str(e)}
+    
+    def iter_command_lines(self, command: str, timeout: Optional[float] = None,
+                           max_output: Optional[int] = None):
+        """Iterar las líneas de salida de un comando a medida que llegan.
+
+        Pensado para parsers incrementales: la salida nunca se acumula entera
+        en memoria. Al terminar, si el comando falló se lanza una excepción
+        con su salida de error. La conexión se devuelve al pool al acabar.
+        """
+        if not self.ssh_client and not self._connect_ssh():
+            raise Exception('SSH connection failed')
+        try:
+            try:
+                remote = RemoteCommand(self.ssh_client, command, timeout=timeout, max_output=max_output)
+            except (paramiko.SSHException, EOFError, OSError):
+                # Transporte caído: un reintento con conexión nueva
+                connection_pool.discard(self.ssh_client)
+                self.ssh_client = None
+                if not self._connect_ssh():
+                    raise Exception('SSH connection failed')
+                remote = RemoteCommand(self.ssh_client, command, timeout=timeout, max_output=max_output)
+            yield from remote.iter_lines()
+            if remote.exit_status != 0:
+                raise Exception(remote.stderr.strip() or f'Command failed (exit status {remote.exit_status})')
+        finally:
+            self._disconnect_ssh()
     
     def test_connection(self) -> bool:
         """Probar conexión y disponibilidad de Docker"""
@@ -65,153 +114,109 @@ class DockerService:
             return False
         
         # Verificar que Docker esté disponible
-        result = self._execute_command("docker --version")
-        self._disconnect_ssh()
+        try:
+            result = self._execute_command("docker --version")
+        finally:
+            self._disconnect_ssh()
         
         return result['success']
     
     def get_containers(self) -> List[Dict]:
         """Obtener lista de contenedores"""
-        command = "docker ps -a --format 'table {{.Names}}|{{.Status}}|{{.Image}}|{{.Ports}}|{{.ID}}|{{.CreatedAt}}' --no-trunc"
-        result = self._execute_command(command)
-        
-        if not result['success']:
-            raise Exception(f"Failed to get containers: {result['error']}")
-        
-        containers = []
-        lines = result['output'].split('\n')
-        
-        # Omitir header
-        if len(lines) > 1:
-            for line in lines[1:]:
-                if '|' in line:
-                    parts = line.split('|')
-                    if len(parts) >= 6:
-                        name = parts[0].strip()
-                        status = parts[1].strip()
-                        image = parts[2].strip()
-                        ports = parts[3].strip()
-                        container_id = parts[4].strip()
-                        created = parts[5].strip()
-                        
-                        # Determinar estado normalizado
-                        if status.startswith('Up'):
-                            normalized_status = 'running'
-                        elif status.startswith('Exited'):
-                            normalized_status = 'exited'
-                        elif 'Paused' in status:
-                            normalized_status = 'paused'
-                        else:
-                            normalized_status = 'unknown'
-                        
-                        containers.append({
-                            'name': name,
-                            'id': container_id,
-                            'image': image,
-                            'status': normalized_status,
-                            'ports': ports,
-                            'created': created
-                        })
-        
-        self._disconnect_ssh()
-        return containers
-    
-    def get_containers_stats(self) -> Dict:
-        """Obtener estadísticas en tiempo real de contenedores"""
-        command = "docker stats --no-stream --format 'table {{.Name}}|{{.CPUPerc}}|{{.MemUsage}}|{{.NetIO}}|{{.BlockIO}}'"
-        result = self._execute_command(command)
-        
-        if not result['success']:
-            raise Exception(f"Failed to get container stats: {result['error']}")
-        
-        stats = {}
-        lines = result['output'].split('\n')
-        
-        # Omitir header
-        if len(lines) > 1:
-            for line in lines[1:]:
-                if '|' in line:
-                    parts = line.split('|')
-                    if len(parts) >= 5:
-                        name = parts[0].strip()
-                        cpu_percent = self._parse_percentage(parts[1].strip())
-                        memory_usage = self._parse_memory(parts[2].strip())
-                        network_io = self._parse_network_io(parts[3].strip())
-                        
-                        stats[name] = {
-                            'cpu_percent': cpu_percent,
-                            'memory_usage': memory_usage.get('usage', 0),
-                            'memory_limit': memory_usage.get('limit', 0),
-                            'network_rx': network_io.get('rx', 0),
-                            'network_tx': network_io.get('tx', 0),
-                        }
-        
-        self._disconnect_ssh()
-        return stats
-    
-    def _parse_percentage(self, percentage_str: str) -> float:
-        """Parsear porcentaje de CPU"""
         try:
-            return float(percentage_str.replace('%', ''))
-        except:
-            return 0.0
+            return parse_containers(self.iter_command_lines(self.CONTAINERS_COMMAND))
+        except Exception as e:
+            raise Exception(f"Failed to get containers: {str(e)}")
     
-    def _parse_memory(self, memory_str: str) -> Dict:
-        """Parsear uso de memoria"""
+    def get_containers_stats(self, timeout: Optional[float] = None) -> Dict:
+        """Obtener estadísticas en tiempo real de contenedores"""
         try:
-            # Formato: "1.5GiB / 2GiB"
-            parts = memory_str.split(' / ')
-            if len(parts) == 2:
-                usage = self._parse_size_to_bytes(parts[0])
-                limit = self._parse_size_to_bytes(parts[1])
-                return {'usage': usage, 'limit': limit}
-        except:
-            pass
-        return {'usage': 0, 'limit': 0}
-    
-    def _parse_network_io(self, network_str: str) -> Dict:
-        """Parsear I/O de red"""
+            return parse_stats(self.iter_command_lines(self.STATS_COMMAND, timeout=timeout))
+        except Exception as e:
+            raise Exception(f"Failed to get container stats: {str(e)}")
+    
+    async def aget_containers_stats(self, timeout: Optional[float] = None) -> Dict:
+        """Variante asíncrona de ``get_containers_stats``.
+
+        El plazo se aplica también al comando remoto, de modo que el hilo del
+        executor SSH queda libre cuando la espera se abandona.
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'SSH_ASYNC_TIMEOUT', 15)
+        return await run_ssh(self.get_containers_stats, timeout, timeout=timeout)
+    
+    def probe(self, include_stats: bool = True, include_containers: bool = True,
+              timeout: Optional[float] = None) -> Dict:
+        """Sondear la estación en un único comando remoto.
+
+        Devuelve la disponibilidad de Docker, su versión y (opcionalmente) el
+        inventario de contenedores y la instantánea de estadísticas. Las
+        claves ``containers``/``stats`` valen ``None`` si su sección falló o
+        no se pidió. ``timeout`` acota el comando remoto.
+        """
+        sections = [('version', 'docker --version')]
+        if include_containers:
+            sections.append(('containers', self.CONTAINERS_COMMAND))
+        if include_stats:
+            sections.append(('stats', self.STATS_COMMAND))
+        
+        # Cada sección va precedida de un marcador y seguida de su código de salida;
+        # si Docker no responde no se ejecuta el resto
+        script = ['echo @@version', 'docker --version', 'rc=$?', 'echo "@@rc $rc"', '[ $rc -eq 0 ] || exit $rc']
+        for name, command in sections[1:]:
+            script += [f'echo @@{name}', command, 'echo "@@rc $?"']
+        
         try:
-            # Formato: "1.2MB / 800kB"
-            parts = network_str.split(' / ')
-            if len(parts) == 2:
-                rx = self._parse_size_to_bytes(parts[0])
-                tx = self._parse_size_to_bytes(parts[1])
-                return {'rx': rx, 'tx': tx}
-        except:
-            pass
-        return {'rx': 0, 'tx': 0}
-    
-    def _parse_size_to_bytes(self, size_str: str) -> int:
-        """Convertir tamaño a bytes"""
-        size_str = size_str.strip()
-        multipliers = {
-            'B': 1,
-            'kB': 1024,
-            'MB': 1024**2,
-            'GB': 1024**3,
-            'TB': 1024**4,
-            'KiB': 1024,
-            'MiB': 1024**2,
-            'GiB': 1024**3,
-            'TiB': 1024**4,
+            result = self._execute_command('; '.join(script), timeout=timeout)
+        finally:
+            self._disconnect_ssh()
+        
+        probe = {
+            'connected': False,
+            'docker_version': '',
+            'containers': None,
+            'stats': None,
+            'error': result['error'],
         }
+        parsed = self._split_sections(result['output'])
         
-        for unit, multiplier in multipliers.items():
-            if size_str.endswith(unit):
-                try:
-                    value = float(size_str[:-len(unit)])
-                    return int(value * multiplier)
-                except:
-                    break
+        version_lines, version_rc = parsed.get('version', ([], None))
+        if version_rc != 0:
+            return probe
+        probe['connected'] = True
+        probe['docker_version'] = '\n'.join(version_lines).strip()
         
-        try:
-            return int(float(size_str))
-        except:
-            return 0
+        lines, rc = parsed.get('containers', ([], None))
+        if rc == 0:
+            probe['containers'] = parse_containers(lines)
+        
+        lines, rc = parsed.get('stats', ([], None))
+        if rc == 0:
+            probe['stats'] = parse_stats(lines)
+        
+        return probe
     
-    def execute_container_action(self, container_name: str, action: str) -> Dict:
-        """Ejecutar acción en contenedor"""
+    def _split_sections(self, output: str) -> Dict:
+        """Separar la salida del sondeo en secciones ``{nombre: (líneas, código)}``"""
+        sections = {}
+        current = None
+        for line in output.split('\n'):
+            if line.startswith('@@rc '):
+                if current is not None:
+                    try:
+                        sections[current] = (sections[current][0], int(line[5:]))
+                    except ValueError:
+                        pass
+                current = None
+            elif line.startswith('@@'):
+                current = line[2:].strip()
+                sections[current] = ([], None)
+            elif current is not None:
+                sections[current][0].append(line)
+        return sections
+    
+    def container_action_command(self, container_name: str, action: str) -> Optional[str]:
+        """Comando remoto de una acción sobre un contenedor (``None`` si no existe)"""
         compose_dir = self.station.compose_path.rsplit('/', 1)[0]
         
         command_map = {
@@ -223,27 +228,335 @@ class DockerService:
             'remove': f"docker stop {container_name} && docker rm -f {container_name}",
             'rebuild': f"cd {compose_dir} && docker-compose up --build -d {container_name} 2>/dev/null || (docker stop {container_name} && docker rm {container_name} && docker-compose up -d {container_name})"
         }
-        
-        if action not in command_map:
+        return command_map.get(action)
+    
+    def execute_container_action(self, container_name: str, action: str) -> Dict:
+        """Ejecutar acción en contenedor"""
+        command = self.container_action_command(container_name, action)
+        if command is None:
             return {'success': False, 'message': f'Unknown action: {action}'}
         
-        result = self._execute_command(command_map[action])
-        self._disconnect_ssh()
+        try:
+            result = self._execute_command(command, timeout=getattr(settings, 'CONTAINER_ACTION_TIMEOUT', 1800))
+        finally:
+            self._disconnect_ssh()
         
         if result['success']:
             return {'success': True, 'message': f'Action {action} completed successfully'}
         else:
             return {'success': False, 'message': result['error'] or 'Action failed'}
     
+    # Acciones que docker acepta sobre varios contenedores en un solo comando
+    BULK_ACTION_COMMANDS = {
+        'start': 'docker start',
+        'stop': 'docker stop',
+        'restart': 'docker restart',
+        'pause': 'docker pause',
+        'unpause': 'docker unpause',
+        'remove': 'docker rm -f',
+    }
+    
+    def execute_bulk_container_action(self, container_names: List[str], action: str) -> Dict[str, Dict]:
+        """Ejecutar una acción sobre varios contenedores con un único comando remoto.
+
+        Docker imprime en la salida estándar el nombre de cada contenedor
+        procesado y en la de error los fallos, así que el resultado se
+        reparte por contenedor: ``{nombre: {'success', 'message'}}``.
+        """
+        names = ' '.join(shlex.quote(name) for name in container_names)
+        if action == 'rebuild':
+            compose_dir = self.station.compose_path.rsplit('/', 1)[0]
+            command = f"cd {shlex.quote(compose_dir)} && docker-compose up --build -d {names}"
+        elif action in self.BULK_ACTION_COMMANDS:
+            command = f"{self.BULK_ACTION_COMMANDS[action]} {names}"
+        else:
+            return {name: {'success': False, 'message': f'Unknown action: {action}'} for name in container_names}
+        
+        try:
+            result = self._execute_command(command, timeout=getattr(settings, 'CONTAINER_ACTION_TIMEOUT', 1800))
+        finally:
+            self._disconnect_ssh()
+        
+        if action == 'rebuild' or not result['output'] and not result['error']:
+            # Sin salida por contenedor: el código de salida vale para todos
+            message = f'Action {action} completed successfully' if result['success'] else (result['error'] or 'Action failed')
+            return {name: {'success': result['success'], 'message': message} for name in container_names}
+        
+        done = set(result['output'].splitlines())
+        errors = result['error'].splitlines()
+        results = {}
+        for name in container_names:
+            if name in done:
+                results[name] = {'success': True, 'message': f'Action {action} completed successfully'}
+            else:
+                mention = re.compile(rf'(?<![\w.-]){re.escape(name)}(?![\w.-])')
+                error = next((line for line in errors if mention.search(line)), None)
+                results[name] = {'success': False, 'message': error or result['error'] or 'Action failed'}
+        return results
+    
+    def stream_container_action(self, container_name: str, action: str, on_output, timeout: float) -> Dict:
+        """Ejecutar una acción entregando su salida línea a línea a ``on_output``.
+
+        La salida de error se combina con la estándar; si la acción no termina
+        en ``timeout`` segundos se cierra el canal y se da por fallida.
+        """
+        command = self.container_action_command(container_name, action)
+        if command is None:
+            return {'success': False, 'message': f'Unknown action: {action}'}
+        if not self._connect_ssh():
+            return {'success': False, 'message': 'SSH connection failed'}
+        
+        try:
+            remote = RemoteCommand(self.ssh_client, command, timeout=timeout, max_output=0, combine_stderr=True)
+            last_line = ''
+            for line in remote.iter_lines():
+                on_output(line)
+                last_line = line or last_line
+            exit_status = remote.exit_status
+        except CommandTimeout:
+            return {'success': False, 'message': f'Action {action} timed out after {timeout}s'}
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            logger.warning(f"SSH transport to {self.station.ip_address} broken: {str(e)}")
+            connection_pool.discard(self.ssh_client)
+            self.ssh_client = None
+            return {'success': False, 'message': str(e)}
+        finally:
+            self._disconnect_ssh()
+        
+        if exit_status == 0:
+            return {'success': True, 'message': f'Action {action} completed successfully'}
+        return {'success': False, 'message': last_line or f'Action failed (exit status {exit_status})'}
+    
+    @staticmethod
+    def container_logs_command(container_name: str, tail: Optional[int] = None, since: Optional[str] = None,
+                               until: Optional[str] = None, follow: bool = False) -> str:
+        """Comando ``docker logs`` con marcas de tiempo (usadas como cursor de reanudación)"""
+        parts = ['docker logs --timestamps']
+        if follow:
+            parts.append('--follow')
+        if tail is not None:
+            parts.append(f'--tail {int(tail)}')
+        if since:
+            parts.append(f'--since {shlex.quote(since)}')
+        if until:
+            parts.append(f'--until {shlex.quote(until)}')
+        parts.append(shlex.quote(container_name))
+        return ' '.join(parts) + ' 2>&1'
+    
     def get_container_logs(self, container_name: str, lines: int = 100) -> str:
         """Obtener logs de contenedor"""
         compose_dir = self.station.compose_path.rsplit('/', 1)[0]
         command = f"cd {compose_dir} && docker-compose logs --tail={lines} {container_name} 2>/dev/null || docker logs --tail={lines} {container_name}"
         
-        result = self._execute_command(command)
-        self._disconnect_ssh()
+        try:
+            result = self._execute_command(command)
+        finally:
+            self._disconnect_ssh()
         
         if result['success']:
             return result['output']
         else:
-            raise Exception(f"Failed to get logs: {result['error']}")
\ No newline at end of file
+            raise Exception(f"Failed to get logs: {result['error']}")
+
+
+CONTAINER_SYNC_FIELDS = ['container_id', 'image', 'status', 'ports', 'created_time']
+CONTAINER_STATS_FIELDS = ['cpu_usage', 'memory_usage', 'memory_limit', 'network_rx', 'network_tx', 'last_updated']
+
+
+def reconcile_containers(station, containers_data: List[Dict], user=None) -> Dict:
+    """Sincronizar el inventario de contenedores de una estación en bloque.
+
+    Carga los contenedores existentes en una sola consulta, calcula las
+    diferencias en memoria y aplica altas, cambios y bajas con
+    ``bulk_create``/``bulk_update`` y un único ``delete``, de modo que el
+    número de consultas no depende del número de contenedores. Los que
+    siguen existiendo conservan su clave primaria (y con ella su historial).
+    """
+    incoming = {data['name']: data for data in containers_data}
+    now = timezone.now()
+    
+    with transaction.atomic():
+        # Bloquear la estación serializa las sincronizaciones concurrentes (barrido,
+        # refresh_containers, watcher de eventos): ninguna crea el mismo nombre dos veces
+        Station.objects.select_for_update().only('id').get(pk=station.pk)
+        existing = {container.name: container for container in station.containers.all()}
+        to_create = []
+        to_update = []
+        
+        for name, data in incoming.items():
+            values = {
+                'container_id': data['id'],
+                'image': data['image'],
+                'status': data['status'],
+                'ports': data['ports'],
+                'created_time': data.get('created', ''),
+            }
+            container = existing.get(name)
+            if container is None:
+                to_create.append(Container(station=station, name=name, **values))
+                continue
+            
+            changed = False
+            for field, value in values.items():
+                if getattr(container, field) != value:
+                    setattr(container, field, value)
+                    changed = True
+            if changed:
+                container.last_updated = now
+                to_update.append(container)
+        
+        removed = [container for name, container in existing.items() if name not in incoming]
+        
+        if to_create:
+            Container.objects.bulk_create(to_create)
+        if to_update:
+            Container.objects.bulk_update(to_update, CONTAINER_SYNC_FIELDS + ['last_updated'])
+        if removed:
+            Container.objects.filter(pk__in=[container.pk for container in removed]).delete()
+        
+        logs = [
+            ActivityLog(
+                station=station,
+                container=container,
+                level='info',
+                message=f'Nuevo contenedor detectado: {container.name}',
+                created_by=user
+            )
+            for container in to_create
+        ]
+        logs += [
+            ActivityLog(
+                station=station,
+                level='warning',
+                message=f'Contenedor eliminado: {container.name}',
+                created_by=user
+            )
+            for container in removed
+        ]
+        if logs:
+            ActivityLog.objects.bulk_create(logs)
+        
+        # bulk_create/bulk_update no emiten post_save: un solo evento por tipo
+        publish_event(station.pk, 'containers', (
+            [container_payload(container, 'created') for container in to_create]
+            + [container_payload(container, 'updated') for container in to_update]
+            + [container_payload(container, 'removed') for container in removed]
+        ))
+        publish_event(station.pk, 'activity', [activity_payload(log) for log in logs])
+    
+    return {'created': to_create, 'updated': to_update, 'removed': removed}
+
+
+def ingest_container_stats(station, stats: Dict) -> Dict:
+    """Guardar una instantánea de estadísticas con una lectura y un ``bulk_update``.
+
+    La instantánea también se añade a la serie temporal de métricas.
+    Devuelve las filas escritas y el tiempo empleado para seguir el coste
+    en base de datos de cada estación.
+    """
+    started = time.monotonic()
+    now = timezone.now()
+    updated = []
+    
+    with transaction.atomic():
+        containers = {
+            container.name: container
+            for container in Container.objects.filter(station=station).only('id', 'name')
+        }
+        for container_name, container_stats in stats.items():
+            container = containers.get(container_name)
+            if container is None:
+                continue
+            container.cpu_usage = container_stats.get('cpu_percent', 0)
+            container.memory_usage = container_stats.get('memory_usage', 0)
+            container.memory_limit = container_stats.get('memory_limit', 0)
+            container.network_rx = container_stats.get('network_rx', 0)
+            container.network_tx = container_stats.get('network_tx', 0)
+            container.last_updated = now
+            updated.append(container)
+        
+        if updated:
+            Container.objects.bulk_update(updated, CONTAINER_STATS_FIELDS)
+            record_samples(updated, now)
+    
+    elapsed = time.monotonic() - started
+    logger.info(f"Stored stats for station {station.id}: {len(updated)} rows in {elapsed * 1000:.1f}ms")
+    return {'rows': len(updated), 'elapsed': round(elapsed, 4)}
+
+
+def get_latest_stats(station, timeout: Optional[float] = None) -> Dict:
+    """Estadísticas recientes de la estación.
+
+    Usa la instantánea publicada por el stream de ``docker stats`` (u otra
+    consulta reciente) si no supera ``STATS_SNAPSHOT_MAX_AGE``; si no, hace
+    una consulta puntual y la publica para el resto de lectores.
+    """
+    snapshot = get_stats_snapshot(station.pk, max_age=getattr(settings, 'STATS_SNAPSHOT_MAX_AGE', 15))
+    if snapshot is not None:
+        return snapshot['stats']
+    
+    stats = DockerService(station).get_containers_stats(timeout=timeout)
+    store_stats_snapshot(station.pk, stats)
+    return stats
+
+
+def _stats_refresh_lock(station_id) -> str:
+    return f'stats-refresh:{station_id}'
+
+
+def refresh_stats_snapshot(station, lock_token: Optional[str] = None) -> Dict:
+    """Consultar las estadísticas de la estación, publicarlas y guardarlas.
+
+    Los refrescos concurrentes de una misma estación se coalescen: si otro
+    proceso ya está refrescando, se espera a su resultado en lugar de lanzar
+    otra consulta remota. ``lock_token`` indica que el llamante ya posee el lock.
+    """
+    timeout = getattr(settings, 'STATS_REFRESH_TIMEOUT', 30)
+    lock_name = _stats_refresh_lock(station.pk)
+    token = lock_token or acquire_lock(lock_name, timeout)
+    
+    if token is None:
+        previous = get_stats_snapshot(station.pk)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.2)
+            snapshot = get_stats_snapshot(station.pk)
+            if snapshot is not None and (previous is None or snapshot['timestamp'] > previous['timestamp']):
+                return snapshot
+            if not is_locked(lock_name):
+                break
+        raise Exception('Stats refresh timed out')
+    
+    try:
+        stats = DockerService(station).get_containers_stats()
+        store_stats_snapshot(station.pk, stats)
+        ingest_container_stats(station, stats)
+    finally:
+        release_lock(lock_name, token)
+    return get_stats_snapshot(station.pk) or {'stats': stats, 'timestamp': time.time(), 'age': 0.0}
+
+
+def get_cached_stats(station) -> Dict:
+    """Estadísticas para lecturas REST con semántica stale-while-revalidate.
+
+    Una instantánea más reciente que ``STATS_CACHE_TTL`` se sirve tal cual; si
+    es más antigua pero no supera ``STATS_CACHE_STALE_TTL`` se sirve marcada
+    como ``stale`` y se encola un único refresco asíncrono. Sin instantánea
+    utilizable se refresca de forma síncrona.
+    """
+    snapshot = get_stats_snapshot(station.pk)
+    if snapshot is not None:
+        if snapshot['age'] <= getattr(settings, 'STATS_CACHE_TTL', 10):
+            return dict(snapshot, stale=False)
+        if snapshot['age'] <= getattr(settings, 'STATS_CACHE_STALE_TTL', 120):
+            token = acquire_lock(_stats_refresh_lock(station.pk), getattr(settings, 'STATS_REFRESH_TIMEOUT', 30))
+            if token is not None:
+                from .tasks import refresh_station_stats
+                try:
+                    refresh_station_stats.delay(station.pk, token)
+                except Exception as e:
+                    logger.error(f"Could not schedule stats refresh for station {station.pk}: {str(e)}")
+                    release_lock(_stats_refresh_lock(station.pk), token)
+            return dict(snapshot, stale=True)
+    
+    return dict(refresh_stats_snapshot(station), stale=False)
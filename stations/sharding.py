@@ -0,0 +1,77 @@
+import bisect
+import hashlib
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
+
+# Puntos por shard en el anillo: reparto uniforme sin depender del número de estaciones
+RING_REPLICAS = 64
+
+SHARD_KINDS = ('monitor', 'stats')
+
+
+def _hash(value: str) -> int:
+    return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+@lru_cache(maxsize=8)
+def _ring(shards: int) -> Tuple[List[int], List[int]]:
+    points = sorted(
+        (_hash(f'shard-{shard}:{replica}'), shard)
+        for shard in range(shards)
+        for replica in range(RING_REPLICAS)
+    )
+    return [point for point, _ in points], [shard for _, shard in points]
+
+
+def shard_count() -> int:
+    return max(1, getattr(settings, 'MONITOR_SHARDS', 4))
+
+
+def shard_for(station_id, shards: Optional[int] = None) -> int:
+    """Shard de una estación por hashing consistente.
+
+    Al añadir o quitar shards solo cambia de shard la fracción de estaciones
+    que le corresponde, de modo que cada worker conserva casi todas sus
+    conexiones SSH abiertas.
+    """
+    hashes, owners = _ring(shards or shard_count())
+    index = bisect.bisect(hashes, _hash(f'station-{station_id}')) % len(hashes)
+    return owners[index]
+
+
+def shard_queue(shard: int) -> str:
+    """Cola de Celery que atiende un shard"""
+    return getattr(settings, 'MONITOR_SHARD_QUEUE', 'monitor.{shard}').format(shard=shard)
+
+
+def group_by_shard(station_ids) -> Dict[int, List]:
+    shards = shard_count()
+    groups = defaultdict(list)
+    for station_id in station_ids:
+        groups[shard_for(station_id, shards)].append(station_id)
+    return dict(groups)
+
+
+def _metrics_key(kind: str, shard: int) -> str:
+    return f'shard-metrics:{kind}:{shard}'
+
+
+def record_shard_metrics(kind: str, shard: int, summary: Dict):
+    """Guardar el resumen del último barrido de un shard"""
+    metrics = dict(summary, shard=shard, finished_at=time.time())
+    cache.set(_metrics_key(kind, shard), metrics, getattr(settings, 'MONITOR_SHARD_METRICS_TTL', 3600))
+
+
+def shard_metrics() -> Dict:
+    """Último resumen de cada shard por tipo de barrido (``None`` si no ha terminado ninguno)"""
+    shards = range(shard_count())
+    keys = {_metrics_key(kind, shard): (kind, shard) for kind in SHARD_KINDS for shard in shards}
+    found = cache.get_many(list(keys))
+    metrics = {kind: {} for kind in SHARD_KINDS}
+    for key, (kind, shard) in keys.items():
+        metrics[kind][shard] = dict(found[key], queue=shard_queue(shard)) if key in found else None
+    return metrics
@@ -0,0 +1,37 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .breaker import circuit_breaker
+from .events import activity_payload, container_payload, publish_event
+from .models import ActivityLog, Container, Station
+from .ssh import connection_pool
+
+
+@receiver(post_save, sender=Station)
+def sync_station_connection(sender, instance, created, **kwargs):
+    """Cerrar la conexión SSH compartida y el circuit breaker si cambian las credenciales"""
+    if not created:
+        connection_pool.sync_credentials(instance)
+        circuit_breaker.sync_credentials(instance)
+
+
+@receiver(post_delete, sender=Station)
+def close_station_connection(sender, instance, **kwargs):
+    """Cerrar la conexión SSH de una estación eliminada"""
+    connection_pool.invalidate(instance)
+    circuit_breaker.reset(instance.pk)
+
+
+@receiver(post_save, sender=ActivityLog)
+def publish_activity_log(sender, instance, created, **kwargs):
+    """Enviar las nuevas entradas del registro a los sockets suscritos"""
+    if created:
+        publish_event(instance.station_id, 'activity', [activity_payload(instance)])
+
+
+@receiver(post_save, sender=Container)
+def publish_container_change(sender, instance, created, **kwargs):
+    """Enviar los cambios de contenedor hechos con ``save()`` a los sockets suscritos"""
+    publish_event(
+        instance.station_id, 'containers',
+        [container_payload(instance, 'created' if created else 'updated')]
+    )
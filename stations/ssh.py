@@ -0,0 +1,429 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+from django.conf import settings
+
+from .breaker import circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+
+class SSHPoolExhausted(Exception):
+    """No hay conexiones libres en el pool dentro del tiempo de espera"""
+
+
+class CommandTimeout(Exception):
+    """El comando remoto superó su plazo"""
+
+
+class CommandOutputExceeded(Exception):
+    """El comando remoto produjo más salida de la permitida"""
+
+
+def credentials_fingerprint(station) -> str:
+    """Huella de las credenciales SSH de una estación"""
+    raw = f"{station.ip_address}\x00{station.ssh_user}\x00{station.ssh_password}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class _PooledConnection:
+    __slots__ = ('client', 'leases', 'created_at', 'last_used')
+
+    def __init__(self, client):
+        self.client = client
+        self.leases = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    def is_alive(self) -> bool:
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+
+class SSHConnectionPool:
+    """Pool de conexiones SSH autenticadas compartidas por estación.
+
+    Cada estación (ip, usuario, huella de credenciales) mantiene un único
+    transporte vivo con keepalive; los comandos abren canales nuevos sobre
+    él mediante ``exec_command``, por lo que varios hilos pueden usarlo a
+    la vez. Las conexiones ociosas o caídas se descartan y el número total
+    por proceso está limitado por ``SSH_POOL_MAX_CONNECTIONS``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slot_available = threading.Condition(self._lock)
+        self._connections = {}
+        self._station_keys = {}
+        self._key_locks = {}
+        self._dropped = set()
+        self._opening = 0
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'reconnects': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    @property
+    def max_connections(self) -> int:
+        return getattr(settings, 'SSH_POOL_MAX_CONNECTIONS', 64)
+
+    @property
+    def idle_timeout(self) -> float:
+        return getattr(settings, 'SSH_POOL_IDLE_TIMEOUT', 300)
+
+    @staticmethod
+    def _key(station):
+        return (station.ip_address, station.ssh_user, credentials_fingerprint(station))
+
+    def acquire(self, station) -> paramiko.SSHClient:
+        """Obtener un cliente conectado para la estación (reutilizándolo si existe)"""
+        key = self._key(station)
+        to_close = []
+        with self._lock:
+            to_close.extend(self._evict_idle_locked())
+            to_close.extend(self._forget_stale_key_locked(station.pk, key))
+            conn = self._connections.get(key)
+            if conn is not None and conn.is_alive():
+                conn.leases += 1
+                conn.last_used = time.monotonic()
+                self._counters['hits'] += 1
+                self._station_keys[station.pk] = key
+            else:
+                conn = None
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        self._close_all(to_close)
+        if conn is not None:
+            return conn.client
+
+        # Un solo hilo abre la conexión de cada clave; el resto la reutiliza
+        with key_lock:
+            # Con el circuito abierto se falla sin esperar el timeout de conexión
+            circuit_breaker.before_connect(station)
+            to_close = []
+            try:
+                with self._lock:
+                    conn = self._connections.get(key)
+                    if conn is not None and conn.is_alive():
+                        conn.leases += 1
+                        conn.last_used = time.monotonic()
+                        self._counters['hits'] += 1
+                        self._station_keys[station.pk] = key
+                        return conn.client
+                    if conn is not None:
+                        # Transporte caído: se reemplaza
+                        del self._connections[key]
+                        to_close.append(conn.client)
+                        self._dropped.add(key)
+                    self._reserve_slot_locked(to_close)
+                    self._opening += 1
+            finally:
+                self._close_all(to_close)
+
+            try:
+                client = self._open(station)
+            except Exception as e:
+                circuit_breaker.record_failure(station, e)
+                with self._lock:
+                    self._opening -= 1
+                    self._slot_available.notify_all()
+                raise
+            circuit_breaker.record_success(station.pk)
+
+            with self._lock:
+                self._opening -= 1
+                conn = _PooledConnection(client)
+                conn.leases = 1
+                self._connections[key] = conn
+                self._station_keys[station.pk] = key
+                if key in self._dropped:
+                    self._dropped.discard(key)
+                    self._counters['reconnects'] += 1
+                else:
+                    self._counters['misses'] += 1
+            return client
+
+    def release(self, client):
+        """Devolver un cliente obtenido con ``acquire``"""
+        with self._lock:
+            conn = self._find_locked(client)
+            if conn is not None:
+                conn.leases = max(conn.leases - 1, 0)
+                conn.last_used = time.monotonic()
+                self._slot_available.notify_all()
+
+    def discard(self, client):
+        """Descartar un cliente roto; la próxima petición reconectará"""
+        with self._lock:
+            for key, conn in list(self._connections.items()):
+                if conn.client is client:
+                    del self._connections[key]
+                    self._dropped.add(key)
+                    self._slot_available.notify_all()
+                    break
+        self._close_all([client])
+
+    def invalidate(self, station):
+        """Cerrar la conexión asociada a una estación (credenciales cambiadas o borrada)"""
+        with self._lock:
+            to_close = self._forget_station_locked(station.pk)
+        if to_close:
+            self._close_all(to_close)
+
+    def sync_credentials(self, station):
+        """Invalidar la conexión si las credenciales de la estación han cambiado"""
+        with self._lock:
+            to_close = self._forget_stale_key_locked(station.pk, self._key(station))
+        self._close_all(to_close)
+
+    def close_all(self):
+        """Cerrar todas las conexiones del pool"""
+        with self._lock:
+            clients = [conn.client for conn in self._connections.values()]
+            self._connections.clear()
+            self._station_keys.clear()
+            self._slot_available.notify_all()
+        self._close_all(clients)
+
+    def stats(self) -> dict:
+        """Contadores de uso del pool"""
+        with self._lock:
+            data = dict(self._counters)
+            data['connections'] = len(self._connections)
+            data['leased'] = sum(1 for conn in self._connections.values() if conn.leases)
+        data['max_connections'] = self.max_connections
+        requests = data['hits'] + data['misses'] + data['reconnects']
+        data['hit_ratio'] = round(data['hits'] / requests, 4) if requests else 0.0
+        return data
+
+    def _open(self, station) -> paramiko.SSHClient:
+        timeout = getattr(settings, 'SSH_CONNECT_TIMEOUT', 10)
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            station.ip_address,
+            username=station.ssh_user,
+            password=station.ssh_password,
+            timeout=timeout,
+            banner_timeout=timeout,
+            auth_timeout=timeout,
+        )
+        client.get_transport().set_keepalive(getattr(settings, 'SSH_KEEPALIVE_INTERVAL', 30))
+        return client
+
+    def _find_locked(self, client):
+        for conn in self._connections.values():
+            if conn.client is client:
+                return conn
+        return None
+
+    def _forget_station_locked(self, station_pk):
+        key = self._station_keys.pop(station_pk, None)
+        conn = self._connections.pop(key, None) if key is not None else None
+        if conn is None:
+            return []
+        self._counters['invalidations'] += 1
+        self._slot_available.notify_all()
+        return [conn.client]
+
+    def _forget_stale_key_locked(self, station_pk, key):
+        previous = self._station_keys.get(station_pk)
+        if previous is None or previous == key:
+            return []
+        return self._forget_station_locked(station_pk)
+
+    def _evict_idle_locked(self):
+        now = time.monotonic()
+        evicted = []
+        for key, conn in list(self._connections.items()):
+            if conn.leases:
+                continue
+            if not conn.is_alive():
+                # Caída detectada: la próxima apertura cuenta como reconexión
+                self._dropped.add(key)
+            elif now - conn.last_used <= self.idle_timeout:
+                continue
+            del self._connections[key]
+            evicted.append(conn.client)
+            self._counters['evictions'] += 1
+        return evicted
+
+    def _reserve_slot_locked(self, evicted):
+        """Esperar hasta que haya hueco, expulsando la conexión libre menos usada"""
+        deadline = time.monotonic() + getattr(settings, 'SSH_CONNECT_TIMEOUT', 10)
+        while len(self._connections) + self._opening >= self.max_connections:
+            idle = [(conn.last_used, key) for key, conn in self._connections.items() if not conn.leases]
+            if idle:
+                _, key = min(idle)
+                evicted.append(self._connections.pop(key).client)
+                self._counters['evictions'] += 1
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SSHPoolExhausted(
+                    f"SSH pool exhausted ({self.max_connections} connections in use)"
+                )
+            self._slot_available.wait(remaining)
+
+    @staticmethod
+    def _close_all(clients):
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.debug(f"Error closing SSH connection: {str(e)}")
+
+
+connection_pool = SSHConnectionPool()
+
+
+_ssh_executor = None
+_ssh_executor_lock = threading.Lock()
+
+
+def get_ssh_executor() -> ThreadPoolExecutor:
+    """Executor acotado para llamadas SSH bloqueantes desde código asíncrono.
+
+    Es independiente del executor de ``database_sync_to_async``, así una
+    estación lenta no bloquea el acceso a la base de datos ni al resto de
+    consumidores del proceso.
+    """
+    global _ssh_executor
+    with _ssh_executor_lock:
+        if _ssh_executor is None:
+            _ssh_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'SSH_ASYNC_MAX_WORKERS', 32),
+                thread_name_prefix='ssh-async'
+            )
+        return _ssh_executor
+
+
+async def run_ssh(func, *args, timeout=None, **kwargs):
+    """Ejecutar ``func`` en el executor SSH y esperar como mucho ``timeout`` segundos"""
+    if timeout is None:
+        timeout = getattr(settings, 'SSH_ASYNC_TIMEOUT', 15)
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    return await asyncio.wait_for(loop.run_in_executor(get_ssh_executor(), call), timeout)
+
+
+def iter_channel_lines(channel, stop_event: threading.Event = None, chunk_size: int = 32768):
+    """Iterar las líneas de un canal a medida que llegan.
+
+    El canal debe tener un ``settimeout`` corto para poder comprobar
+    ``stop_event`` periódicamente. Termina con el EOF remoto o al activarse
+    ``stop_event``; en ambos casos cierra el canal.
+    """
+    buffer = b''
+    try:
+        while stop_event is None or not stop_event.is_set():
+            try:
+                chunk = channel.recv(chunk_size)
+            except socket.timeout:
+                continue
+            if not chunk:
+                break
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                yield line.decode(errors='replace').rstrip('\r')
+        if buffer and (stop_event is None or not stop_event.is_set()):
+            yield buffer.decode(errors='replace').rstrip('\r')
+    finally:
+        channel.close()
+
+
+class RemoteCommand:
+    """Comando remoto leído en streaming sobre un canal propio.
+
+    La salida estándar se entrega por trozos o líneas a medida que llega y
+    la de error se drena a la vez (conservando solo sus últimos
+    ``max_stderr`` bytes), así ningún flujo llena la ventana SSH y bloquea
+    al otro. ``timeout`` es un plazo total de reloj y ``max_output`` limita
+    los bytes de salida estándar (0 = sin límite); al superarlos se lanza
+    ``CommandTimeout`` o ``CommandOutputExceeded`` y el canal se cierra.
+    """
+
+    CHUNK_SIZE = 32768
+
+    def __init__(self, client, command: str, timeout: float = None, max_output: int = None,
+                 max_stderr: int = 65536, combine_stderr: bool = False):
+        if timeout is None:
+            timeout = getattr(settings, 'SSH_COMMAND_TIMEOUT', 60)
+        if max_output is None:
+            max_output = getattr(settings, 'SSH_MAX_OUTPUT', 16 * 1024 * 1024)
+        self.command = command
+        self.timeout = timeout
+        self.max_output = max_output
+        self.max_stderr = max_stderr
+        self.output_bytes = 0
+        self.exit_status = None
+        self._stderr = bytearray()
+        self._deadline = time.monotonic() + timeout if timeout else None
+        self.channel = client.get_transport().open_session()
+        self.channel.settimeout(0.05)
+        if combine_stderr:
+            self.channel.set_combine_stderr(True)
+        self.channel.exec_command(command)
+
+    @property
+    def stderr(self) -> str:
+        return self._stderr.decode(errors='replace')
+
+    def _drain_stderr(self):
+        while self.channel.recv_stderr_ready():
+            self._stderr += self.channel.recv_stderr(self.CHUNK_SIZE)
+            if len(self._stderr) > self.max_stderr:
+                del self._stderr[:len(self._stderr) - self.max_stderr]
+
+    def iter_chunks(self, stop_event: threading.Event = None):
+        """Iterar los trozos de salida estándar; al terminar queda fijado ``exit_status``"""
+        stdout_open = True
+        try:
+            while stdout_open or not self.channel.exit_status_ready() or self.channel.recv_stderr_ready():
+                if stop_event is not None and stop_event.is_set():
+                    return
+                if self._deadline is not None and time.monotonic() > self._deadline:
+                    raise CommandTimeout(f"Command timed out after {self.timeout}s")
+                self._drain_stderr()
+                if not stdout_open:
+                    self.channel.status_event.wait(0.05)
+                    continue
+                try:
+                    chunk = self.channel.recv(self.CHUNK_SIZE)
+                except socket.timeout:
+                    continue
+                if not chunk:
+                    stdout_open = False
+                    continue
+                self.output_bytes += len(chunk)
+                if self.max_output and self.output_bytes > self.max_output:
+                    raise CommandOutputExceeded(f"Command output exceeded {self.max_output} bytes")
+                yield chunk
+            self._drain_stderr()
+            self.exit_status = self.channel.recv_exit_status()
+        finally:
+            self.close()
+
+    def iter_lines(self, stop_event: threading.Event = None):
+        """Iterar las líneas de salida estándar a medida que llegan"""
+        buffer = b''
+        for chunk in self.iter_chunks(stop_event):
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                yield line.decode(errors='replace').rstrip('\r')
+        if buffer:
+            yield buffer.decode(errors='replace').rstrip('\r')
+
+    def close(self):
+        self.channel.close()
@@ -0,0 +1,63 @@
+import itertools
+import logging
+import time
+from django.conf import settings
+from .cache import store_stats_snapshot
+from .parsers import iter_stats_frames
+from .services import DockerService
+from .ssh import connection_pool, iter_channel_lines
+from .workers import StationWorker, StationWorkerManager
+
+logger = logging.getLogger(__name__)
+
+
+class DockerStatsStream(StationWorker):
+    """Proceso ``docker stats`` de larga duración sobre un canal persistente.
+
+    Parsea los frames a medida que llegan y publica cada uno completo como
+    instantánea en la caché. Se reconecta con espera exponencial y se detiene
+    solo si nadie lo ha usado (``touch``) en ``STATS_STREAM_IDLE_TIMEOUT``.
+    """
+
+    def __init__(self, station):
+        super().__init__(station, name=f'docker-stats-{station.pk}')
+        self.last_touched = time.monotonic()
+        self.last_frame_at = None
+
+    def touch(self):
+        """Marcar el stream como en uso"""
+        self.last_touched = time.monotonic()
+
+    def should_stop(self) -> bool:
+        idle_timeout = getattr(settings, 'STATS_STREAM_IDLE_TIMEOUT', 60)
+        return time.monotonic() - self.last_touched > idle_timeout
+
+    def session(self) -> int:
+        """Leer frames hasta el EOF o la inactividad y devolver cuántos se publicaron"""
+        frames = 0
+        client = connection_pool.acquire(self.station)
+        try:
+            channel = client.get_transport().open_session()
+            channel.settimeout(1.0)
+            channel.set_combine_stderr(True)
+            channel.exec_command(DockerService.STATS_STREAM_COMMAND)
+
+            lines = itertools.takewhile(
+                lambda _: not self.should_stop(), iter_channel_lines(channel, self._stop_event)
+            )
+            for frame in iter_stats_frames(lines):
+                store_stats_snapshot(self.station.pk, frame)
+                self.last_frame_at = time.monotonic()
+                frames += 1
+        finally:
+            connection_pool.release(client)
+        return frames
+
+
+class StatsStreamManager(StationWorkerManager):
+    """Streams de ``docker stats`` activos en este proceso, uno por estación"""
+
+    worker_class = DockerStatsStream
+
+
+stats_streams = StatsStreamManager()
@@ -1,116 +1,334 @@
-from celery import shared_task
+from celery import chord, shared_task
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from django.conf import settings
+from django.db import connections
 from django.utils import timezone
-from models import Station, Container, ActivityLog
-from services import DockerService
+from .models import Station, ActivityLog, ContainerAction
+from .actions import fail_stale_actions, run_bulk_action, run_container_action
+from .cache import get_stats_snapshot, is_events_watched, mark_station_changed, store_stats_snapshot
+from .services import (
+    DockerService, get_latest_stats, ingest_container_stats,
+    reconcile_containers, refresh_stats_snapshot
+)
+from .events import collect_events
+from .locks import cache_lock
+from .metrics import prune_metrics, rollup_metrics
+from .retention import compact_activity_logs, prune_activity_logs
+from .scheduling import claim_due_stations, schedule_next_check
+from .sharding import group_by_shard, record_shard_metrics, shard_queue
+from typing import Dict, Optional
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def monitor_stations():
-    """Tarea periódica para monitorear todas las estaciones"""
-    stations = Station.objects.all()
-    
-    for station in stations:
+
+def _fan_out(func, station_ids, sweep_timeout: float, kind: str = 'monitor') -> Dict:
+    """Ejecutar ``func(station_id)`` en paralelo con concurrencia y plazos acotados.
+
+    Cada estación dispone de ``MONITOR_STATION_TIMEOUT`` segundos desde que
+    empieza y el barrido completo de ``sweep_timeout``; las que no
+    terminan a tiempo se dan por ``timeout`` y las que no llegaron a empezar
+    por ``skipped``. ``func`` recibe como ``timeout`` el plazo que le queda
+    descontando la conexión SSH, para que el comando remoto (y con él el
+    hilo) termine dentro del plazo. Un lock por estación y tipo de barrido
+    (``<kind>-station:<id>``) evita consultar dos veces a la vez la misma
+    estación; las que ya están en curso se dan por ``busy``. Devuelve un
+    resumen agregado con el recuento por resultado.
+    """
+    max_workers = getattr(settings, 'MONITOR_MAX_WORKERS', 16)
+    station_timeout = getattr(settings, 'MONITOR_STATION_TIMEOUT', 30)
+    connect_timeout = getattr(settings, 'SSH_CONNECT_TIMEOUT', 10)
+
+    started_at = time.monotonic()
+    station_started = {}
+    results = {}
+
+    def run(station_id):
+        now = station_started[station_id] = time.monotonic()
+        budget = min(station_timeout, sweep_timeout - (now - started_at)) - connect_timeout
+        if budget <= 0:
+            return 'skipped'
         try:
-            docker_service = DockerService(station)
-            
-            # Verificar conexión
-            is_connected = docker_service.test_connection()
-            was_connected = station.is_connected
-            
-            station.is_connected = is_connected
-            station.last_check = timezone.now()
-            station.save()
-            
-            if is_connected and not was_connected:
-                ActivityLog.objects.create(
-                    station=station,
-                    level='success',
-                    message=f'Estación {station.name} reconectada'
-                )
-            elif not is_connected and was_connected:
+            with cache_lock(f'{kind}-station:{station_id}', station_timeout + 5) as acquired:
+                if not acquired:
+                    return 'busy'
+                # Un mensaje por estación y tipo de evento aunque cambien cientos de contenedores
+                with collect_events():
+                    return func(station_id, timeout=budget)
+        finally:
+            # Cada hilo abre su propia conexión a la base de datos
+            connections.close_all()
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(station_ids))),
+        thread_name_prefix='station-poll'
+    )
+    futures = {executor.submit(run, station_id): station_id for station_id in station_ids}
+    pending = set(futures)
+    try:
+        while pending:
+            remaining = sweep_timeout - (time.monotonic() - started_at)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=min(1.0, remaining), return_when=FIRST_COMPLETED)
+            for future in done:
+                station_id = futures[future]
+                try:
+                    results[station_id] = future.result()
+                except Exception as e:
+                    logger.error(f"Error polling station {station_id}: {str(e)}")
+                    results[station_id] = 'error'
+
+            now = time.monotonic()
+            for future in list(pending):
+                station_id = futures[future]
+                if now - station_started.get(station_id, now) > station_timeout:
+                    logger.warning(f"Station {station_id} exceeded {station_timeout}s deadline")
+                    results[station_id] = 'timeout'
+                    pending.discard(future)
+    finally:
+        for future in pending:
+            results[futures[future]] = 'skipped' if future.cancel() else 'timeout'
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    summary = dict(Counter(results.values()))
+    summary['stations'] = len(station_ids)
+    summary['elapsed'] = round(time.monotonic() - started_at, 3)
+    return summary
+
+
+def monitor_station(station_id, timeout: Optional[float] = None) -> str:
+    """Verificar una estación, sincronizar sus contenedores y estadísticas y programar la siguiente consulta"""
+    station = Station.objects.get(id=station_id)
+    try:
+        docker_service = DockerService(station)
+
+        # Conexión, inventario y estadísticas en un solo comando remoto; si un
+        # watcher de docker events mantiene el inventario no hace falta listarlo
+        watched = is_events_watched(station.id)
+        probe = docker_service.probe(include_containers=not watched, timeout=timeout)
+        is_connected = probe['connected']
+        was_connected = station.is_connected
+        changed = is_connected != was_connected
+        outcome = 'connected' if is_connected else 'disconnected'
+
+        if is_connected and not was_connected:
+            ActivityLog.objects.create(
+                station=station,
+                level='success',
+                message=f'Estación {station.name} reconectada'
+            )
+        elif not is_connected and was_connected:
+            ActivityLog.objects.create(
+                station=station,
+                level='warning',
+                message=f'Estación {station.name} desconectada'
+            )
+
+        # Si está conectada, actualizar contenedores
+        if is_connected:
+            try:
+                containers_data = probe['containers']
+                if not watched:
+                    if containers_data is None:
+                        raise Exception(f"Failed to get containers: {probe['error']}")
+
+                    result = reconcile_containers(station, containers_data)
+                    changed = changed or any(result.values())
+
+                if probe['stats'] is not None:
+                    store_stats_snapshot(station.id, probe['stats'])
+                    ingest_container_stats(station, probe['stats'])
+
+            except Exception as e:
+                logger.error(f"Error updating containers for station {station.id}: {str(e)}")
                 ActivityLog.objects.create(
                     station=station,
-                    level='warning',
-                    message=f'Estación {station.name} desconectada'
+                    level='error',
+                    message=f'Error actualizando contenedores: {str(e)}'
                 )
-            
-            # Si está conectada, actualizar contenedores
-            if is_connected:
-                try:
-                    containers_data = docker_service.get_containers()
-                    
-                    # Actualizar contenedores existentes
-                    for container_data in containers_data:
-                        container, created = Container.objects.update_or_create(
-                            station=station,
-                            name=container_data['name'],
-                            defaults={
-                                'container_id': container_data['id'],
-                                'image': container_data['image'],
-                                'status': container_data['status'],
-                                'ports': container_data['ports'],
-                                'created_time': container_data.get('created', '')
-                            }
-                        )
-                        
-                        if created:
-                            ActivityLog.objects.create(
-                                station=station,
-                                container=container,
-                                level='info',
-                                message=f'Nuevo contenedor detectado: {container.name}'
-                            )
-                    
-                    # Eliminar contenedores que ya no existen
-                    existing_names = [c['name'] for c in containers_data]
-                    removed_containers = station.containers.exclude(name__in=existing_names)
-                    
-                    for container in removed_containers:
-                        ActivityLog.objects.create(
-                            station=station,
-                            level='warning',
-                            message=f'Contenedor eliminado: {container.name}'
-                        )
-                        container.delete()
-                        
-                except Exception as e:
-                    logger.error(f"Error updating containers for station {station.id}: {str(e)}")
-                    ActivityLog.objects.create(
-                        station=station,
-                        level='error',
-                        message=f'Error actualizando contenedores: {str(e)}'
-                    )
-        
-        except Exception as e:
-            logger.error(f"Error monitoring station {station.id}: {str(e)}")
-            station.is_connected = False
-            station.last_check = timezone.now()
-            station.save()
+                outcome = 'error'
+
+        if changed:
+            mark_station_changed(station.id, getattr(settings, 'MONITOR_RECENT_CHANGE_WINDOW', 300))
+        station.is_connected = is_connected
+        station.last_check = timezone.now()
+        # Un error al guardar o parsear no es un fallo de conexión: sin backoff
+        schedule_next_check(station, is_connected, now=station.last_check)
+        station.save()
+        return outcome
+
+    except Exception as e:
+        logger.error(f"Error monitoring station {station.id}: {str(e)}")
+        station.is_connected = False
+        station.last_check = timezone.now()
+        schedule_next_check(station, False, now=station.last_check)
+        station.save()
+        return 'error'
+
+
+def update_station_stats(station_id, timeout: Optional[float] = None) -> str:
+    """Actualizar estadísticas de los contenedores de una estación"""
+    station = Station.objects.get(id=station_id)
+    try:
+        ingest_container_stats(station, get_latest_stats(station, timeout=timeout))
+        return 'updated'
+
+    except Exception as e:
+        logger.error(f"Error updating stats for station {station.id}: {str(e)}")
+        return 'error'
+
+
+def _poll_shard(kind: str, func, shard: int, station_ids, sweep_timeout: float) -> Dict:
+    """Consultar las estaciones de un shard y guardar el resumen del barrido"""
+    summary = _fan_out(func, station_ids, sweep_timeout, kind=kind)
+    record_shard_metrics(kind, shard, summary)
+    return dict(summary, shard=shard)
+
+
+def _dispatch_shards(kind: str, task, station_ids, expires: float) -> Dict:
+    """Repartir las estaciones entre las colas de sus shards y cerrar el barrido con un chord"""
+    shards = group_by_shard(station_ids)
+    if not shards:
+        return {'stations': 0, 'shards': 0}
+    header = [
+        task.si(shard, ids).set(queue=shard_queue(shard), expires=expires)
+        for shard, ids in sorted(shards.items())
+    ]
+    chord(header)(finish_sweep.s(kind))
+    return {'stations': len(station_ids), 'shards': len(shards)}
+
+
+@shared_task
+def poll_monitor_shard(shard, station_ids):
+    """Verificar las estaciones de un shard (cola ``monitor.<shard>``)"""
+    sweep_timeout = getattr(settings, 'MONITOR_SWEEP_TIMEOUT', 55)
+    return _poll_shard('monitor', monitor_station, shard, station_ids, sweep_timeout)
+
+
+@shared_task
+def poll_stats_shard(shard, station_ids):
+    """Actualizar las estadísticas de las estaciones de un shard (cola ``monitor.<shard>``)"""
+    sweep_timeout = getattr(settings, 'STATS_SWEEP_TIMEOUT', 25)
+    return _poll_shard('stats', update_station_stats, shard, station_ids, sweep_timeout)
+
+
+@shared_task
+def finish_sweep(summaries, kind):
+    """Callback del chord: agregar los resúmenes de todos los shards de un barrido"""
+    totals = Counter()
+    elapsed = 0.0
+    for summary in summaries:
+        elapsed = max(elapsed, summary.get('elapsed', 0.0))
+        totals.update({key: value for key, value in summary.items() if key not in ('shard', 'elapsed')})
+    result = dict(totals, shards=len(summaries), elapsed=elapsed)
+    logger.info(f"{kind} sweep finished: {result}")
+    return result
+
+
+@shared_task
+def dispatch_station_checks():
+    """Tick frecuente del planificador: consultar solo las estaciones cuya consulta ha vencido.
+
+    Cada estación lleva su propio ``next_check`` (ver ``stations.scheduling``):
+    las inalcanzables retroceden exponencialmente, las que tienen espectadores
+    o cambios recientes se consultan más a menudo y el jitter reparte las
+    consultas a lo largo del intervalo en vez de lanzarlas todas a la vez.
+    Las estaciones reservadas se reparten entre los shards (ver
+    ``stations.sharding``), cada uno en su propia cola de workers.
+    """
+    sweep_timeout = getattr(settings, 'MONITOR_SWEEP_TIMEOUT', 55)
+    return _dispatch_shards('monitor', poll_monitor_shard, claim_due_stations(), sweep_timeout)
+
+
+@shared_task
+def monitor_stations():
+    """Consultar todas las estaciones a la vez (barrido manual; el beat usa ``dispatch_station_checks``)"""
+    sweep_timeout = getattr(settings, 'MONITOR_SWEEP_TIMEOUT', 55)
+    station_ids = list(Station.objects.values_list('id', flat=True))
+    return _dispatch_shards('monitor', poll_monitor_shard, station_ids, sweep_timeout)
+
 
 @shared_task
 def update_container_stats():
-    """Actualizar estadísticas de contenedores cada minuto"""
-    stations = Station.objects.filter(is_connected=True)
-    
-    for station in stations:
-        try:
-            docker_service = DockerService(station)
-            stats = docker_service.get_containers_stats()
-            
-            for container_name, container_stats in stats.items():
-                try:
-                    container = station.containers.get(name=container_name)
-                    container.cpu_usage = container_stats.get('cpu_percent', 0)
-                    container.memory_usage = container_stats.get('memory_usage', 0)
-                    container.memory_limit = container_stats.get('memory_limit', 0)
-                    container.network_rx = container_stats.get('network_rx', 0)
-                    container.network_tx = container_stats.get('network_tx', 0)
-                    container.save()
-                except Container.DoesNotExist:
-                    continue
-                    
-        except Exception as e:
-            logger.error(f"Error updating stats for station {station.id}: {str(e)}")
-        
\ No newline at end of file
+    """Actualizar las estadísticas de las estaciones conectadas, repartidas por shard"""
+    sweep_timeout = getattr(settings, 'STATS_SWEEP_TIMEOUT', 25)
+    # Las estaciones con una instantánea reciente (consulta adaptativa,
+    # streams o difusión por WebSocket) no necesitan otra consulta
+    max_age = getattr(settings, 'STATS_SWEEP_INTERVAL', 30)
+    station_ids = [
+        station_id
+        for station_id in Station.objects.filter(is_connected=True).values_list('id', flat=True)
+        if get_stats_snapshot(station_id, max_age=max_age) is None
+    ]
+    return _dispatch_shards('stats', poll_stats_shard, station_ids, sweep_timeout)
+
+
+@shared_task
+def refresh_station_stats(station_id, lock_token=None):
+    """Refrescar en segundo plano la instantánea de estadísticas de una estación"""
+    station = Station.objects.get(id=station_id)
+    snapshot = refresh_stats_snapshot(station, lock_token=lock_token)
+    return {'station': station_id, 'containers': len(snapshot['stats'])}
+
+
+@shared_task
+def rollup_container_metrics():
+    """Agregar las muestras recientes en intervalos de 1 minuto y 1 hora"""
+    return rollup_metrics()
+
+
+@shared_task
+def prune_container_metrics():
+    """Eliminar métricas fuera de su periodo de retención"""
+    deleted = prune_metrics()
+    logger.info(f"Pruned container metrics: {deleted}")
+    return deleted
+
+
+@shared_task
+def maintain_activity_logs():
+    """Compactar entradas repetidas y eliminar/archivar las que superan su retención"""
+    with cache_lock('maintain-activity-logs', 6 * 3600) as acquired:
+        if not acquired:
+            logger.warning("Previous maintain_activity_logs run still in progress, skipping")
+            return {'skipped': True}
+
+        result = {
+            'compacted': compact_activity_logs(),
+            'pruned': prune_activity_logs(),
+        }
+        logger.info(f"Activity log maintenance finished: {result}")
+        return result
+
+
+@shared_task(acks_late=True)
+def execute_container_action(action_id):
+    """Ejecutar una acción de contenedor encolada desde la API (cola ``actions``)"""
+    container_action = ContainerAction.objects.select_related(
+        'container__station', 'executed_by'
+    ).get(id=action_id)
+    return run_container_action(container_action)
+
+
+@shared_task(acks_late=True)
+def execute_bulk_action(action_ids, parallelism=None, batch_size=None):
+    """Ejecutar una acción en lote: un comando por estación (cola ``actions``)"""
+    container_actions = list(ContainerAction.objects.select_related(
+        'container__station', 'executed_by'
+    ).filter(id__in=action_ids))
+    summary = run_bulk_action(container_actions, parallelism=parallelism, batch_size=batch_size)
+    logger.info(
+        f"Bulk action finished: {summary['succeeded']} succeeded, "
+        f"{summary['failed']} failed on {summary['stations']} stations"
+    )
+    return summary
+
+
+@shared_task
+def fail_stale_container_actions():
+    """Cerrar como fallidas las acciones que se quedaron en ``executing`` al morir su worker"""
+    failed = fail_stale_actions()
+    return {'failed': failed}
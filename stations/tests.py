@@ -1,3 +1,746 @@
-from django.test import TestCase
+import gzip
+import json
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from .breaker import CLOSED, HALF_OPEN, OPEN, StationUnreachable, circuit_breaker
+from .consumers import FleetConsumer, StationStatsConsumer
+from .metrics import HOUR, MINUTE, choose_resolution, rollup_metrics
+from .models import ActivityLog, Station, Container, ContainerMetric, ContainerMetricRollup
+from .parsers import iter_stats_frames, normalize_status, parse_containers, parse_size, parse_stats
+from .retention import compact_activity_logs, prune_activity_logs
+from .services import reconcile_containers
+from .ssh import CommandOutputExceeded, CommandTimeout, RemoteCommand, SSHConnectionPool
 
-# Create your tests here.
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StationQueryCountTests(APITestCase):
+    """El número de consultas de /api/stations/ no depende del número de estaciones"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='operator', password='secret')
+        self.client.force_authenticate(self.user)
+
+    def create_stations(self, count, containers=3):
+        start = Station.objects.count()
+        for index in range(start, start + count):
+            station = Station.objects.create(
+                name=f'station-{index}',
+                ip_address=f'10.0.{index // 250}.{index % 250 + 1}',
+                ssh_user='docker',
+                ssh_password='secret',
+                created_by=self.user
+            )
+            Container.objects.bulk_create([
+                Container(
+                    station=station,
+                    name=f'container-{number}',
+                    container_id=f'{index}-{number}',
+                    image='nginx:latest',
+                    status='running' if number % 2 == 0 else 'exited'
+                )
+                for number in range(containers)
+            ])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_list_query_count_is_constant(self):
+        self.create_stations(2)
+        few, _ = self.count_queries('/api/stations/')
+
+        self.create_stations(20, containers=10)
+        many, response = self.count_queries('/api/stations/')
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.data), 22)
+
+    def test_list_counts_are_annotated(self):
+        self.create_stations(1, containers=5)
+        _, response = self.count_queries('/api/stations/')
+
+        station = response.data[0]
+        self.assertEqual(station['container_count'], 5)
+        self.assertEqual(station['running_containers'], 3)
+        self.assertEqual(len(station['containers']), 5)
+
+    def test_detail_query_count_is_constant(self):
+        self.create_stations(1, containers=2)
+        small = Station.objects.get()
+        few, _ = self.count_queries(f'/api/stations/{small.pk}/')
+
+        self.create_stations(1, containers=50)
+        large = Station.objects.exclude(pk=small.pk).get()
+        many, response = self.count_queries(f'/api/stations/{large.pk}/')
+
+        self.assertEqual(few, many)
+        self.assertEqual(response.data['container_count'], 50)
+
+    def test_summary_fields_skip_nested_containers(self):
+        self.create_stations(5)
+        full, _ = self.count_queries('/api/stations/')
+        summary, response = self.count_queries(
+            '/api/stations/?fields=id,name,is_connected,container_count,running_containers'
+        )
+
+        self.assertLess(summary, full)
+        self.assertEqual(
+            set(response.data[0]),
+            {'id', 'name', 'is_connected', 'container_count', 'running_containers'}
+        )
+        self.assertEqual(response.data[0]['container_count'], 3)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReconcileContainersTests(TestCase):
+    """La sincronización del inventario usa consultas en bloque y conserva las claves primarias"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='operator', password='secret')
+
+    def create_station(self, name):
+        return Station.objects.create(
+            name=name, ip_address=f'10.0.0.{Station.objects.count() + 1}', ssh_user='docker', ssh_password='secret', created_by=self.user
+        )
+
+    @staticmethod
+    def inventory(count, status='running', start=0):
+        return [
+            {
+                'id': f'{number:012x}',
+                'name': f'container-{number}',
+                'image': 'nginx:latest',
+                'status': status,
+                'ports': '80/tcp',
+                'created': '2024-01-01 00:00:00',
+            }
+            for number in range(start, start + count)
+        ]
+
+    def count_queries(self, station, containers_data):
+        with CaptureQueriesContext(connection) as queries:
+            reconcile_containers(station, containers_data, user=self.user)
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        small = self.create_station('small')
+        large = self.create_station('large')
+
+        self.assertEqual(
+            self.count_queries(small, self.inventory(5)),
+            self.count_queries(large, self.inventory(50))
+        )
+        # Altas, cambios y bajas a la vez
+        self.assertEqual(
+            self.count_queries(small, self.inventory(3, 'exited') + self.inventory(2, start=10)),
+            self.count_queries(large, self.inventory(30, 'exited') + self.inventory(20, start=100))
+        )
+
+    def test_existing_containers_keep_primary_key(self):
+        station = self.create_station('edge')
+        reconcile_containers(station, self.inventory(3), user=self.user)
+        before = dict(station.containers.values_list('name', 'pk'))
+
+        reconcile_containers(station, self.inventory(2, 'exited') + self.inventory(1, start=5), user=self.user)
+
+        after = {container.name: container for container in station.containers.all()}
+        self.assertEqual(set(after), {'container-0', 'container-1', 'container-5'})
+        for name in ('container-0', 'container-1'):
+            self.assertEqual(after[name].pk, before[name])
+            self.assertEqual(after[name].status, 'exited')
+        self.assertTrue(ActivityLog.objects.filter(station=station, message__endswith='container-5').exists())
+        self.assertTrue(ActivityLog.objects.filter(station=station, message__endswith='container-2').exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ActivityLogPaginationTests(APITestCase):
+    """/api/logs/ pagina por cursor sobre (created_at, id) sin repetir ni saltar filas"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='operator', password='secret')
+        other = User.objects.create_user(username='other', password='secret')
+        self.client.force_authenticate(self.user)
+        self.station = Station.objects.create(
+            name='own', ip_address='10.0.0.1', ssh_user='docker', ssh_password='secret', created_by=self.user
+        )
+        foreign = Station.objects.create(
+            name='foreign', ip_address='10.0.0.2', ssh_user='docker', ssh_password='secret', created_by=other
+        )
+        ActivityLog.objects.bulk_create(
+            [ActivityLog(station=self.station, level='info', message=f'entry {index}') for index in range(25)]
+            + [ActivityLog(station=foreign, level='info', message='foreign')]
+        )
+        # Marcas de tiempo repetidas: el id desempata dentro de cada una
+        now = timezone.now()
+        for index, pk in enumerate(ActivityLog.objects.filter(station=self.station).values_list('id', flat=True)):
+            ActivityLog.objects.filter(pk=pk).update(created_at=now - timedelta(minutes=index // 4))
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(entry['id'] for entry in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def expected(self):
+        return list(
+            ActivityLog.objects.filter(station=self.station).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def test_pages_cover_every_row_once(self):
+        self.assertEqual(self.walk('/api/logs/?page_size=7'), self.expected())
+
+    def test_new_rows_do_not_shift_pages(self):
+        response = self.client.get('/api/logs/?page_size=10')
+        first = [entry['id'] for entry in response.data['results']]
+        ActivityLog.objects.create(station=self.station, level='info', message='newer')
+
+        rest = self.walk(response.data['next'])
+        self.assertEqual(first + rest, self.expected()[1:])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/logs/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ACTIVITY_LOG_RETENTION_DAYS={'info': 14, 'error': 90},
+    ACTIVITY_LOG_BATCH_SIZE=2,
+    ACTIVITY_LOG_BATCH_PAUSE=0,
+    ACTIVITY_LOG_COMPACT_AFTER=24,
+    ACTIVITY_LOG_COMPACT_MIN_REPEATS=5,
+)
+class ActivityLogRetentionTests(TestCase):
+    """Borrado por retención (con archivo opcional) y compactación de entradas repetidas"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='operator', password='secret')
+        self.station = Station.objects.create(
+            name='edge', ip_address='10.0.0.1', ssh_user='docker', ssh_password='secret', created_by=user
+        )
+        self.now = timezone.now()
+
+    def log(self, message, age, level='info', count=1):
+        logs = ActivityLog.objects.bulk_create(
+            [ActivityLog(station=self.station, level=level, message=message) for _ in range(count)]
+        )
+        ActivityLog.objects.filter(pk__in=[log.pk for log in logs]).update(created_at=self.now - age)
+
+    def test_prune_respects_retention_per_level(self):
+        self.log('old info', timedelta(days=20), count=5)
+        self.log('recent info', timedelta(days=1))
+        self.log('old error', timedelta(days=20), level='error')
+
+        deleted = prune_activity_logs(now=self.now)
+
+        self.assertEqual(deleted, {'info': 5, 'error': 0})
+        self.assertEqual(
+            sorted(ActivityLog.objects.values_list('message', flat=True)), ['old error', 'recent info']
+        )
+
+    def test_prune_archives_before_deleting(self):
+        self.log('old info', timedelta(days=20), count=3)
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            with override_settings(ACTIVITY_LOG_ARCHIVE_DIR=archive_dir):
+                prune_activity_logs(now=self.now)
+            archives = list(Path(archive_dir).glob('*.jsonl.gz'))
+            self.assertEqual(len(archives), 1)
+            with gzip.open(archives[0], 'rt', encoding='utf-8') as archive:
+                rows = [json.loads(line) for line in archive]
+
+        self.assertEqual([row['message'] for row in rows], ['old info'] * 3)
+        self.assertFalse(ActivityLog.objects.exists())
+
+    def test_compaction_collapses_repeats_into_a_counted_entry(self):
+        day = timedelta(days=2)
+        self.log('Estación reconectada', day, count=7)
+        self.log('Pocas repeticiones', day, count=3)
+        self.log('Estación reconectada', timedelta(hours=1), count=6)
+
+        result = compact_activity_logs(now=self.now)
+
+        self.assertEqual(result, {'groups': 1, 'removed': 6})
+        old = ActivityLog.objects.get(message='Estación reconectada', created_at=self.now - day)
+        self.assertEqual(old.occurrences, 7)
+        self.assertEqual(ActivityLog.objects.filter(message='Pocas repeticiones').count(), 3)
+        self.assertEqual(
+            ActivityLog.objects.filter(message='Estación reconectada', created_at__gt=self.now - day).count(), 6
+        )
+
+
+@override_settings(
+    METRICS_RAW_RETENTION=24 * 3600,
+    METRICS_MINUTE_RETENTION=7 * 24 * 3600,
+    METRICS_HOUR_RETENTION=365 * 24 * 3600,
+    METRICS_ROLLUP_LOOKBACK=5,
+    METRICS_MAX_POINTS=1000,
+)
+class MetricsRollupTests(TestCase):
+    """Agregados por minuto y hora y elección de resolución según la retención"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='operator', password='secret')
+        station = Station.objects.create(
+            name='edge', ip_address='10.0.0.1', ssh_user='docker', ssh_password='secret', created_by=user
+        )
+        self.container = Container.objects.create(
+            station=station, name='web', container_id='abc', image='nginx:latest', status='running'
+        )
+        self.now = datetime(2024, 1, 1, 11, 0, 30, tzinfo=dt_timezone.utc)
+
+    @staticmethod
+    def at(minute, second=0):
+        return datetime(2024, 1, 1, 10, minute, second, tzinfo=dt_timezone.utc)
+
+    def sample(self, ts, cpu, memory, network):
+        ContainerMetric.objects.create(
+            container=self.container, ts=ts,
+            cpu_usage=cpu, memory_usage=memory, network_rx=network, network_tx=network * 10,
+        )
+
+    def rollups(self, resolution):
+        return list(
+            ContainerMetricRollup.objects.filter(resolution=resolution).order_by('ts')
+            .values('ts', 'samples', 'cpu_min', 'cpu_avg', 'cpu_max', 'memory_avg', 'network_rx', 'network_tx')
+        )
+
+    def test_rollup_values(self):
+        self.sample(self.at(57), 10, 100, 1)
+        self.sample(self.at(57, 20), 20, 200, 2)
+        self.sample(self.at(57, 40), 30, 300, 3)
+        self.sample(self.at(58), 70, 700, 5)
+        # Minuto aún abierto: no se agrega
+        self.sample(self.now.replace(second=10), 99, 999, 9)
+
+        self.assertEqual(rollup_metrics(now=self.now), {'minute_rollups': 2, 'hour_rollups': 1})
+
+        minutes = self.rollups(MINUTE)
+        self.assertEqual([row['samples'] for row in minutes], [3, 1])
+        self.assertEqual(
+            (minutes[0]['cpu_min'], minutes[0]['cpu_avg'], minutes[0]['cpu_max']), (10, 20, 30)
+        )
+        self.assertEqual((minutes[0]['memory_avg'], minutes[0]['network_rx'], minutes[0]['network_tx']), (200, 3, 30))
+
+        [hour] = self.rollups(HOUR)
+        self.assertEqual(hour['ts'], datetime(2024, 1, 1, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(hour['samples'], 4)
+        # Media ponderada por muestras: (20 * 3 + 70) / 4, no (20 + 70) / 2
+        self.assertAlmostEqual(hour['cpu_avg'], 32.5)
+        self.assertAlmostEqual(hour['memory_avg'], 325)
+        self.assertEqual((hour['cpu_min'], hour['cpu_max'], hour['network_rx']), (10, 70, 5))
+
+    def test_rollup_is_idempotent(self):
+        self.sample(self.at(57), 10, 100, 1)
+        self.sample(self.at(58), 70, 700, 5)
+        rollup_metrics(now=self.now)
+        first = (self.rollups(MINUTE), self.rollups(HOUR))
+
+        rollup_metrics(now=self.now)
+        self.assertEqual((self.rollups(MINUTE), self.rollups(HOUR)), first)
+
+        # Una muestra tardía dentro de la ventana actualiza el intervalo existente
+        self.sample(self.at(58, 30), 30, 300, 6)
+        rollup_metrics(now=self.now)
+        minutes = self.rollups(MINUTE)
+        self.assertEqual(len(minutes), 2)
+        self.assertEqual((minutes[1]['samples'], minutes[1]['cpu_avg']), (2, 50))
+        self.assertEqual(self.rollups(HOUR)[0]['samples'], 3)
+
+    def test_choose_resolution(self):
+        cases = [
+            # (rango, step, resolución)
+            (timedelta(hours=1), None, 0),
+            (timedelta(hours=1), 60, MINUTE),
+            (timedelta(hours=1), 3600, HOUR),
+            (timedelta(days=3), None, MINUTE),
+            (timedelta(days=3), 10, MINUTE),  # ya no hay muestras en bruto
+            (timedelta(days=3), 3600, HOUR),
+            (timedelta(days=30), None, HOUR),
+            (timedelta(days=30), 60, HOUR),  # los minutos ya no llegan al inicio
+        ]
+        for span, step, expected in cases:
+            with self.subTest(span=span, step=step):
+                self.assertEqual(choose_resolution(self.now - span, self.now, step, now=self.now), expected)
+
+
+class DockerOutputParsingTests(SimpleTestCase):
+    """Parseo de la salida JSON de docker ps/stats"""
+
+    def ps_line(self, index, **fields):
+        record = {
+            'Names': f'app-{index}',
+            'ID': f'{index:064x}',
+            'Image': 'nginx:latest',
+            'State': 'running',
+            'Status': 'Up 2 hours',
+            'Ports': '0.0.0.0:80->80/tcp, :::80->80/tcp',
+            'CreatedAt': '2024-01-01 00:00:00 +0000 UTC',
+        }
+        record.update(fields)
+        return json.dumps(record)
+
+    def stats_line(self, index):
+        return json.dumps({
+            'Name': f'app-{index}',
+            'CPUPerc': '12.50%',
+            'MemUsage': '1.5GiB / 2GiB',
+            'NetIO': '1.2kB / 3.4MB',
+            'BlockIO': '0B / 0B',
+        })
+
+    def test_sizes_distinguish_decimal_and_binary_units(self):
+        self.assertEqual(parse_size('0B'), 0)
+        self.assertEqual(parse_size('512B'), 512)
+        self.assertEqual(parse_size('1.5kB'), 1500)
+        self.assertEqual(parse_size('1.5KiB'), 1536)
+        self.assertEqual(parse_size('2MB'), 2000000)
+        self.assertEqual(parse_size('2MiB'), 2 * 1024 ** 2)
+        self.assertEqual(parse_size('1GiB'), 1024 ** 3)
+        self.assertEqual(parse_size('--'), 0)
+
+    def test_status_normalization(self):
+        self.assertEqual(normalize_status('restarting'), 'restarting')
+        self.assertEqual(normalize_status('created'), 'created')
+        self.assertEqual(normalize_status('', 'Up 3 minutes (Paused)'), 'paused')
+        self.assertEqual(normalize_status('', 'Exited (0) 2 days ago'), 'exited')
+        self.assertEqual(normalize_status('', 'Dead'), 'dead')
+        self.assertEqual(normalize_status('', 'something new'), 'unknown')
+        valid = {value for value, _ in Container.STATUS_CHOICES}
+        for state in ('running', 'paused', 'restarting', 'exited', 'dead', 'created', 'removing', 'weird'):
+            self.assertIn(normalize_status(state), valid)
+
+    def test_pipes_in_fields_do_not_break_parsing(self):
+        containers = parse_containers([self.ps_line(1, Names='a|b', Ports='80|81'), 'not json', '{broken'])
+        self.assertEqual(len(containers), 1)
+        self.assertEqual(containers[0]['name'], 'a|b')
+        self.assertEqual(containers[0]['ports'], '80|81')
+
+    def test_stats_fields(self):
+        stats = parse_stats([self.stats_line(1)])['app-1']
+        self.assertEqual(stats['cpu_percent'], 12.5)
+        self.assertEqual(stats['memory_usage'], int(1.5 * 1024 ** 3))
+        self.assertEqual(stats['memory_limit'], 2 * 1024 ** 3)
+        self.assertEqual(stats['network_rx'], 1200)
+        self.assertEqual(stats['network_tx'], 3400000)
+
+    def test_stats_frames_with_old_and_new_docker_layouts(self):
+        lines = [self.stats_line(index) for index in range(3)]
+        # Docker < 25: cada refresco borra la pantalla y vuelve al inicio
+        old = []
+        for _ in range(2):
+            old += ['\x1b[2J\x1b[H' + lines[0]] + lines[1:]
+        # Docker 25+: vuelve al inicio, borra cada línea con \x1b[K y el resto con \x1b[J
+        new = []
+        for _ in range(2):
+            new += ['\x1b[H' + lines[0] + '\x1b[K'] + [line + '\x1b[K' for line in lines[1:]] + ['\x1b[J']
+
+        for layout in (old, new):
+            frames = list(iter_stats_frames(layout))
+            self.assertEqual(len(frames), 2)
+            for frame in frames:
+                self.assertEqual(set(frame), {'app-0', 'app-1', 'app-2'})
+
+    def test_throughput_on_10k_lines(self):
+        ps_lines = [self.ps_line(index) for index in range(10000)]
+        stats_lines = [self.stats_line(index) for index in range(10000)]
+
+        started = time.perf_counter()
+        containers = parse_containers(ps_lines)
+        stats = parse_stats(stats_lines)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(containers), 10000)
+        self.assertEqual(len(stats), 10000)
+        # Holgado para CI: en una máquina normal tarda del orden de 0,1 s
+        self.assertLess(elapsed, 2.0)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class ConsumerAuthTests(TransactionTestCase):
+    """Los sockets solo admiten usuarios autenticados y sus propias estaciones"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='operator', password='secret')
+        other = User.objects.create_user(username='other', password='secret')
+        self.own = Station.objects.create(
+            name='own', ip_address='10.0.0.1', ssh_user='docker', ssh_password='secret', created_by=self.user
+        )
+        self.foreign = Station.objects.create(
+            name='foreign', ip_address='10.0.0.2', ssh_user='docker', ssh_password='secret', created_by=other
+        )
+
+    def communicator(self, user):
+        communicator = WebsocketCommunicator(FleetConsumer.as_asgi(), '/ws/fleet/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_anonymous_socket_is_rejected(self):
+        async def run():
+            for user in (None, AnonymousUser()):
+                communicator = self.communicator(user)
+                connected, code = await communicator.connect()
+                self.assertFalse(connected)
+                self.assertEqual(code, 4401)
+        async_to_sync(run)()
+
+    def test_subscribe_only_to_owned_stations(self):
+        async def run():
+            communicator = self.communicator(self.user)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_json_to({
+                'type': 'subscribe',
+                'stations': [self.own.pk, self.foreign.pk, 999],
+                'events': ['activity'],
+            })
+            error = await communicator.receive_json_from()
+            self.assertEqual(error['type'], 'error')
+            self.assertIn(str(self.foreign.pk), error['error'])
+            subscriptions = await communicator.receive_json_from()
+            self.assertEqual(subscriptions['subscriptions'], [{'station': self.own.pk, 'event': 'activity'}])
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_stats_socket_requires_owned_station(self):
+        async def run():
+            cases = [(AnonymousUser(), self.own.pk, 4401), (self.user, self.foreign.pk, 4404), (self.user, 999, 4404)]
+            for user, station_id, expected in cases:
+                communicator = WebsocketCommunicator(
+                    StationStatsConsumer.as_asgi(), f'/ws/stations/{station_id}/stats/'
+                )
+                communicator.scope['user'] = user
+                communicator.scope['url_route'] = {'kwargs': {'station_id': station_id}}
+                connected, code = await communicator.connect()
+                self.assertFalse(connected)
+                self.assertEqual(code, expected)
+
+        with mock.patch('stations.consumers.broadcaster.subscribe') as subscribe:
+            async_to_sync(run)()
+        subscribe.assert_not_called()
+
+
+class FakeChannel:
+    """Canal SSH simulado con una ventana de ``WINDOW`` bytes para la salida de error.
+
+    Como un proceso real, el remoto escribe primero en stderr y no produce
+    stdout hasta que se ha leído todo lo que no cabe en la ventana.
+    """
+
+    WINDOW = 1024
+
+    def __init__(self, stdout_chunks=(), stderr=b'', exit_status=0, hang=False):
+        self.stdout_chunks = list(stdout_chunks)
+        self.stderr_pending = bytearray(stderr)
+        self.stderr_window = bytearray()
+        self.exit_status = exit_status
+        self.hang = hang
+        self.closed = False
+        self.status_event = threading.Event()
+
+    def get_transport(self):
+        return self
+
+    def open_session(self):
+        return self
+
+    def settimeout(self, timeout):
+        pass
+
+    def set_combine_stderr(self, combine):
+        pass
+
+    def exec_command(self, command):
+        pass
+
+    def _write_stderr(self):
+        room = self.WINDOW - len(self.stderr_window)
+        self.stderr_window += self.stderr_pending[:room]
+        del self.stderr_pending[:room]
+
+    def recv_stderr_ready(self):
+        self._write_stderr()
+        return bool(self.stderr_window)
+
+    def recv_stderr(self, size):
+        data = bytes(self.stderr_window[:size])
+        del self.stderr_window[:size]
+        return data
+
+    def recv(self, size):
+        self._write_stderr()
+        if self.stderr_pending or (self.hang and not self.stdout_chunks):
+            # Bloqueado escribiendo stderr (o sin salida todavía)
+            raise socket.timeout()
+        if self.stdout_chunks:
+            return self.stdout_chunks.pop(0)
+        return b''
+
+    def exit_status_ready(self):
+        ready = not self.hang and not self.stdout_chunks and not self.stderr_pending
+        if ready:
+            self.status_event.set()
+        return ready
+
+    def recv_exit_status(self):
+        return self.exit_status
+
+    def close(self):
+        self.closed = True
+
+
+class RemoteCommandTests(SimpleTestCase):
+    """Lectura en streaming de comandos remotos sin bloqueos entre stdout y stderr"""
+
+    def test_large_stderr_does_not_block_stdout(self):
+        channel = FakeChannel([b'out-1\n', b'out-2\n'], stderr=b'e' * (FakeChannel.WINDOW * 10), exit_status=1)
+        remote = RemoteCommand(channel, 'noisy', timeout=5, max_stderr=100)
+
+        self.assertEqual(list(remote.iter_lines()), ['out-1', 'out-2'])
+        self.assertEqual(remote.stderr, 'e' * 100)
+        self.assertEqual(remote.exit_status, 1)
+        self.assertTrue(channel.closed)
+
+    def test_timeout(self):
+        channel = FakeChannel(hang=True)
+        remote = RemoteCommand(channel, 'sleep 60', timeout=0.2)
+
+        with self.assertRaises(CommandTimeout):
+            list(remote.iter_chunks())
+        self.assertTrue(channel.closed)
+
+    def test_output_limit(self):
+        channel = FakeChannel([b'x' * 100] * 3)
+        remote = RemoteCommand(channel, 'cat big', timeout=5, max_output=150)
+
+        chunks = []
+        with self.assertRaises(CommandOutputExceeded):
+            for chunk in remote.iter_chunks():
+                chunks.append(chunk)
+        self.assertEqual(chunks, [b'x' * 100])
+        self.assertTrue(channel.closed)
+
+    def test_lines_split_across_chunks(self):
+        channel = FakeChannel([b'al', b'pha\nbe', b'ta\r\ngam', b'ma'])
+        remote = RemoteCommand(channel, 'echo', timeout=5)
+
+        self.assertEqual(list(remote.iter_lines()), ['alpha', 'beta', 'gamma'])
+
+    def test_exit_status_after_draining(self):
+        channel = FakeChannel([b'done\n'], exit_status=3)
+        remote = RemoteCommand(channel, 'exit 3', timeout=5)
+
+        chunks = remote.iter_chunks()
+        self.assertEqual(next(chunks), b'done\n')
+        self.assertIsNone(remote.exit_status)
+        self.assertEqual(list(chunks), [])
+        self.assertEqual(remote.exit_status, 3)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    BREAKER_FAILURE_THRESHOLD=3,
+    BREAKER_RESET_TIMEOUT=30,
+    BREAKER_MAX_RESET_TIMEOUT=600,
+)
+class CircuitBreakerTests(SimpleTestCase):
+    """Transiciones del circuito: abierto, medio abierto con un solo intento, cerrado o reabierto"""
+
+    def setUp(self):
+        self.station = Station(pk=1, name='edge', ip_address='10.0.0.1', ssh_user='docker', ssh_password='secret')
+        self.now = 1_000_000.0
+        patcher = mock.patch('stations.breaker.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(circuit_breaker.reset, self.station.pk)
+
+    def fail(self, times=1):
+        for _ in range(times):
+            circuit_breaker.record_failure(self.station, OSError('timed out'))
+
+    def test_opens_after_threshold(self):
+        self.fail(2)
+        self.assertEqual(circuit_breaker.state(self.station.pk)['state'], CLOSED)
+        circuit_breaker.before_connect(self.station)
+
+        self.fail()
+        self.assertEqual(circuit_breaker.state(self.station.pk)['state'], OPEN)
+        with self.assertRaises(StationUnreachable):
+            circuit_breaker.before_connect(self.station)
+
+    def test_open_circuit_fails_fast_without_connecting(self):
+        self.fail(3)
+        pool = SSHConnectionPool()
+        with mock.patch.object(pool, '_open') as open_connection:
+            with self.assertRaises(StationUnreachable):
+                pool.acquire(self.station)
+        open_connection.assert_not_called()
+
+    def test_half_open_allows_a_single_probe(self):
+        self.fail(3)
+        self.now += 30
+        self.assertEqual(circuit_breaker.state(self.station.pk)['state'], HALF_OPEN)
+
+        circuit_breaker.before_connect(self.station)
+        with self.assertRaises(StationUnreachable):
+            circuit_breaker.before_connect(self.station)
+
+    def test_failed_probe_reopens_with_double_wait(self):
+        self.fail(3)
+        self.now += 30
+        circuit_breaker.before_connect(self.station)
+        self.fail()
+
+        self.now += 59
+        self.assertEqual(circuit_breaker.state(self.station.pk)['state'], OPEN)
+        self.now += 1
+        self.assertEqual(circuit_breaker.state(self.station.pk)['state'], HALF_OPEN)
+        circuit_breaker.before_connect(self.station)
+
+    def test_successful_probe_closes(self):
+        self.fail(3)
+        self.now += 30
+        circuit_breaker.before_connect(self.station)
+        circuit_breaker.record_success(self.station.pk)
+
+        self.assertEqual(circuit_breaker.state(self.station.pk), {'state': CLOSED, 'failures': 0})
+        circuit_breaker.before_connect(self.station)
+        circuit_breaker.before_connect(self.station)
+
+    def test_credentials_change_resets(self):
+        self.fail(3)
+        self.station.ssh_password = 'rotated'
+        circuit_breaker.sync_credentials(self.station)
+
+        self.assertEqual(circuit_breaker.state(self.station.pk)['state'], CLOSED)
+        circuit_breaker.before_connect(self.station)
+
+    def test_manual_half_open(self):
+        self.fail(3)
+        circuit_breaker.half_open(self.station.pk)
+
+        self.assertEqual(circuit_breaker.state(self.station.pk)['state'], HALF_OPEN)
+        circuit_breaker.before_connect(self.station)
+        with self.assertRaises(StationUnreachable):
+            circuit_breaker.before_connect(self.station)
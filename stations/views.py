@@ -1,33 +1,112 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.db import transaction
+from django.db.models import Count, Q
 from .models import Station, Container, ContainerAction, ActivityLog
 from .serializers import (
     StationSerializer, ContainerSerializer, 
     ContainerActionSerializer, ActivityLogSerializer
 )
-from .services import DockerService
+from .services import DockerService, get_cached_stats, reconcile_containers
+from .logtail import fetch_container_logs, normalize_log_cursor
+from .metrics import query_metrics
+from .breaker import circuit_breaker
+from .pagination import CreatedAtCursorPagination
+from .sharding import shard_metrics
+from .ssh import connection_pool
+from .tasks import execute_bulk_action, execute_container_action
+import fnmatch
 import logging
 
 logger = logging.getLogger(__name__)
 
+def parse_time_param(value):
+    """Parsear una fecha ISO 8601 o un timestamp Unix de la query string"""
+    if not value:
+        return None
+    try:
+        timestamp = float(value)
+    except ValueError:
+        timestamp = None
+    if timestamp is not None:
+        try:
+            return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            raise ValueError(f'Fecha no válida: {value}')
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'Fecha no válida: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+def is_id(value) -> bool:
+    """Si ``value`` es un id entero de JSON (``True``/``False`` no cuentan)"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def unreachable_response(station):
+    """Respuesta inmediata si el circuito de la estación está abierto, o ``None``"""
+    breaker = circuit_breaker.state(station.pk)
+    if breaker['state'] != 'open':
+        return None
+    return Response({
+        'message': f'Estación inalcanzable desde {breaker["unreachable_since"]}',
+        'breaker': breaker,
+    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
 class StationViewSet(viewsets.ModelViewSet):
     serializer_class = StationSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Station.objects.filter(created_by=self.request.user)
+        queryset = Station.objects.filter(created_by=self.request.user).annotate(
+            container_total=Count('containers'),
+            running_total=Count('containers', filter=Q(containers__status='running'))
+        )
+        
+        fields = self._requested_fields()
+        if self.action in ('list', 'retrieve') and (fields is None or 'containers' in fields):
+            queryset = queryset.prefetch_related('containers')
+        return queryset
+    
+    def _requested_fields(self):
+        """Campos pedidos con ``?fields=`` (solo en lecturas) o ``None`` para todos"""
+        fields = self.request.query_params.get('fields')
+        if not fields or self.request.method != 'GET':
+            return None
+        return [field.strip() for field in fields.split(',') if field.strip()]
+    
+    def get_serializer(self, *args, **kwargs):
+        fields = self._requested_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
     
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
     
+    @action(detail=False, methods=['get'])
+    def pool_stats(self, request):
+        """Contadores del pool de conexiones SSH de este proceso"""
+        return Response(connection_pool.stats())
+    
+    @action(detail=False, methods=['get'])
+    def monitor_shards(self, request):
+        """Resumen del último barrido de cada shard de monitoreo"""
+        return Response(shard_metrics())
+    
     @action(detail=True, methods=['post'])
     def test_connection(self, request, pk=None):
-        """Probar conexión SSH con la estación"""
+        """Probar conexión SSH con la estación (con el circuito abierto, sirve de prueba manual)"""
         station = self.get_object()
+        circuit_breaker.half_open(station.pk)
         docker_service = DockerService(station)
         
         try:
@@ -47,7 +126,7 @@ class StationViewSet(viewsets.ModelViewSet):
                 return Response({'connected': True, 'message': 'Conexión exitosa'})
             else:
                 return Response(
-                    {'connected': False, 'message': 'No se pudo conectar'}, 
+                    {'connected': False, 'message': 'No se pudo conectar', 'breaker': circuit_breaker.state(station.pk)}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
         except Exception as e:
@@ -60,26 +139,17 @@ class StationViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def refresh_containers(self, request, pk=None):
         station = self.get_object()
+        unreachable = unreachable_response(station)
+        if unreachable is not None:
+            return unreachable
         docker_service = DockerService(station)
         
         try:
             containers_data = docker_service.get_containers()
             
             with transaction.atomic():
-                # Limpiar contenedores existentes
-                station.containers.all().delete()
-                
-                # Crear nuevos contenedores
-                for container_data in containers_data:
-                    Container.objects.create(
-                        station=station,
-                        name=container_data['name'],
-                        container_id=container_data['id'],
-                        image=container_data['image'],
-                        status=container_data['status'],
-                        ports=container_data['ports'],
-                        created_time=container_data.get('created', '')
-                    )
+                # Sincronizar conservando los contenedores que siguen existiendo
+                reconcile_containers(station, containers_data, user=request.user)
                 
                 station.is_connected = True
                 station.last_check = timezone.now()
@@ -118,25 +188,19 @@ class StationViewSet(viewsets.ModelViewSet):
     def stats(self, request, pk=None):
         """Obtener estadísticas en tiempo real de la estación"""
         station = self.get_object()
-        docker_service = DockerService(station)
+        unreachable = unreachable_response(station)
+        if unreachable is not None:
+            return unreachable
         
         try:
-            stats = docker_service.get_containers_stats()
+            snapshot = get_cached_stats(station)
             
-            # Actualizar estadísticas en la base de datos
-            for container_name, container_stats in stats.items():
-                try:
-                    container = station.containers.get(name=container_name)
-                    container.cpu_usage = container_stats.get('cpu_percent', 0)
-                    container.memory_usage = container_stats.get('memory_usage', 0)
-                    container.memory_limit = container_stats.get('memory_limit', 0)
-                    container.network_rx = container_stats.get('network_rx', 0)
-                    container.network_tx = container_stats.get('network_tx', 0)
-                    container.save()
-                except Container.DoesNotExist:
-                    continue
-            
-            return Response(stats)
+            return Response({
+                'data': snapshot['stats'],
+                'timestamp': snapshot['timestamp'],
+                'age': round(snapshot['age'], 3),
+                'stale': snapshot['stale'],
+            })
             
         except Exception as e:
             logger.error(f"Error getting stats for {station.ip_address}: {str(e)}")
@@ -164,7 +228,11 @@ class ContainerViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Crear registro de acción
+        unreachable = unreachable_response(container.station)
+        if unreachable is not None:
+            return unreachable
+        
+        # Crear registro de acción; se ejecuta en la cola de acciones de Celery
         container_action = ContainerAction.objects.create(
             container=container,
             action=action_type,
@@ -173,74 +241,169 @@ class ContainerViewSet(viewsets.ModelViewSet):
         )
         
         try:
-            docker_service = DockerService(container.station)
-            result = docker_service.execute_container_action(container.name, action_type)
-            
-            if result['success']:
-                container_action.status = 'success'
-                container_action.result_message = result['message']
-                
-                # Actualizar estado del contenedor
-                if action_type == 'start':
-                    container.status = 'running'
-                elif action_type == 'stop':
-                    container.status = 'stopped'
-                elif action_type == 'pause':
-                    container.status = 'paused'
-                elif action_type == 'remove':
-                    container.delete()
-                    container_action.save()
-                    return Response({'message': 'Contenedor eliminado exitosamente'})
-                
-                container.save()
-                
-                ActivityLog.objects.create(
-                    station=container.station,
-                    container=container,
-                    level='success',
-                    message=f'Acción {action_type} ejecutada en {container.name}',
-                    created_by=request.user
-                )
-                
-            else:
-                container_action.status = 'failed'
-                container_action.result_message = result['message']
-                
-                ActivityLog.objects.create(
-                    station=container.station,
-                    container=container,
-                    level='error',
-                    message=f'Error ejecutando {action_type} en {container.name}: {result["message"]}',
-                    created_by=request.user
-                )
-            
-            container_action.completed_at = timezone.now()
-            container_action.save()
-            
-            return Response({
-                'success': result['success'],
-                'message': result['message']
-            })
-            
+            execute_container_action.delay(container_action.id)
         except Exception as e:
             container_action.status = 'failed'
             container_action.result_message = str(e)
             container_action.completed_at = timezone.now()
             container_action.save()
             
-            logger.error(f"Error executing {action_type} on {container.name}: {str(e)}")
+            logger.error(f"Error queueing {action_type} on {container.name}: {str(e)}")
             return Response(
                 {'message': str(e)}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        return Response(
+            ContainerActionSerializer(container_action).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+    
+    @action(detail=False, methods=['post'])
+    def bulk_action(self, request):
+        """Ejecutar una acción sobre varios contenedores, agrupados por estación.
+
+        Los destinos se indican con ``containers`` (ids) o con ``selector``
+        (``station``, ``image`` y ``name`` con comodines ``*``/``?``).
+        ``parallelism`` limita las estaciones simultáneas y ``batch_size``
+        despliega por tandas de estaciones.
+        """
+        action_type = request.data.get('action')
+        if action_type not in ['start', 'stop', 'restart', 'pause', 'unpause', 'remove', 'rebuild']:
+            return Response(
+                {'message': 'Acción no válida'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            parallelism = int(request.data['parallelism']) if request.data.get('parallelism') else None
+            batch_size = int(request.data['batch_size']) if request.data.get('batch_size') else None
+        except (TypeError, ValueError):
+            return Response(
+                {'message': 'parallelism y batch_size deben ser enteros'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if (parallelism is not None and parallelism <= 0) or (batch_size is not None and batch_size <= 0):
+            return Response(
+                {'message': 'parallelism y batch_size deben ser positivos'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = self.get_queryset().select_related('station')
+        container_ids = request.data.get('containers')
+        selector = request.data.get('selector')
+        if container_ids not in (None, []):
+            if not isinstance(container_ids, list) or not all(map(is_id, container_ids)):
+                return Response(
+                    {'message': 'containers debe ser una lista de ids'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(pk__in=container_ids)
+            pattern = None
+        elif isinstance(selector, dict) and selector:
+            if 'station' in selector and not is_id(selector['station']):
+                return Response(
+                    {'message': 'selector.station debe ser un id'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if any(not isinstance(selector.get(key, ''), str) for key in ('image', 'name')):
+                return Response(
+                    {'message': 'selector.image y selector.name deben ser texto'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if 'station' in selector:
+                queryset = queryset.filter(station_id=selector['station'])
+            if selector.get('image'):
+                queryset = queryset.filter(image=selector['image'])
+            pattern = selector.get('name')
+        else:
+            return Response(
+                {'message': 'Indique containers o selector'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        targets = [
+            container for container in queryset.order_by('station_id', 'name')
+            if pattern is None or fnmatch.fnmatchcase(container.name, pattern)
+        ]
+        if not targets:
+            return Response(
+                {'message': 'Ningún contenedor coincide'}, 
+                status=status.HTTP_404_NOT_FOUND
             )
+        max_targets = getattr(settings, 'BULK_ACTION_MAX_TARGETS', 1000)
+        if len(targets) > max_targets:
+            return Response(
+                {'message': f'Demasiados contenedores ({len(targets)} > {max_targets})'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Una acción por contenedor; la tarea las ejecuta agrupadas por estación
+        container_actions = ContainerAction.objects.bulk_create([
+            ContainerAction(
+                container=container,
+                action=action_type,
+                status='pending',
+                executed_by=request.user
+            )
+            for container in targets
+        ])
+        
+        try:
+            execute_bulk_action.delay(
+                [container_action.id for container_action in container_actions],
+                parallelism=parallelism,
+                batch_size=batch_size
+            )
+        except Exception as e:
+            ContainerAction.objects.filter(pk__in=[container_action.pk for container_action in container_actions]).update(
+                status='failed', result_message=str(e), completed_at=timezone.now()
+            )
+            logger.error(f"Error queueing bulk {action_type}: {str(e)}")
+            return Response(
+                {'message': str(e)}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        return Response({
+            'action': action_type,
+            'stations': len({container.station_id for container in targets}),
+            'actions': ContainerActionSerializer(container_actions, many=True).data,
+        }, status=status.HTTP_202_ACCEPTED)
     
     @action(detail=True, methods=['get'])
     def logs(self, request, pk=None):
-        """Obtener logs del contenedor"""
+        """Obtener logs del contenedor (?lines=, ?since= cursor para leer solo lo nuevo)"""
         container = self.get_object()
-        lines = request.query_params.get('lines', 100)
+        max_lines = getattr(settings, 'LOGS_MAX_LINES', 5000)
+        try:
+            lines = int(request.query_params.get('lines', 100))
+            since = normalize_log_cursor(request.query_params.get('since'))
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= lines <= max_lines:
+            return Response(
+                {'message': f'lines debe estar entre 1 y {max_lines}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        unreachable = unreachable_response(container.station)
+        if unreachable is not None:
+            return unreachable
         
         try:
+            if since:
+                # Incremental: las primeras líneas posteriores al cursor; con
+                # ``truncated`` quedan más y se piden con el nuevo cursor
+                entries = fetch_container_logs(container, lines + 1, since=since, oldest=True)
+                truncated = len(entries) > lines
+                entries = entries[:lines]
+                return Response({
+                    'logs': '\n'.join(message for _, message in entries),
+                    'cursor': entries[-1][0] if entries else since,
+                    'truncated': truncated,
+                })
+            
             docker_service = DockerService(container.station)
             logs = docker_service.get_container_logs(container.name, lines)
             
@@ -253,9 +416,31 @@ class ContainerViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get'])
+    def metrics(self, request, pk=None):
+        """Serie temporal de estadísticas del contenedor (?from=&to=&step=)"""
+        container = self.get_object()
+        
+        try:
+            end = parse_time_param(request.query_params.get('to')) or timezone.now()
+            start = parse_time_param(request.query_params.get('from')) or end - timedelta(hours=1)
+            step = request.query_params.get('step')
+            step = int(step) if step else None
+        except (ValueError, OverflowError) as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if start >= end or (step is not None and step <= 0):
+            return Response(
+                {'message': 'Rango de tiempo no válido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(query_metrics(container, start, end, step))
+    
 class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = ActivityLogSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
     
     def get_queryset(self):
         queryset = ActivityLog.objects.filter(
@@ -272,4 +457,39 @@ class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
         if level:
             queryset = queryset.filter(level=level)
         
-        return queryset[:100]  # Limitar a 100 registros más recientes
\ No newline at end of file
+        # Rango temporal (?since=&until=, ISO 8601 o timestamp Unix)
+        try:
+            since = parse_time_param(self.request.query_params.get('since'))
+            until = parse_time_param(self.request.query_params.get('until'))
+        except ValueError as e:
+            raise ParseError(str(e))
+        
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        
+        if until:
+            queryset = queryset.filter(created_at__lt=until)
+        
+        return queryset
+
+
+class ContainerActionViewSet(viewsets.ReadOnlyModelViewSet):
+    """Estado de las acciones de contenedor lanzadas con ``execute_action``"""
+    serializer_class = ContainerActionSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        queryset = ContainerAction.objects.filter(
+            executed_by=self.request.user
+        ).select_related('container__station').order_by('-executed_at')
+        
+        container_id = self.request.query_params.get('container')
+        action_status = self.request.query_params.get('status')
+        
+        if container_id:
+            queryset = queryset.filter(container_id=container_id)
+        
+        if action_status:
+            queryset = queryset.filter(status=action_status)
+        
+        return queryset
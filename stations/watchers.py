@@ -0,0 +1,190 @@
+import json
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from .cache import mark_station_changed
+from .events import collect_events, container_payload, publish_event
+from .models import ActivityLog, Container
+from .services import DockerService, reconcile_containers
+from .ssh import connection_pool, iter_channel_lines
+from .workers import StationWorker, StationWorkerManager
+
+logger = logging.getLogger(__name__)
+
+# Estado del contenedor tras cada acción de ``docker events``
+EVENT_STATES = {
+    'start': 'running',
+    'unpause': 'running',
+    'pause': 'paused',
+    'die': 'exited',
+    'create': 'created',
+}
+
+# Acciones que cambian el inventario y requieren una reconciliación completa
+INVENTORY_ACTIONS = {'create', 'rename'}
+
+
+class DockerEventsWatcher(StationWorker):
+    """Suscriptor de ``docker events`` de larga duración para una estación.
+
+    Aplica los cambios de estado de los contenedores según llegan, en lugar
+    de volver a listar el inventario completo. Hace una reconciliación
+    completa al conectar (y al reconectar), tras altas o renombrados y cada
+    ``DOCKER_EVENTS_FULL_SYNC_INTERVAL`` segundos; entre sesiones reanuda con
+    ``--since`` desde el último evento visto, así que no pierde cambios.
+    """
+
+    COMMAND = "docker events --filter type=container --format '{{json .}}'"
+
+    def __init__(self, station):
+        super().__init__(station, name=f'docker-events-{station.pk}')
+        self.last_event = None  # timeNano del último evento aplicado
+        self.last_full_sync = None
+        self._session_end = threading.Event()
+        self._resync_timer = None
+
+    def stop(self):
+        super().stop()
+        self._session_end.set()
+
+    def finish(self):
+        connections.close_all()
+
+    def _command(self) -> str:
+        if self.last_event is None:
+            return self.COMMAND
+        seconds, nanos = divmod(self.last_event, 10 ** 9)
+        return f"{self.COMMAND} --since {seconds}.{nanos:09d}"
+
+    def request_resync(self, delay: float = 0):
+        """Terminar la sesión actual para reconciliar y reanudar desde el último evento"""
+        if not delay:
+            self._session_end.set()
+        elif self._resync_timer is None:
+            # Una sola reconciliación pendiente aunque lleguen muchos eventos
+            self._resync_timer = threading.Timer(delay, self._session_end.set)
+            self._resync_timer.daemon = True
+            self._resync_timer.start()
+
+    def session(self) -> int:
+        """Una sesión de ``docker events``; devuelve el número de eventos recibidos"""
+        events = 0
+        if self._resync_timer is not None:
+            self._resync_timer.cancel()
+            self._resync_timer = None
+        self._session_end.clear()
+        if self.stopped:
+            return events
+        interval = getattr(settings, 'DOCKER_EVENTS_FULL_SYNC_INTERVAL', 900)
+        timer = threading.Timer(interval, self._session_end.set)
+        timer.daemon = True
+
+        client = connection_pool.acquire(self.station)
+        try:
+            channel = client.get_transport().open_session()
+            channel.settimeout(1.0)
+            channel.exec_command(self._command())
+
+            # Suscrito antes de reconciliar: lo que cambie mientras tanto llega como evento
+            self.full_sync()
+            timer.start()
+            for line in iter_channel_lines(channel, self._session_end):
+                if not line.startswith('{'):
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                events += 1
+                self.apply(event)
+        finally:
+            timer.cancel()
+            connection_pool.release(client)
+        return events
+
+    def full_sync(self):
+        """Reconciliación completa del inventario (respaldo de los eventos)"""
+        containers = DockerService(self.station).get_containers()
+        with collect_events():
+            reconcile_containers(self.station, containers)
+        self.last_full_sync = time.monotonic()
+
+    def apply(self, event):
+        """Aplicar un evento de contenedor a la tabla ``Container``"""
+        action = (event.get('Action') or event.get('status') or '').split(':')[0]
+        attributes = (event.get('Actor') or {}).get('Attributes') or {}
+        name = attributes.get('name')
+        event_time = event.get('timeNano')
+        if event_time is not None:
+            self.last_event = max(self.last_event or 0, event_time)
+        if not name:
+            return
+
+        if action in INVENTORY_ACTIONS:
+            # Agrupar ráfagas (p. ej. docker-compose up) en una sola reconciliación
+            self.request_resync(delay=getattr(settings, 'DOCKER_EVENTS_RESYNC_DELAY', 2))
+            return
+
+        with collect_events():
+            if action == 'destroy':
+                container = Container.objects.filter(station=self.station, name=name).first()
+                if container is not None:
+                    removed = container_payload(container, 'removed')
+                    container.delete()
+                    publish_event(self.station.pk, 'containers', [removed])
+                    self._log(None, 'warning', f'Contenedor eliminado: {name}')
+                return
+
+            if action == 'oom':
+                container = Container.objects.filter(station=self.station, name=name).first()
+                self._log(container, 'error', f'Contenedor {name} sin memoria (OOM)')
+                return
+
+            status = EVENT_STATES.get(action)
+            if status is None:
+                return
+            container = Container.objects.filter(station=self.station, name=name).first()
+            if container is None:
+                self.request_resync(delay=getattr(settings, 'DOCKER_EVENTS_RESYNC_DELAY', 2))
+                return
+            if container.status == status:
+                return
+
+            container.status = status
+            container.last_updated = timezone.now()
+            container.save(update_fields=['status', 'last_updated'])
+
+            if action == 'die':
+                exit_code = attributes.get('exitCode', '0')
+                if exit_code != '0':
+                    self._log(container, 'warning', f'Contenedor {name} se detuvo con código {exit_code}')
+                else:
+                    self._log(container, 'info', f'Contenedor {name} detenido')
+            elif action == 'start':
+                self._log(container, 'info', f'Contenedor {name} iniciado')
+            elif action in ('pause', 'unpause'):
+                self._log(container, 'info', f'Contenedor {name} {"pausado" if action == "pause" else "reanudado"}')
+
+    def _log(self, container, level, message):
+        mark_station_changed(self.station.pk, getattr(settings, 'MONITOR_RECENT_CHANGE_WINDOW', 300))
+        ActivityLog.objects.create(station=self.station, container=container, level=level, message=message)
+
+
+class EventsWatcherManager(StationWorkerManager):
+    """Watchers de ``docker events`` activos en este proceso, uno por estación"""
+
+    worker_class = DockerEventsWatcher
+
+    def synced(self):
+        """Estaciones cuyo watcher está vivo y ya hizo su reconciliación inicial"""
+        with self._lock:
+            return [
+                station_id for station_id, watcher in self._workers.items()
+                if watcher.is_alive() and watcher.last_full_sync is not None
+            ]
+
+
+event_watchers = EventsWatcherManager()
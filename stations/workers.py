@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from typing import Dict
+from django.conf import settings
+from .ssh import credentials_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+class StationWorker(threading.Thread):
+    """Hilo de larga duración que repite una sesión remota con una estación.
+
+    ``run`` llama a ``session()`` hasta que se detiene o ``should_stop()``
+    devuelve ``True``, esperando entre sesiones con backoff exponencial. La
+    espera solo vuelve a un segundo tras una sesión productiva (``session``
+    devuelve un valor verdadero) o que duró al menos
+    ``SSH_STREAM_MIN_SESSION`` segundos: un comando que termina al instante
+    no se relanza en bucle.
+    """
+
+    MAX_BACKOFF = 60
+
+    def __init__(self, station, name: str):
+        super().__init__(name=name, daemon=True)
+        self.station = station
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def touch(self):
+        """Marcar el hilo como en uso (lo llama el gestor en cada ``ensure``)"""
+
+    def should_stop(self) -> bool:
+        return False
+
+    def session(self):
+        """Una sesión remota; devuelve un valor verdadero si produjo datos"""
+        raise NotImplementedError
+
+    def finish(self):
+        """Liberar recursos al terminar el hilo"""
+
+    def run(self):
+        backoff = 1
+        min_session = getattr(settings, 'SSH_STREAM_MIN_SESSION', 10)
+        try:
+            while not self.stopped and not self.should_stop():
+                started = time.monotonic()
+                productive = False
+                try:
+                    productive = self.session()
+                except Exception as e:
+                    logger.warning(f"{self.name} failed: {str(e)}")
+                if productive or time.monotonic() - started >= min_session:
+                    backoff = 1
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+        finally:
+            self.finish()
+            self._stop_event.set()
+
+
+class StationWorkerManager:
+    """Hilos ``worker_class`` activos en este proceso, uno por objeto (estación o contenedor).
+
+    Si cambian las credenciales de la estación se sustituye el hilo para que
+    no siga usando las antiguas.
+    """
+
+    worker_class = StationWorker
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers: Dict[int, StationWorker] = {}
+
+    @staticmethod
+    def station_of(target):
+        return target
+
+    def ensure(self, target) -> StationWorker:
+        """Arrancar (o mantener vivo) el hilo del objeto"""
+        with self._lock:
+            worker = self._workers.get(target.pk)
+            if worker is not None and (
+                credentials_fingerprint(worker.station) != credentials_fingerprint(self.station_of(target))
+            ):
+                worker.stop()
+                worker = None
+            if worker is None or worker.stopped or not worker.is_alive():
+                worker = self.worker_class(target)
+                self._workers[target.pk] = worker
+                worker.start()
+            worker.touch()
+            return worker
+
+    def stop(self, key):
+        with self._lock:
+            worker = self._workers.pop(key, None)
+        if worker is not None:
+            worker.stop()
+
+    def stop_all(self):
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+    def active(self):
+        """Claves con un hilo vivo"""
+        with self._lock:
+            return [key for key, worker in self._workers.items() if worker.is_alive()]